@@ -47,6 +47,63 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
 }
 
+# Home timeline: authors with at least this many followers are not fanned out
+# on write; their recent posts are merged into readers' timelines at read time.
+TIMELINE_FAN_OUT_THRESHOLD = int(os.getenv('TIMELINE_FAN_OUT_THRESHOLD', '10000'))
+# Seconds a high-follower author's recent posts stay cached per worker
+TIMELINE_AUTHOR_CACHE_TIMEOUT = int(os.getenv('TIMELINE_AUTHOR_CACHE_TIMEOUT', '60'))
+
+# Post views are buffered per worker and written at most this many seconds late
+VIEW_COUNT_FLUSH_INTERVAL = float(os.getenv('VIEW_COUNT_FLUSH_INTERVAL', '5'))
+
+# Shards per hot counter (likes/comments/shares); more shards, less row contention
+COUNTER_SHARDS = int(os.getenv('COUNTER_SHARDS', '8'))
+
+# User autocomplete index (per worker): seconds between picking up new users
+# created elsewhere, and between full rebuilds that also catch renames
+USER_INDEX_REFRESH_INTERVAL = int(os.getenv('USER_INDEX_REFRESH_INTERVAL', '30'))
+USER_INDEX_REBUILD_INTERVAL = int(os.getenv('USER_INDEX_REBUILD_INTERVAL', '3600'))
+
+# Seconds a worker serves its cached category catalog before checking for changes
+CATEGORY_CATALOG_CHECK_INTERVAL = float(os.getenv('CATEGORY_CATALOG_CHECK_INTERVAL', '5'))
+
+# Unread likes/comments/shares/follows on the same target within a window of
+# this many seconds are merged into a single notification
+NOTIFICATION_GROUP_WINDOW = int(os.getenv('NOTIFICATION_GROUP_WINDOW', '86400'))
+
+# Notifications are partitioned by month: older than the hot months they are
+# marked read, and older than the retention period their partitions are
+# detached (manage.py maintain_notifications)
+NOTIFICATION_HOT_MONTHS = int(os.getenv('NOTIFICATION_HOT_MONTHS', '2'))
+NOTIFICATION_RETENTION_MONTHS = int(os.getenv('NOTIFICATION_RETENTION_MONTHS', '12'))
+
+# Background jobs (manage.py run_workers): attempts before a job is marked
+# failed, base seconds of exponential retry backoff, and seconds after which
+# a job still marked running is assumed lost and handed to another worker
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '5'))
+JOB_RETRY_BACKOFF = float(os.getenv('JOB_RETRY_BACKOFF', '10'))
+JOB_LOCK_TIMEOUT = int(os.getenv('JOB_LOCK_TIMEOUT', '300'))
+
+# Live notification streams (/api/notifications/stream/): seconds between
+# heartbeats on an idle stream, open streams allowed per worker process, and
+# seconds a stream ticket can be used to open (or reopen) a stream
+NOTIFICATION_STREAM_HEARTBEAT = float(os.getenv('NOTIFICATION_STREAM_HEARTBEAT', '15'))
+NOTIFICATION_STREAM_MAX_CLIENTS = int(os.getenv('NOTIFICATION_STREAM_MAX_CLIENTS', '5000'))
+NOTIFICATION_STREAM_TICKET_TTL = int(os.getenv('NOTIFICATION_STREAM_TICKET_TTL', '60'))
+
+# Threads per worker process that check and store the images of one upload
+UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', '4'))
+
+# Seconds an unreferenced stored image is kept before manage.py collect_media deletes it
+MEDIA_GC_GRACE = int(os.getenv('MEDIA_GC_GRACE', '86400'))
+
+# Resumable chunked uploads (/api/uploads/): directory for partial files
+# (shared by all web workers), largest file accepted in bytes, and seconds
+# before an unfinished upload is discarded
+CHUNKED_UPLOAD_DIR = os.getenv('CHUNKED_UPLOAD_DIR', str(BASE_DIR / 'upload_parts'))
+CHUNKED_UPLOAD_MAX_SIZE = int(os.getenv('CHUNKED_UPLOAD_MAX_SIZE', str(50 * 1024 * 1024)))
+CHUNKED_UPLOAD_EXPIRY = int(os.getenv('CHUNKED_UPLOAD_EXPIRY', '86400'))
+
 
 # Application definition
 
@@ -57,6 +114,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'news',
     'rest_framework',
     'rest_framework_simplejwt',
@@ -156,6 +214,9 @@ if not DEBUG:
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Stream every upload to a temporary file instead of holding small ones in memory
+FILE_UPLOAD_HANDLERS = ['django.core.files.uploadhandler.TemporaryFileUploadHandler']
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -183,6 +244,7 @@ CORS_ALLOW_HEADERS = [
     'accept-encoding',
     'authorization',
     'content-type',
+    'content-range',
     'dnt',
     'origin',
     'user-agent',
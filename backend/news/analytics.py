@@ -0,0 +1,89 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import Case, Count, F, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Comment, Like, Post, PostDailyStats, Share
+
+METRICS = ['views', 'likes', 'comments', 'shares']
+
+# Event tables rolled up into PostDailyStats, by metric
+EVENT_SOURCES = {
+    'likes': Like,
+    'comments': Comment,
+    'shares': Share,
+}
+
+
+def add_to_daily_stats(deltas, chunk_size=2000):
+    """
+    Add {(post_id, day): {metric: n}} to PostDailyStats. Missing rows are
+    inserted empty first, then each metric is added with one UPDATE per
+    chunk, so concurrent writers never overwrite each other.
+    """
+    keys = list(deltas)
+    for start in range(0, len(keys), chunk_size):
+        chunk = keys[start:start + chunk_size]
+        authors = dict(
+            Post.objects.filter(pk__in={post_id for post_id, _ in chunk}).values_list('pk', 'author_id')
+        )
+        # Posts deleted since the events happened are skipped
+        chunk = [(post_id, day) for post_id, day in chunk if post_id in authors]
+        PostDailyStats.objects.bulk_create(
+            [PostDailyStats(post_id=post_id, author_id=authors[post_id], day=day) for post_id, day in chunk],
+            ignore_conflicts=True,
+        )
+
+        rows = PostDailyStats.objects.filter(
+            post_id__in={post_id for post_id, _ in chunk}, day__in={day for _, day in chunk}
+        )
+        for metric in METRICS:
+            whens = [
+                When(post_id=post_id, day=day, then=Value(deltas[(post_id, day)][metric]))
+                for post_id, day in chunk if deltas[(post_id, day)].get(metric)
+            ]
+            if whens:
+                rows.update(**{metric: F(metric) + Case(*whens, default=Value(0))})
+
+
+def rollup_events(since, until):
+    """Count likes/comments/shares created in [since, until) per post and day"""
+    deltas = defaultdict(lambda: defaultdict(int))
+    for metric, model in EVENT_SOURCES.items():
+        events = model.objects.filter(created_at__lt=until)
+        if since is not None:
+            events = events.filter(created_at__gte=since)
+        rows = events.annotate(day=TruncDate('created_at')).order_by().values('post_id', 'day').annotate(
+            total=Count('id')
+        )
+        for row in rows.iterator(chunk_size=5000):
+            deltas[(row['post_id'], row['day'])][metric] += row['total']
+    return deltas
+
+
+def record_views(views_by_post):
+    """Add flushed view counts to today's row for each post"""
+    today = timezone.localdate()
+    add_to_daily_stats({(post_id, today): {'views': count} for post_id, count in views_by_post.items()})
+
+
+def author_series(author, start, end, post_id=None):
+    """
+    Per-day totals across the author's posts for start..end inclusive, as
+    parallel arrays ready for charting. Days without activity are zero.
+    """
+    rows = PostDailyStats.objects.filter(author=author, day__range=(start, end))
+    if post_id is not None:
+        rows = rows.filter(post_id=post_id)
+    totals = {
+        row['day']: row
+        for row in rows.order_by().values('day').annotate(**{metric: Sum(metric) for metric in METRICS})
+    }
+
+    days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    series = {'days': days}
+    for metric in METRICS:
+        series[metric] = [totals[day][metric] if day in totals else 0 for day in days]
+    return series
@@ -7,3 +7,6 @@ class NewsConfig(AppConfig):
     
     def ready(self):
         import news.signals
+        # Registers background tasks with news.jobs
+        import news.notifications
+        import news.images
@@ -0,0 +1,223 @@
+"""
+Async versions of the hottest read endpoints, for the uvicorn workers.
+
+Each view answers the GETs it fully understands on the event loop: the JWT
+is checked in place, the user and page are read through Django's async ORM
+and the response is rendered without ever holding a worker thread. Any
+other method, or a query it does not handle (search, ordering, the
+browsable API), goes to the DRF viewset in a thread, exactly as before.
+
+Django's async ORM still runs each query on a thread under the hood, so
+this saves the thread a request would otherwise hold for its whole life,
+not the queries themselves.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from . import http_cache, notifications, view_counter
+from .catalog import category_catalog
+from .models import Category, Notification, Post, UserStats
+from .pagination import NotificationCursorPagination, PostCursorPagination
+from .serializers import NotificationSerializer
+from .viewer import ViewerContext
+from .views import CategoryViewSet, NotificationViewSet, PostViewSet
+
+# Query parameters the async post views understand; anything else goes to DRF
+POST_LIST_PARAMS = {'cursor', 'page_size', 'fields', 'expand', 'category', 'author', 'visibility'}
+POST_DETAIL_PARAMS = {'fields', 'expand'}
+
+
+async def authenticate(request):
+    """
+    The user a Bearer token belongs to, or None wherever JWTAuthentication
+    would reject the request (which the DRF view then does, with its usual
+    response)
+    """
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    raw_token = auth.get_raw_token(header) if header else None
+    if not raw_token:
+        return None
+    try:
+        token = auth.get_validated_token(raw_token)
+        user_id = token[api_settings.USER_ID_CLAIM]
+    except (InvalidToken, KeyError):
+        return None
+
+    user = await User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).afirst()
+    if user is None or (api_settings.CHECK_USER_IS_ACTIVE and not user.is_active):
+        return None
+    if api_settings.CHECK_REVOKE_TOKEN and (
+        token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password)
+    ):
+        return None
+    return user
+
+
+def async_reads(fallback):
+    """
+    Serve GETs with the decorated handler, which returns None for requests
+    it leaves to `fallback`, the DRF view. A handler raising a DRF error
+    (e.g. an invalid cursor) also falls back, so DRF renders the error.
+    """
+    fallback = sync_to_async(fallback)
+
+    def decorator(handler):
+        @csrf_exempt
+        @wraps(handler)
+        async def view(request, *args, **kwargs):
+            # The browsable API is only rendered by DRF
+            if request.method == 'GET' and 'text/html' not in request.headers.get('Accept', ''):
+                user = await authenticate(request)
+                if user is not None:
+                    api_request = Request(request)
+                    api_request.user = user
+                    try:
+                        response = await handler(api_request, *args, **kwargs)
+                    except APIException:
+                        response = None
+                    if response is not None:
+                        return response
+            return await fallback(request, *args, **kwargs)
+        return view
+    return decorator
+
+
+def render(data, status=200):
+    response = HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+    # As DRF's own responses, which are negotiated on Accept
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+def not_modified(request, etag):
+    response = http_cache.not_modified(request, etag)
+    if response is not None:
+        patch_vary_headers(response, ['Accept'])
+    return response
+
+
+def post_view(request, action, **kwargs):
+    """A PostViewSet for its field selection and queryset, never dispatched"""
+    return PostViewSet(request=request, action=action, format_kwarg=None, args=(), kwargs=kwargs)
+
+
+async def post_filters(params):
+    """
+    The ?category=, ?author= and ?visibility= filters as queryset lookups,
+    or None if a value is one DRF would reject with a 400
+    """
+    lookups = {}
+    for name, model in (('category', Category), ('author', User)):
+        value = params.get(name)
+        if not value:
+            continue
+        if not value.isdigit() or not await model.objects.filter(pk=value).aexists():
+            return None
+        lookups[f'{name}_id'] = int(value)
+    visibility = params.get('visibility')
+    if visibility:
+        if visibility not in dict(Post.VISIBILITY_CHOICES):
+            return None
+        lookups['visibility'] = visibility
+    return lookups
+
+
+@async_reads(PostViewSet.as_view({'get': 'list', 'post': 'create'}, basename='post', detail=False))
+async def post_list(request):
+    if set(request.query_params) - POST_LIST_PARAMS:
+        return None
+    lookups = await post_filters(request.query_params)
+    if lookups is None:
+        return None
+
+    view = post_view(request, 'list')
+    field_names = view.get_field_names()
+    paginator = PostCursorPagination()
+    posts = await paginator.apaginate_queryset(view.get_queryset().filter(**lookups), request, view)
+    viewer = await ViewerContext.afor_posts(
+        request.user, posts, include_posts='is_liked' in field_names, include_comments='comments' in field_names
+    )
+    serializer = view.get_serializer_class()(
+        posts, many=True, fields=field_names, context={'request': request, 'view': view, 'viewer': viewer}
+    )
+    return render(paginator.get_paginated_data(serializer.data))
+
+
+@async_reads(PostViewSet.as_view(
+    {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'},
+    basename='post', detail=True,
+))
+async def post_detail(request, pk):
+    if set(request.query_params) - POST_DETAIL_PARAMS:
+        return None
+    etag = await http_cache.apost_etag(request.user, pk)
+    if etag is None:
+        return render({'detail': 'No Post matches the given query.'}, status=404)
+    # Count the view before a 304 can answer it; it is written on the next flush
+    view_counter.record_view(pk)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+
+    view = post_view(request, 'retrieve', pk=pk)
+    field_names = view.get_field_names()
+    post = await view.get_queryset().filter(pk=pk).afirst()
+    if post is None:
+        # Unpublished or deleted since the ETag was read
+        return render({'detail': 'No Post matches the given query.'}, status=404)
+    viewer = await ViewerContext.afor_posts(
+        request.user, [post], include_posts='is_liked' in field_names, include_comments='comments' in field_names
+    )
+    serializer = view.get_serializer_class()(
+        post, fields=field_names, context={'request': request, 'view': view, 'viewer': viewer}
+    )
+    return http_cache.revalidated(render(serializer.data), etag)
+
+
+@async_reads(NotificationViewSet.as_view({'get': 'list'}, basename='notification', detail=False))
+async def notification_list(request):
+    if set(request.query_params) - {'cursor', 'page_size'}:
+        return None
+    etag = await http_cache.anotification_etag(request.user)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+
+    queryset = Notification.objects.filter(recipient=request.user).select_related('sender__profile', 'post')
+    paginator = NotificationCursorPagination()
+    page = await paginator.apaginate_queryset(queryset, request)
+    serializer = NotificationSerializer(
+        page, many=True, context={'request': request, 'actors': await notifications.aresolve_actors(page)}
+    )
+    return http_cache.revalidated(render(paginator.get_paginated_data(serializer.data)), etag)
+
+
+@async_reads(NotificationViewSet.as_view({'get': 'unread_count'}, basename='notification', detail=False))
+async def unread_count(request):
+    unread = UserStats.objects.filter(pk=request.user.pk).values_list('unread_notifications', flat=True)
+    return render({'count': await unread.afirst() or 0})
+
+
+@async_reads(CategoryViewSet.as_view({'get': 'list'}, basename='category', detail=False))
+async def category_list(request):
+    if request.query_params:
+        return None
+    categories = await category_catalog.aall()
+    etag = category_catalog.etag()
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    return http_cache.revalidated(render(categories), etag)
@@ -0,0 +1,141 @@
+"""
+Category catalog, cached per worker.
+
+Categories change rarely but are listed on almost every page, so each
+worker keeps the serialized catalog in memory along with the version it was
+built from. Any change bumps the shared version row; workers compare
+versions at most every CATEGORY_CATALOG_CHECK_INTERVAL seconds, so a
+steady-state read costs no queries.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import F
+
+from .http_cache import bump_version, get_version, make_etag, version_query
+from .models import Category, Post
+
+VERSION_KEY = 'categories'
+
+
+class CategoryCatalog:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._categories = []
+        self._by_id = {}
+        self._checked_at = None
+
+    def _load(self):
+        self._store(get_version(VERSION_KEY), list(Category.objects.order_by('id')))
+
+    async def _aload(self):
+        version = await version_query(VERSION_KEY).afirst() or 0
+        self._store(version, [category async for category in Category.objects.order_by('id')])
+
+    def _store(self, version, categories):
+        from .serializers import CategorySerializer
+
+        categories = CategorySerializer(categories, many=True).data
+        with self._lock:
+            self._version = version
+            self._categories = categories
+            self._by_id = {category['id']: category for category in categories}
+            self._checked_at = time.monotonic()
+
+    def ensure_fresh(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < settings.CATEGORY_CATALOG_CHECK_INTERVAL:
+            return
+        if self._version is not None and get_version(VERSION_KEY) == self._version:
+            self._checked_at = now
+            return
+        self._load()
+
+    async def aensure_fresh(self):
+        """ensure_fresh() through the async ORM"""
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < settings.CATEGORY_CATALOG_CHECK_INTERVAL:
+            return
+        if self._version is not None and (await version_query(VERSION_KEY).afirst() or 0) == self._version:
+            self._checked_at = now
+            return
+        await self._aload()
+
+    def etag(self, category_id=None):
+        """ETag of the catalog as last loaded or checked"""
+        return make_etag(VERSION_KEY, category_id, self._version)
+
+    def all(self):
+        self.ensure_fresh()
+        return self._categories
+
+    async def aall(self):
+        await self.aensure_fresh()
+        return self._categories
+
+    def get(self, category_id):
+        self.ensure_fresh()
+        return self._by_id.get(category_id)
+
+    def invalidate(self):
+        """Bump the shared version and drop this worker's copy"""
+        bump_version(VERSION_KEY)
+        with self._lock:
+            self._checked_at = None
+
+
+category_catalog = CategoryCatalog()
+
+
+def category_etag(request, *args, **kwargs):
+    category_catalog.ensure_fresh()
+    return category_catalog.etag(kwargs.get('pk'))
+
+
+def _adjust(category_id, delta):
+    if category_id is not None:
+        Category.objects.filter(pk=category_id).update(published_posts_count=F('published_posts_count') + delta)
+
+
+def post_saving(post, update_fields=None):
+    """
+    Before a save of a post loaded without the fields post_saved() tracks,
+    read what the stored row counts towards
+    """
+    if post._state.adding or hasattr(post, '_counted_category_id'):
+        return
+    if update_fields is not None and not {'category', 'category_id', 'is_published'} & set(update_fields):
+        return
+    row = Post.objects.filter(pk=post.pk).values_list('category_id', 'is_published').first()
+    if row is not None:
+        category_id, is_published = row
+        post._counted_category_id = category_id if is_published else None
+
+
+def post_saved(post, created):
+    """Move the post's contribution to published_posts_count if it changed"""
+    if created:
+        old = None
+    elif hasattr(post, '_counted_category_id'):
+        old = post._counted_category_id
+    else:
+        # A save that left category and is_published alone
+        return
+
+    new = post.category_id if post.is_published else None
+    post._counted_category_id = new
+    if old == new:
+        return
+    _adjust(old, -1)
+    _adjust(new, 1)
+    category_catalog.invalidate()
+
+
+def post_deleted(post):
+    counted = getattr(post, '_counted_category_id', post.category_id if post.is_published else None)
+    if counted is not None:
+        _adjust(counted, -1)
+        category_catalog.invalidate()
+
@@ -0,0 +1,156 @@
+"""
+Resumable chunked uploads for large images.
+
+A client creates a session with the file's name and size, PUTs byte ranges
+(Content-Range: bytes <start>-<end>/<size>) in order, and finishes the
+session. Each chunk is copied from the request body onto the end of a part
+file in CHUNKED_UPLOAD_DIR, so a failed upload resumes from the session's
+offset instead of from zero. Under the ASGI server the request body is
+received before a worker thread is involved, so slow clients cost no
+threads, and only one chunk at a time is ever in flight per request.
+
+A finished upload is moved into content-addressed storage and can be
+attached to a post or profile by the session id.
+"""
+import os
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from .models import UploadSession
+from .storage import content_storage
+from .uploads import check_image
+
+# Largest byte range accepted in one PUT
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Bytes copied from the request body to disk at a time
+COPY_BUFFER = 256 * 1024
+
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+class OffsetMismatch(Exception):
+    """A chunk that does not start where the session left off"""
+
+    def __init__(self, offset):
+        super().__init__(f'Expected a chunk starting at byte {offset}')
+        self.offset = offset
+
+
+class PartFile(File):
+    """A finished part file; storage moves it into place rather than copying it"""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def part_path(session):
+    return os.path.join(settings.CHUNKED_UPLOAD_DIR, f'{session.pk}.part')
+
+
+def start(user, filename, size):
+    if size > settings.CHUNKED_UPLOAD_MAX_SIZE:
+        raise serializers.ValidationError(
+            {'size': f'Uploads are limited to {settings.CHUNKED_UPLOAD_MAX_SIZE} bytes.'}
+        )
+    return UploadSession.objects.create(
+        user=user,
+        filename=os.path.basename(filename)[:255],
+        size=size,
+        expires_at=timezone.now() + timedelta(seconds=settings.CHUNKED_UPLOAD_EXPIRY),
+    )
+
+
+def parse_content_range(header):
+    """(start, end, total) from a Content-Range header, end exclusive, or None"""
+    match = CONTENT_RANGE.match(header or '')
+    if not match:
+        return None
+    first, last, total = (int(group) for group in match.groups())
+    if last < first:
+        return None
+    return first, last + 1, total
+
+
+def append(session, first, end, total, body):
+    """
+    Write bytes first..end of the file from the request body stream and
+    return the session's new offset.
+
+    The session row is locked while writing, so concurrent retries of the
+    same chunk cannot interleave. Anything past the recorded offset (left by
+    a request that died mid-write) is cut off before appending.
+    """
+    length = end - first
+    if total != session.size or end > session.size or length > MAX_CHUNK_SIZE:
+        raise serializers.ValidationError('Content-Range does not fit this upload.')
+
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session.pk)
+        if session.status != UploadSession.PENDING:
+            raise serializers.ValidationError('This upload is already complete.')
+        if first != session.offset:
+            raise OffsetMismatch(session.offset)
+
+        os.makedirs(settings.CHUNKED_UPLOAD_DIR, exist_ok=True)
+        with open(part_path(session), 'ab') as part:
+            part.truncate(session.offset)
+            written = copy(body, part, length)
+        if written != length:
+            raise serializers.ValidationError(f'Expected {length} bytes, received {written}.')
+
+        session.offset = end
+        session.save(update_fields=['offset'])
+    return session.offset
+
+
+def copy(source, destination, length):
+    """Copy up to length bytes in COPY_BUFFER pieces; returns the bytes copied"""
+    copied = 0
+    while copied < length:
+        data = source.read(min(COPY_BUFFER, length - copied))
+        if not data:
+            break
+        destination.write(data)
+        copied += len(data)
+    return copied
+
+
+def finish(session):
+    """Check the completed file is an image and move it into storage"""
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session.pk)
+        if session.status == UploadSession.COMPLETE:
+            return session
+        if session.offset != session.size:
+            raise OffsetMismatch(session.offset)
+
+        path = part_path(session)
+        with PartFile(open(path, 'rb'), name=session.filename) as part:
+            check_image(part)
+            session.name = content_storage.save(session.filename, part)
+        if os.path.exists(path):
+            # The same bytes were already stored, so nothing was moved
+            os.remove(path)
+        session.status = UploadSession.COMPLETE
+        session.save(update_fields=['name', 'status'])
+    return session
+
+
+def expire(now=None):
+    """Delete expired sessions and their part files; returns how many"""
+    expired = UploadSession.objects.filter(expires_at__lt=now or timezone.now())
+    count = 0
+    for session in expired.iterator():
+        path = part_path(session)
+        if os.path.exists(path):
+            os.remove(path)
+        count += 1
+    expired.delete()
+    return count
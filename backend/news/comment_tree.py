@@ -0,0 +1,105 @@
+from django.db.models import Q
+
+from .models import Comment
+
+# How many reply levels are rendered below a comment before clients
+# have to ask for more, and how many replies are shown per comment.
+MAX_DEPTH = 3
+MAX_REPLIES = 10
+
+PATH_SEPARATOR = '/'
+
+
+def path_segment(comment_id):
+    """Zero-padded so that ordering by path is a depth-first walk"""
+    return f'{comment_id:010d}'
+
+
+def build_tree(nodes, roots, max_depth=MAX_DEPTH, max_replies=MAX_REPLIES):
+    """
+    Assemble comments loaded in one query into a tree under `roots`.
+
+    Each rendered comment gets `tree_replies` (newest first, capped at
+    max_replies), `more_replies` (how many replies were left out) and
+    `replies_cursor` (where the next page of replies starts, if any).
+    """
+    children = {}
+    for node in nodes:
+        children.setdefault(node.parent_id, []).append(node)
+
+    stack = [(root, 0) for root in roots]
+    while stack:
+        comment, level = stack.pop()
+        replies = sorted(
+            children.get(comment.pk, []),
+            key=lambda reply: (reply.created_at, reply.pk),
+            reverse=True,
+        )
+        if level >= max_depth:
+            comment.tree_replies = []
+            comment.more_replies = len(replies)
+            comment.replies_cursor = None
+            continue
+
+        shown = replies[:max_replies]
+        comment.tree_replies = shown
+        comment.more_replies = len(replies) - len(shown)
+        comment.replies_cursor = str(shown[-1].pk) if comment.more_replies else None
+        stack.extend((reply, level + 1) for reply in shown)
+    return roots
+
+
+def tree_queryset():
+    return Comment.objects.select_related('author__profile').order_by('path')
+
+
+def load_post_tree(post_id, max_depth=MAX_DEPTH, max_replies=MAX_REPLIES):
+    """Load a post's comment tree, down to max_depth, in one query"""
+    nodes = list(tree_queryset().filter(post_id=post_id, depth__lte=max_depth + 1))
+    return tree_from_nodes(nodes, max_depth, max_replies)
+
+
+def tree_from_nodes(nodes, max_depth=MAX_DEPTH, max_replies=MAX_REPLIES):
+    """Build a post's tree from nodes already loaded (e.g. prefetched)"""
+    roots = sorted(
+        (node for node in nodes if node.parent_id is None),
+        key=lambda root: (root.created_at, root.pk),
+        reverse=True,
+    )
+    return build_tree(nodes, roots, max_depth, max_replies)
+
+
+def load_replies(comments, max_depth=MAX_DEPTH, max_replies=MAX_REPLIES):
+    """Attach reply trees to already loaded comments with one query"""
+    comments = list(comments)
+    pending = [comment for comment in comments if not hasattr(comment, 'tree_replies')]
+    if not pending:
+        return comments
+
+    condition = Q()
+    for comment in pending:
+        condition |= Q(
+            path__startswith=comment.path + PATH_SEPARATOR,
+            depth__lte=comment.depth + max_depth + 1,
+        )
+    nodes = list(tree_queryset().filter(condition))
+    build_tree(nodes, pending, max_depth, max_replies)
+    return comments
+
+
+def load_reply_page(comment, before=None, limit=MAX_REPLIES, max_depth=MAX_DEPTH):
+    """
+    One page of a comment's direct replies, each with its own subtree.
+
+    The page is read first, then only its replies' subtrees, so a comment
+    with many replies never loads the ones on later pages.
+    Returns the replies and the cursor for the following page.
+    """
+    replies = tree_queryset().filter(parent_id=comment.pk)
+    if before is not None:
+        replies = replies.filter(pk__lt=before)
+    replies = list(replies.order_by('-created_at', '-pk')[:limit + 1])
+    page = replies[:limit]
+    next_cursor = str(page[-1].pk) if len(replies) > limit else None
+    load_replies(page, max_depth - 1, limit)
+    return page, next_cursor
@@ -0,0 +1,103 @@
+import random
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Sum, Value, When
+
+from .models import Comment, CounterShard, Post
+from . import http_cache, user_stats
+
+TARGET_MODELS = {
+    'post': Post,
+    'comment': Comment,
+}
+
+
+# Post counters that also roll up into the author's UserStats
+AUTHOR_STATS = {
+    'likes_count': 'likes_received',
+    'comments_count': 'comments_received',
+}
+
+
+def fold_into_author_stats(field, by_post):
+    """Add folded post totals to each author's stats"""
+    by_author = defaultdict(int)
+    for post_id, author_id in Post.objects.filter(pk__in=by_post).values_list('pk', 'author_id'):
+        by_author[author_id] += by_post[post_id]
+    user_stats.bump_many(field, by_author)
+
+
+def increment(target, object_id, metric, delta=1):
+    """Add delta to a random shard of the counter"""
+    shard = random.randrange(settings.COUNTER_SHARDS)
+    shards = CounterShard.objects.filter(target=target, object_id=object_id, metric=metric, shard=shard)
+    if shards.update(count=F('count') + delta):
+        return
+
+    try:
+        with transaction.atomic():
+            CounterShard.objects.create(
+                target=target, object_id=object_id, metric=metric, shard=shard, count=delta
+            )
+    except IntegrityError:
+        # Another writer created the shard first
+        shards.update(count=F('count') + delta)
+
+
+def get_count(obj, metric):
+    """Exact counter value: the folded column plus shards not yet folded"""
+    target = {model: name for name, model in TARGET_MODELS.items()}[type(obj)]
+    pending = CounterShard.objects.filter(
+        target=target, object_id=obj.pk, metric=metric
+    ).aggregate(total=Sum('count'))['total']
+    return getattr(obj, metric) + (pending or 0)
+
+
+def fold(batch_size=1000):
+    """
+    Move shard totals into the counter columns, one batch of shards per
+    transaction. Returns how many shards were folded.
+    """
+    folded = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            shards = list(
+                CounterShard.objects.select_for_update(skip_locked=True)
+                .filter(id__gt=last_id).exclude(count=0)
+                .order_by('id')[:batch_size]
+            )
+            if not shards:
+                return folded
+
+            totals = defaultdict(lambda: defaultdict(int))
+            for shard in shards:
+                totals[(shard.target, shard.metric)][shard.object_id] += shard.count
+
+            for (target, metric), by_object in totals.items():
+                TARGET_MODELS[target].objects.filter(pk__in=by_object).update(**{
+                    metric: F(metric) + Case(
+                        *[When(pk=pk, then=Value(total)) for pk, total in by_object.items()],
+                        default=Value(0),
+                    )
+                })
+                if target == 'post' and metric in AUTHOR_STATS:
+                    fold_into_author_stats(AUTHOR_STATS[metric], by_object)
+                if target == 'comment':
+                    # Comment counts are shown in their post's thread
+                    http_cache.bump_thread_version(
+                        Comment.objects.filter(pk__in=by_object).values('post_id')
+                    )
+
+            # Subtract exactly what was folded; the rows are locked until commit
+            CounterShard.objects.filter(pk__in=[shard.pk for shard in shards]).update(
+                count=F('count') - Case(
+                    *[When(pk=shard.pk, then=Value(shard.count)) for shard in shards],
+                    default=Value(0),
+                )
+            )
+
+        folded += len(shards)
+        last_id = shards[-1].pk
@@ -0,0 +1,119 @@
+import hashlib
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, F, IntegerField, OuterRef, Subquery
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.utils.http import quote_etag
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_headers
+
+from .models import CommentLike, Like, Notification, Post, ResourceVersion, UserStats
+
+def make_etag(*parts):
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def version_query(key):
+    return ResourceVersion.objects.filter(key=key).values_list('version', flat=True)
+
+
+def get_version(key):
+    return version_query(key).first() or 0
+
+
+def bump_version(key):
+    """Invalidate every cached copy of a resource"""
+    if ResourceVersion.objects.filter(key=key).update(version=F('version') + 1):
+        return
+    try:
+        with transaction.atomic():
+            ResourceVersion.objects.create(key=key, version=1)
+    except IntegrityError:
+        ResourceVersion.objects.filter(key=key).update(version=F('version') + 1)
+
+
+def bump_thread_version(post_ids):
+    """Invalidate the cached threads of these posts (ids, or a subquery of them)"""
+    Post.objects.filter(pk__in=post_ids).update(thread_version=F('thread_version') + 1)
+
+
+def conditional(etag_func):
+    """
+    Answer If-None-Match with 304 before the view runs. Responses vary by
+    the viewer's token and must be revalidated on every use.
+    """
+    def decorator(view_method):
+        view_method = method_decorator(condition(etag_func=etag_func))(view_method)
+        view_method = method_decorator(vary_on_headers('Authorization'))(view_method)
+        return method_decorator(cache_control(private=True, no_cache=True))(view_method)
+    return decorator
+
+
+def post_etag_query(user, pk):
+    """The post's version, its thread's version and the viewer's likes, as one row"""
+    viewer_comment_likes = CommentLike.objects.filter(
+        comment__post=OuterRef('pk'), user=user
+    ).order_by().values('user').annotate(count=Count('id')).values('count')
+    return Post.objects.filter(pk=pk, is_published=True).annotate(
+        liked=Exists(Like.objects.filter(post=OuterRef('pk'), user=user)),
+        liked_comments=Subquery(viewer_comment_likes, output_field=IntegerField()),
+    ).values_list(
+        'updated_at', 'likes_count', 'comments_count', 'shares_count', 'views_count', 'thread_version',
+        'liked', 'liked_comments',
+        # The author's avatar is part of the post
+        'author__profile__updated_at',
+    )
+
+
+def post_etag(request, pk=None, **kwargs):
+    """Post detail: the row's version, its thread's version and the viewer's likes"""
+    row = post_etag_query(request.user, pk).first()
+    if row is None:
+        return None
+    return make_etag('post', pk, request.user.pk, *row)
+
+
+async def apost_etag(user, pk):
+    row = await post_etag_query(user, pk).afirst()
+    if row is None:
+        return None
+    return make_etag('post', pk, user.pk, *row)
+
+
+def notification_etag_queries(user):
+    latest = Notification.objects.filter(recipient=user).order_by('-updated_at', '-id').values_list(
+        'id', 'updated_at', 'actor_count'
+    )
+    unread = UserStats.objects.filter(pk=user.pk).values_list('unread_notifications', flat=True)
+    return latest, unread
+
+
+def notification_etag(request, *args, **kwargs):
+    """Notification list: newest (or most recently merged into) notification plus the unread count"""
+    latest, unread = notification_etag_queries(request.user)
+    return make_etag('notifications', request.user.pk, latest.first(), unread.first())
+
+
+async def anotification_etag(user):
+    latest, unread = notification_etag_queries(user)
+    return make_etag('notifications', user.pk, await latest.afirst(), await unread.afirst())
+
+
+def not_modified(request, etag):
+    """
+    For async views, which cannot use conditional(): the 304 response if
+    the request's If-None-Match matches etag, else None
+    """
+    response = get_conditional_response(request, etag=quote_etag(etag))
+    return revalidated(response, etag) if response is not None else None
+
+
+def revalidated(response, etag):
+    """Give an async view's response the headers conditional() adds"""
+    if etag is not None and not response.has_header('ETag'):
+        response['ETag'] = quote_etag(etag)
+    patch_vary_headers(response, ['Authorization'])
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,306 @@
+"""
+Resized variants of uploaded images.
+
+Saving a model with a new image leaves the upload untouched and queues an
+'images.render' job; a worker then writes a thumb, feed and full variant
+of it in AVIF, WebP and the upload's own format, and stores their names in
+the model's `<field>_variants` JSON column:
+
+    {'feed': {'width': 320, 'height': 213,
+              'formats': {'avif': 'variants/post/blobs/ab/cd/abcd....jpg/feed.avif', ...}}, ...}
+
+Until the job has run the map is empty and clients use the original.
+Uploads in content-addressed storage (news.storage) are rendered once per
+kind of image: the map is kept on the MediaBlob too, and any later row
+with the same bytes copies it instead of queueing a job.
+"""
+import io
+from collections import Counter
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from .models import MediaBlob, Post
+from .storage import adjust_refs, is_blob
+from . import jobs
+
+# Longest edge of each variant, per kind of image
+VARIANT_SIZES = {
+    'post': {'thumb': 160, 'feed': 320, 'full': 1280},
+    'avatar': {'thumb': 64, 'feed': 160, 'full': 300},
+    'cover': {'thumb': 320, 'feed': 800, 'full': 1500},
+}
+
+# (model label, field) -> kind of image
+IMAGE_FIELDS = {
+    ('news.Post', 'image'): 'post',
+    ('news.PostImage', 'image'): 'post',
+    ('news.UserProfile', 'avatar'): 'avatar',
+    ('news.UserProfile', 'cover_photo'): 'cover',
+}
+
+# Encoder options per output format
+FORMAT_OPTIONS = {
+    'AVIF': {'quality': 55, 'speed': 8},
+    'WEBP': {'quality': 80, 'method': 4},
+    'JPEG': {'quality': 82, 'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+    'GIF': {},
+}
+
+EXTENSIONS = {'AVIF': 'avif', 'WEBP': 'webp', 'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif'}
+
+
+def variants_field(field):
+    return f'{field}_variants'
+
+
+def store_variants(model_class, pk, field, variants, **lookups):
+    """
+    Write a row's variant map with an UPDATE, moving the updated_at that
+    ETags are built from: the row's own, and the post's for a gallery image.
+    Returns how many rows were updated.
+    """
+    now = timezone.now()
+    values = {variants_field(field): variants}
+    if any(model_field.name == 'updated_at' for model_field in model_class._meta.concrete_fields):
+        values['updated_at'] = now
+    updated = model_class.objects.filter(pk=pk, **lookups).update(**values)
+    if updated and model_class._meta.label == 'news.PostImage':
+        Post.objects.filter(additional_images=pk).update(updated_at=now)
+    return updated
+
+
+def output_formats(source_format, has_alpha):
+    """AVIF and WebP (where Pillow can write them) plus the upload's own format"""
+    formats = [name for name in ('AVIF', 'WEBP') if features.check(name.lower())]
+    if source_format not in FORMAT_OPTIONS:
+        source_format = 'PNG' if has_alpha else 'JPEG'
+    if source_format not in formats:
+        formats.append(source_format)
+    return formats
+
+
+def variant_dir(name, kind):
+    """('blobs/ab/cd/abcd.jpg', 'post') -> 'variants/post/blobs/ab/cd/abcd.jpg'"""
+    return f'variants/{kind}/{name}'
+
+
+def owns_variants(name):
+    """
+    A legacy upload belongs to one row, so its variants go with the row.
+    Blob variants are shared and only removed by `manage.py collect_media`.
+    """
+    return not is_blob(name)
+
+
+def render(file, sizes, directory):
+    """Write every variant of an image file; returns the variant map"""
+    with file.open('rb'):
+        source = Image.open(file)
+        source_format = source.format
+        # Apply the camera's rotation so variants are upright without EXIF
+        source = ImageOps.exif_transpose(source)
+        source.load()
+
+    has_alpha = source.mode in ('RGBA', 'LA', 'PA') or 'transparency' in source.info
+    if source.mode not in ('RGB', 'RGBA'):
+        source = source.convert('RGBA' if has_alpha else 'RGB')
+    formats = output_formats(source_format, has_alpha)
+    variants = {}
+    for variant, size in sorted(sizes.items(), key=lambda item: -item[1]):
+        # Each variant is reduced from the next larger one, not from the upload
+        source = source.copy()
+        source.thumbnail((size, size), reducing_gap=3.0)
+        entry = variants[variant] = {'width': source.width, 'height': source.height, 'formats': {}}
+        for image_format in formats:
+            image = source
+            if image_format == 'JPEG' and image.mode != 'RGB':
+                image = image.convert('RGB')
+            elif image_format == 'GIF':
+                image = image.convert('P', palette=Image.Palette.ADAPTIVE)
+            buffer = io.BytesIO()
+            image.save(buffer, image_format, **FORMAT_OPTIONS[image_format])
+            path = f'{directory}/{variant}.{EXTENSIONS[image_format]}'
+            # Overwrite rather than rename what an identical earlier render left
+            default_storage.delete(path)
+            entry['formats'][image_format.lower()] = default_storage.save(path, ContentFile(buffer.getvalue()))
+    return variants
+
+
+def delete_variants(name, kind=None):
+    """Delete every variant file rendered from the upload `name`"""
+    directories = [variant_dir(name, kind)] if kind else []
+    if owns_variants(name):
+        # Legacy uploads rendered before variants were kept per kind
+        directories.append(f'variants/{name}')
+    for directory in directories:
+        if not default_storage.exists(directory):
+            continue
+        for filename in default_storage.listdir(directory)[1]:
+            default_storage.delete(f'{directory}/{filename}')
+
+
+def shared_variants(names, kind):
+    """{name: variant map} for the blobs among `names` already rendered as `kind`"""
+    names = [name for name in names if is_blob(name)]
+    if not names:
+        return {}
+    blobs = MediaBlob.objects.filter(name__in=names).values_list('name', 'variants')
+    return {name: variants[kind] for name, variants in blobs if variants.get(kind)}
+
+
+def remember_variants(name, kind, variants):
+    if not is_blob(name):
+        return
+    with transaction.atomic():
+        blob = MediaBlob.objects.select_for_update().filter(pk=name).first()
+        if blob is not None:
+            blob.variants[kind] = variants
+            blob.save(update_fields=['variants'])
+
+
+def render_request(instance, field, replaced=None):
+    """(payload, idempotency key) of the job rendering the instance's image in `field`"""
+    label = instance._meta.label
+    name = getattr(instance, field).name
+    payload = {'model': label, 'pk': instance.pk, 'field': field, 'name': name, 'replaced': replaced}
+    return payload, f'variants:{label}:{instance.pk}:{field}:{name}'
+
+
+def schedule(instance, field, replaced=None):
+    """Queue rendering of the instance's current image in `field`"""
+    payload, key = render_request(instance, field, replaced)
+    jobs.enqueue('images.render', payload, idempotency_key=key)
+
+
+def image_replaced(instance, field, replaced):
+    """
+    Bring the instance's variants and blob references up to date after a
+    save changed `field` from the image named `replaced`. Variants already
+    rendered from the same bytes are reused; otherwise a job renders them.
+    """
+    name = getattr(instance, field).name or ''
+    if name == replaced:
+        # The same bytes uploaded again
+        return
+    adjust_refs({name: 1, replaced: -1})
+
+    kind = IMAGE_FIELDS[instance._meta.label, field]
+    variants = shared_variants([name], kind).get(name, {})
+    if variants != instance.__dict__.get(variants_field(field)):
+        store_variants(type(instance), instance.pk, field, variants)
+        setattr(instance, variants_field(field), variants)
+
+    if name and not variants:
+        schedule(instance, field, replaced)
+    elif replaced and owns_variants(replaced):
+        jobs.enqueue('images.delete', {'name': replaced, 'kind': kind})
+
+
+def fill_shared_variants(instances, field):
+    """Before a bulk_create: give new rows the variants already rendered from their bytes"""
+    if not instances:
+        return
+    kind = IMAGE_FIELDS[instances[0]._meta.label, field]
+    shared = shared_variants([getattr(instance, field).name for instance in instances], kind)
+    for instance in instances:
+        setattr(instance, variants_field(field), shared.get(getattr(instance, field).name, {}))
+
+
+def images_created(instances, field):
+    """After a bulk_create: the image_replaced() work for every new row, batched"""
+    adjust_refs(Counter(getattr(instance, field).name for instance in instances))
+    jobs.enqueue_many('images.render', [
+        render_request(instance, field)
+        for instance in instances
+        if getattr(instance, field).name and not getattr(instance, variants_field(field))
+    ])
+
+
+@jobs.task('images.render')
+def render_job(model, pk, field, name, replaced=None):
+    kind = IMAGE_FIELDS[model, field]
+    if replaced and owns_variants(replaced):
+        delete_variants(replaced, kind)
+    model_class = apps.get_model(model)
+    instance = model_class.objects.filter(pk=pk).only('pk', field).first()
+    if instance is None or getattr(instance, field).name != name:
+        # Deleted or replaced since; the newer image has its own job
+        if owns_variants(name):
+            delete_variants(name, kind)
+        return
+
+    variants = shared_variants([name], kind).get(name)
+    if variants is None:
+        if owns_variants(name):
+            # Clear out anything a failed earlier attempt left behind
+            delete_variants(name, kind)
+        variants = render(getattr(instance, field), VARIANT_SIZES[kind], variant_dir(name, kind))
+        remember_variants(name, kind, variants)
+    # Only store the map if the image is still the one we rendered
+    updated = store_variants(model_class, pk, field, variants, **{field: name})
+    if not updated and owns_variants(name):
+        delete_variants(name, kind)
+
+
+@jobs.task('images.delete')
+def delete_job(name, kind=None):
+    # Jobs queued before variants were kept per kind carry no kind
+    delete_variants(name, kind)
+
+
+def image_fields(instance):
+    label = instance._meta.label
+    return [field for model, field in IMAGE_FIELDS if model == label]
+
+
+def image_changes(instance):
+    """
+    Image fields of `instance` whose value differs from what was loaded from
+    the database (every non-empty image, for a new row). Fields that were
+    never loaded or assigned are skipped rather than fetched.
+    """
+    loaded = getattr(instance, '_loaded_images', {})
+    changed = []
+    for field in image_fields(instance):
+        if field not in instance.__dict__:
+            continue
+        value = getattr(instance, field)
+        if not getattr(value, '_committed', True) or (value.name or '') != loaded.get(field, ''):
+            changed.append(field)
+    return changed
+
+
+def variant_urls(variants):
+    """The variant map with storage names replaced by URLs"""
+    return {
+        variant: {
+            'width': entry['width'],
+            'height': entry['height'],
+            'formats': {name: default_storage.url(path) for name, path in entry['formats'].items()},
+        }
+        for variant, entry in (variants or {}).items()
+    }
+
+
+def image_url(file, variants, variant):
+    """
+    URL of one variant in the upload's own format, for fields that carry a
+    single URL; the original until the variants exist
+    """
+    if not file:
+        return None
+    formats = (variants or {}).get(variant, {}).get('formats', {})
+    path = next((path for name, path in formats.items() if name not in ('avif', 'webp')), formats.get('webp'))
+    return default_storage.url(path) if path else file.url
+
+
+def avatar_url(profile, variant='thumb'):
+    if profile is None:
+        return None
+    return image_url(profile.avatar, profile.avatar_variants, variant)
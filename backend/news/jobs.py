@@ -0,0 +1,174 @@
+"""
+Postgres-backed job queue.
+
+Request handlers enqueue side effects as Job rows in the same database,
+and `manage.py run_workers` claims due jobs with SELECT ... FOR UPDATE SKIP
+LOCKED, so any number of workers can poll without blocking each other.
+Failed jobs are retried with exponential backoff. A worker refreshes
+locked_at while a job runs, so only jobs left running by a crashed worker
+go JOB_LOCK_TIMEOUT seconds without it and are reclaimed.
+"""
+import logging
+import random
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_tasks = {}
+
+
+def task(name):
+    """Register a function as the handler for jobs named `name`"""
+    def register(func):
+        _tasks[name] = func
+        return func
+    return register
+
+
+def enqueue(name, payload=None, idempotency_key=None, delay=0, max_attempts=None):
+    """
+    Queue a job. With an idempotency key, a job already queued (or run)
+    under the same key makes this a no-op, unless it failed for good: that
+    job is queued again with a fresh set of attempts.
+    """
+    enqueue_many(name, [(payload, idempotency_key)], delay=delay, max_attempts=max_attempts)
+
+
+def enqueue_many(name, items, delay=0, max_attempts=None):
+    """Queue one job per (payload, idempotency_key) pair in a single INSERT"""
+    run_at = timezone.now() + timedelta(seconds=delay)
+    jobs = [
+        Job(
+            task=name,
+            payload=payload or {},
+            idempotency_key=idempotency_key,
+            max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+            run_at=run_at,
+        )
+        for payload, idempotency_key in items
+    ]
+    if not jobs:
+        return
+    keys = [job.idempotency_key for job in jobs if job.idempotency_key is not None]
+    Job.objects.bulk_create(jobs, ignore_conflicts=bool(keys))
+    if keys:
+        Job.objects.filter(idempotency_key__in=keys, status=Job.FAILED).update(
+            status=Job.PENDING, attempts=0, run_at=run_at, updated_at=timezone.now()
+        )
+
+
+def claim(limit=1):
+    """Lock and mark running up to `limit` due jobs no other worker holds"""
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    with transaction.atomic():
+        jobs = list(
+            Job.objects.filter(
+                Q(status=Job.PENDING, run_at__lte=now) | Q(status=Job.RUNNING, locked_at__lt=stale)
+            ).order_by('run_at', 'id').select_for_update(skip_locked=True)[:limit]
+        )
+        for job in jobs:
+            job.status = Job.RUNNING
+            job.locked_at = now
+            job.attempts += 1
+            # bulk_update() skips auto_now
+            job.updated_at = now
+        Job.objects.bulk_update(jobs, ['status', 'locked_at', 'attempts', 'updated_at'])
+    return jobs
+
+
+def backoff(attempts):
+    """Seconds to wait before retry number `attempts`, with jitter"""
+    delay = settings.JOB_RETRY_BACKOFF * 2 ** (attempts - 1)
+    return delay * random.uniform(0.5, 1.5)
+
+
+def _claimed(job):
+    """The job's row while it is still ours; every claim bumps attempts"""
+    return Job.objects.filter(pk=job.pk, status=Job.RUNNING, attempts=job.attempts)
+
+
+@contextmanager
+def _heartbeat(job):
+    """Refresh the job's lock while the body runs, so it is never reclaimed"""
+    done = threading.Event()
+
+    def beat():
+        try:
+            while not done.wait(settings.JOB_LOCK_TIMEOUT / 3):
+                _claimed(job).update(locked_at=timezone.now())
+        except Exception:
+            logger.exception('Heartbeat for job %s failed', job)
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f'job-heartbeat-{job.pk}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        done.set()
+        thread.join()
+
+
+def _record(job, fields):
+    """Save the job's outcome, unless another worker has claimed it since"""
+    values = {field: getattr(job, field) for field in fields}
+    if not _claimed(job).update(**values, updated_at=timezone.now()):
+        logger.warning('Job %s was reclaimed while it ran; not recording its outcome', job)
+
+
+def run(job):
+    """Run one claimed job and record the outcome. Returns True on success."""
+    handler = _tasks.get(job.task)
+    try:
+        if handler is None:
+            raise LookupError(f'No task registered as {job.task!r}')
+        with _heartbeat(job):
+            handler(**job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = Job.PENDING
+            job.run_at = timezone.now() + timedelta(seconds=backoff(job.attempts))
+            logger.warning('Job %s failed (attempt %d), retrying at %s', job, job.attempts, job.run_at)
+        else:
+            job.status = Job.FAILED
+            logger.error('Job %s failed permanently after %d attempts', job, job.attempts)
+        job.locked_at = None
+        _record(job, ['status', 'run_at', 'locked_at', 'last_error'])
+        return False
+
+    job.status = Job.DONE
+    job.locked_at = None
+    _record(job, ['status', 'locked_at'])
+    return True
+
+
+def run_pending(limit=None):
+    """Claim and run due jobs one at a time until none are left (or `limit` ran)"""
+    ran = 0
+    while limit is None or ran < limit:
+        jobs = claim()
+        if not jobs:
+            break
+        run(jobs[0])
+        ran += 1
+    return ran
+
+
+def purge(older_than):
+    """Delete finished jobs (and their idempotency keys) older than `older_than` seconds"""
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    deleted, _ = Job.objects.filter(status=Job.DONE, updated_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,113 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from news import chunked_uploads, images
+from news.models import MediaBlob
+from news.storage import PREFIX, content_storage
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete content-addressed images, and their variants, that no row has referenced '
+        'for MEDIA_GC_GRACE seconds, and expired chunked uploads'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recount', action='store_true',
+            help='First recompute every reference count from the image columns (run while uploads are quiet)'
+        )
+        parser.add_argument(
+            '--scan', action='store_true',
+            help='Also delete blob files that have no MediaBlob row'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be deleted')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=settings.MEDIA_GC_GRACE)
+        dry_run = options['dry_run']
+
+        if not dry_run:
+            expired = chunked_uploads.expire()
+            self.stdout.write(f'Discarded {expired} expired chunked uploads')
+
+        if options['recount']:
+            corrected = self.recount(dry_run)
+            self.stdout.write(f'Corrected {corrected} reference counts')
+
+        collected = self.collect(cutoff, options['batch_size'], dry_run)
+        verb = 'Would delete' if dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {collected} unreferenced images'))
+
+        if options['scan']:
+            stray = self.scan(cutoff, dry_run)
+            self.stdout.write(self.style.SUCCESS(f'{verb} {stray} blob files without a MediaBlob row'))
+
+    def recount(self, dry_run):
+        counts = Counter()
+        for label, field in images.IMAGE_FIELDS:
+            rows = (
+                apps.get_model(label).objects
+                .filter(**{f'{field}__startswith': PREFIX})
+                .order_by().values_list(field).annotate(refs=Count('pk'))
+            )
+            counts.update(dict(rows))
+
+        stale = []
+        for blob in MediaBlob.objects.only('name', 'ref_count').iterator(chunk_size=2000):
+            if blob.ref_count != counts[blob.name]:
+                blob.ref_count = counts[blob.name]
+                stale.append(blob)
+        if not dry_run:
+            MediaBlob.objects.bulk_update(stale, ['ref_count'], batch_size=1000)
+        return len(stale)
+
+    def collect(self, cutoff, batch_size, dry_run):
+        orphans = MediaBlob.objects.filter(ref_count__lte=0, last_used_at__lt=cutoff)
+        collected = 0
+        last_name = ''
+        while True:
+            names = list(
+                orphans.filter(name__gt=last_name).order_by('name').values_list('name', flat=True)[:batch_size]
+            )
+            if not names:
+                return collected
+            last_name = names[-1]
+            for name in names:
+                with transaction.atomic():
+                    # Uploads of the same bytes lock this row, and touching it moves it past the cutoff
+                    blob = orphans.select_for_update(skip_locked=True).filter(pk=name).first()
+                    if blob is None:
+                        continue
+                    collected += 1
+                    if dry_run:
+                        continue
+                    content_storage.delete(name)
+                    for kind in images.VARIANT_SIZES:
+                        images.delete_variants(name, kind)
+                    blob.delete()
+
+    def scan(self, cutoff, dry_run):
+        stray = 0
+        for first in content_storage.listdir(PREFIX)[0] if content_storage.exists(PREFIX) else ():
+            for second in content_storage.listdir(f'{PREFIX}{first}')[0]:
+                directory = f'{PREFIX}{first}/{second}'
+                names = [f'{directory}/{filename}' for filename in content_storage.listdir(directory)[1]]
+                known = set(MediaBlob.objects.filter(name__in=names).values_list('name', flat=True))
+                for name in names:
+                    if name in known or content_storage.get_modified_time(name) >= cutoff:
+                        continue
+                    stray += 1
+                    if not dry_run:
+                        content_storage.delete(name)
+                        for kind in images.VARIANT_SIZES:
+                            images.delete_variants(name, kind)
+        return stray
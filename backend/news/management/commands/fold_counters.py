@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from news import counters
+
+
+class Command(BaseCommand):
+    help = 'Fold sharded like/comment/share counters back into their columns'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Keep running, folding every N seconds'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            folded = counters.fold(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Folded {folded} counter shards'))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
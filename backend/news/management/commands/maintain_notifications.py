@@ -0,0 +1,48 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from news import notification_partitions, user_stats
+from news.models import Notification
+
+
+class Command(BaseCommand):
+    help = (
+        'Create upcoming monthly notification partitions, mark notifications older than the '
+        'hot months read, and detach partitions past the retention period'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=2, help='Months of partitions to create in advance')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--drop', action='store_true',
+            help='Drop expired partitions instead of keeping them as archive tables'
+        )
+
+    def handle(self, *args, **options):
+        for name in notification_partitions.ensure_partitions(ahead=options['ahead']):
+            self.stdout.write(f'Created partition {name}')
+
+        cooled = self.mark_cold_read(options['batch_size'])
+        self.stdout.write(f'Marked {cooled} notifications older than the hot months read')
+
+        verb = 'Dropped' if options['drop'] else 'Detached'
+        for name in notification_partitions.expire_partitions(drop=options['drop']):
+            self.stdout.write(self.style.WARNING(f'{verb} partition {name}'))
+        self.stdout.write(self.style.SUCCESS('Notification partitions are up to date'))
+
+    def mark_cold_read(self, batch_size):
+        """Mark unread notifications below hot_start() read, a batch at a time"""
+        cold = Notification.objects.filter(is_read=False, created_at__lt=notification_partitions.hot_start())
+        total = 0
+        while True:
+            batch = list(cold.order_by().values_list('id', 'recipient_id')[:batch_size])
+            if not batch:
+                return total
+            cold.filter(id__in=[notification_id for notification_id, _ in batch]).update(is_read=True)
+            user_stats.bump_many('unread_notifications', {
+                recipient_id: -count
+                for recipient_id, count in Counter(recipient_id for _, recipient_id in batch).items()
+            })
+            total += len(batch)
@@ -0,0 +1,32 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from news import user_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-user dashboard stats from posts and notifications'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help='Only this user id (repeatable)')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['user_ids']:
+            user_ids = User.objects.filter(id__in=options['user_ids']).values_list('id', flat=True)
+        else:
+            user_ids = User.objects.values_list('id', flat=True).order_by('id')
+
+        chunk = []
+        rebuilt = 0
+        for user_id in user_ids.iterator(chunk_size=options['chunk_size']):
+            chunk.append(user_id)
+            if len(chunk) >= options['chunk_size']:
+                user_stats.rebuild(chunk)
+                rebuilt += len(chunk)
+                chunk = []
+        if chunk:
+            user_stats.rebuild(chunk)
+            rebuilt += len(chunk)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {rebuilt} users'))
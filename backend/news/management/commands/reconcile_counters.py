@@ -0,0 +1,151 @@
+from collections import namedtuple
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, Max, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from news.models import (
+    Category, Comment, CommentLike, CounterShard, Follow, Like, Post, Share, UserProfile, Watermark
+)
+
+# A denormalized counter: `column` on `model` counts `source` rows whose
+# `source_field` points at the row's `key`. Sharded counters also subtract
+# shards not yet folded, so column + shards stays equal to the true count.
+# `source_filter` narrows which source rows are counted.
+Counter = namedtuple(
+    'Counter', 'model column source source_field key shard_target source_filter', defaults=(None,)
+)
+
+COUNTERS = [
+    Counter(Post, 'likes_count', Like, 'post', 'pk', 'post'),
+    Counter(Post, 'comments_count', Comment, 'post', 'pk', 'post'),
+    Counter(Post, 'shares_count', Share, 'post', 'pk', 'post'),
+    Counter(Comment, 'likes_count', CommentLike, 'comment', 'pk', 'comment'),
+    Counter(UserProfile, 'followers_count', Follow, 'following', 'user_id', None),
+    Counter(UserProfile, 'following_count', Follow, 'follower', 'user_id', None),
+    Counter(UserProfile, 'posts_count', Post, 'author', 'user_id', None),
+    Counter(Category, 'published_posts_count', Post, 'category', 'pk', None, {'is_published': True}),
+]
+
+WATERMARK_NAME = 'reconcile_counters'
+
+
+def expected_value(counter):
+    """SQL expression for the value the counter column should hold"""
+    source_count = counter.source.objects.filter(
+        **{counter.source_field: OuterRef(counter.key)}, **(counter.source_filter or {})
+    ).order_by().values(counter.source_field).annotate(total=Count('pk')).values('total')
+    expression = Coalesce(Subquery(source_count), 0)
+
+    if counter.shard_target:
+        pending = CounterShard.objects.filter(
+            target=counter.shard_target, metric=counter.column, object_id=OuterRef('pk')
+        ).order_by().values('object_id').annotate(total=Sum('count')).values('total')
+        expression = expression - Coalesce(Subquery(pending), 0)
+    return expression
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute denormalized like/comment/share/follow/post/category counters from their source rows. '
+        'Incremental runs only revisit objects with new rows since the watermark; run a full '
+        'pass periodically to pick up drift from deletions.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            help='Only reconcile objects with source rows created at or after this ISO datetime'
+        )
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Use (and advance) the watermark left by the previous run'
+        )
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report drifted counters without writing'
+        )
+
+    def handle(self, *args, **options):
+        started_at = timezone.now()
+        since = self.get_since(options)
+        chunk_size = options['chunk_size']
+        dry_run = options['dry_run']
+
+        if since:
+            self.stdout.write(f'Reconciling objects touched since {since.isoformat()}')
+
+        for counter in COUNTERS:
+            label = f'{counter.model.__name__}.{counter.column}'
+            drifted = 0
+            off_by = 0
+            for chunk in self.chunks(counter, since, chunk_size):
+                rows = self.reconcile_chunk(counter, chunk, dry_run)
+                drifted += len(rows)
+                off_by += sum(abs(expected - current) for _, current, expected in rows)
+                if dry_run and options['verbosity'] > 1:
+                    for pk, current, expected in rows:
+                        self.stdout.write(f'  {label} #{pk}: {current} -> {expected}')
+
+            style = self.style.WARNING if drifted else self.style.SUCCESS
+            verb = 'would fix' if dry_run else 'fixed'
+            self.stdout.write(style(f'{label}: {verb} {drifted} rows (total drift {off_by})'))
+
+        if options['incremental'] and not dry_run:
+            Watermark.objects.update_or_create(name=WATERMARK_NAME, defaults={'value': started_at})
+
+    def get_since(self, options):
+        if options['since'] and options['incremental']:
+            raise CommandError('Use either --since or --incremental, not both')
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError(f"Invalid datetime: {options['since']}")
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+            return since
+        if options['incremental']:
+            watermark = Watermark.objects.filter(name=WATERMARK_NAME).first()
+            return watermark.value if watermark else None
+        return None
+
+    def chunks(self, counter, since, chunk_size):
+        """Yield filters selecting one chunk of counter rows at a time"""
+        if since is None:
+            # Full pass: walk primary key ranges
+            bounds = counter.model.objects.aggregate(min_pk=Min('pk'), max_pk=Max('pk'))
+            if bounds['min_pk'] is None:
+                return
+            for start in range(bounds['min_pk'], bounds['max_pk'] + 1, chunk_size):
+                yield {'pk__gte': start, 'pk__lt': start + chunk_size}
+            return
+
+        # Incremental pass: only objects that new source rows point at
+        touched = counter.source.objects.filter(
+            created_at__gte=since, **{f'{counter.source_field}__isnull': False}
+        ).values_list(
+            f'{counter.source_field}_id', flat=True
+        ).distinct()
+        touched = sorted(touched)
+        lookup = 'user_id__in' if counter.key == 'user_id' else 'pk__in'
+        for start in range(0, len(touched), chunk_size):
+            yield {lookup: touched[start:start + chunk_size]}
+
+    def reconcile_chunk(self, counter, chunk, dry_run):
+        """Find drifted rows in a chunk and, unless dry-running, fix them in one UPDATE"""
+        expected = expected_value(counter)
+        rows = list(
+            counter.model.objects.filter(**chunk)
+            .annotate(expected=expected)
+            .exclude(**{counter.column: F('expected')})
+            .values_list('pk', counter.column, 'expected')
+        )
+        if rows and not dry_run:
+            # Recomputed inside the UPDATE so concurrent writes are not overwritten
+            counter.model.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(
+                **{counter.column: expected_value(counter)}
+            )
+        return rows
@@ -0,0 +1,27 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from news import images
+
+
+class Command(BaseCommand):
+    help = 'Queue resized variants for images that have none yet (e.g. uploaded before the pipeline)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        queued = 0
+        for label, field in images.IMAGE_FIELDS:
+            variants = images.variants_field(field)
+            queryset = (
+                apps.get_model(label).objects
+                .exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                .filter(**{variants: {}})
+                .only('pk', field)
+            )
+            for instance in queryset.iterator(chunk_size=options['chunk_size']):
+                images.schedule(instance, field)
+                queued += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Queued {queued} images; run_workers renders them'))
@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from news import analytics
+from news.models import Watermark
+
+WATERMARK_NAME = 'rollup_post_stats'
+
+
+class Command(BaseCommand):
+    help = (
+        'Roll likes, comments and shares created since the last run into PostDailyStats. '
+        'Run one instance at a time.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lag', type=int, default=300,
+            help='Leave the last N seconds for the next run so in-flight writes are not missed'
+        )
+
+    def handle(self, *args, **options):
+        until = timezone.now() - timedelta(seconds=options['lag'])
+        watermark = Watermark.objects.filter(name=WATERMARK_NAME).first()
+        since = watermark.value if watermark else None
+        if since is not None and since >= until:
+            self.stdout.write('Nothing to roll up yet')
+            return
+
+        deltas = analytics.rollup_events(since, until)
+        with transaction.atomic():
+            analytics.add_to_daily_stats(deltas)
+            Watermark.objects.update_or_create(name=WATERMARK_NAME, defaults={'value': until})
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rolled up {len(deltas)} post-days of activity up to {until.isoformat()}'
+        ))
@@ -0,0 +1,69 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from news import jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (notifications, ...) until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1, help='Worker threads in this process')
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Seconds an idle worker waits before checking for jobs again'
+        )
+        parser.add_argument('--once', action='store_true', help='Run every due job, then exit')
+        parser.add_argument(
+            '--purge-after', type=int, default=7 * 24 * 3600,
+            help='Delete finished jobs older than this many seconds (0 keeps them)'
+        )
+
+    def handle(self, *args, **options):
+        if options['once']:
+            ran = jobs.run_pending()
+            self.stdout.write(self.style.SUCCESS(f'Ran {ran} jobs'))
+            self.purge(options['purge_after'])
+            return
+
+        stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stop.set())
+
+        threads = [
+            threading.Thread(target=self.work, args=(stop, options['poll_interval']), name=f'job-worker-{i}')
+            for i in range(options['concurrency'])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"Started {len(threads)} job workers")
+
+        # The main thread purges finished jobs while the workers run
+        while not stop.wait(3600):
+            self.purge(options['purge_after'])
+        for thread in threads:
+            thread.join()
+        connection.close()
+        self.stdout.write('Job workers stopped')
+
+    def work(self, stop, poll_interval):
+        try:
+            # A stop request is honoured between jobs, never mid-job
+            while not stop.is_set():
+                close_old_connections()
+                claimed = jobs.claim()
+                if not claimed:
+                    stop.wait(poll_interval)
+                    continue
+                jobs.run(claimed[0])
+        finally:
+            connection.close()
+
+    def purge(self, older_than):
+        if older_than:
+            purged = jobs.purge(older_than)
+            if purged:
+                self.stdout.write(f'Purged {purged} finished jobs')
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_comment_paths(apps, schema_editor):
+    """Fill path/depth level by level, starting from top-level comments"""
+    Comment = apps.get_model('news', 'Comment')
+
+    while True:
+        root_ids = list(
+            Comment.objects.filter(parent__isnull=True, path='').values_list('id', flat=True)[:2000]
+        )
+        if not root_ids:
+            break
+        updates = [Comment(id=comment_id, path=f'{comment_id:010d}', depth=0) for comment_id in root_ids]
+        Comment.objects.bulk_update(updates, ['path', 'depth'])
+
+    while True:
+        # Replies whose parent already has a path
+        level = list(
+            Comment.objects.filter(path='', parent__isnull=False)
+            .exclude(parent__path='')
+            .values_list('id', 'parent__path', 'parent__depth')[:2000]
+        )
+        if not level:
+            break
+        updates = [
+            Comment(id=comment_id, path=f'{parent_path}/{comment_id:010d}', depth=parent_depth + 1)
+            for comment_id, parent_path, parent_depth in level
+        ]
+        Comment.objects.bulk_update(updates, ['path', 'depth'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0002_post_cursor_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='comment_post_path_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['path'], name='comment_path_idx', opclasses=['text_pattern_ops']),
+        ),
+        migrations.RunPython(backfill_comment_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0004_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target', models.CharField(choices=[('post', 'Post'), ('comment', 'Comment')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('metric', models.CharField(choices=[('likes_count', 'Likes'), ('comments_count', 'Comments'), ('shares_count', 'Shares')], max_length=20)),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('count', 0), _negated=True), fields=['id'], name='countershard_pending_idx')],
+                'unique_together': {('target', 'object_id', 'metric', 'shard')},
+            },
+        ),
+    ]
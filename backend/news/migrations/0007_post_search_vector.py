@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:45
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Max
+
+CREATE_TRIGGER = """
+CREATE FUNCTION news_post_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(NEW.content, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER news_post_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, content ON news_post
+    FOR EACH ROW EXECUTE FUNCTION news_post_search_vector_update();
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER IF EXISTS news_post_search_vector_trigger ON news_post;
+DROP FUNCTION IF EXISTS news_post_search_vector_update();
+"""
+
+
+def backfill_search_vectors(apps, schema_editor):
+    """Fill search_vector in id ranges so no single UPDATE locks the whole table"""
+    Post = apps.get_model('news', 'Post')
+    vector = (
+        SearchVector('title', weight='A', config='english')
+        + SearchVector('content', weight='B', config='english')
+    )
+    max_id = Post.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+    for start in range(0, max_id + 1, 5000):
+        Post.objects.filter(id__gte=start, id__lt=start + 5000).update(search_vector=vector)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0006_watermark'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    atomic = False
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+        migrations.RunPython(backfill_search_vectors, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='post_search_vector_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Expression indexes matching what `icontains` compiles to on Postgres
+# (UPPER(col::text) LIKE UPPER('%q%')), so user search can use them.
+USER_SEARCH_COLUMNS = ['username', 'first_name', 'last_name']
+
+CREATE_INDEXES = [
+    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS news_user_{column}_trgm '
+    f'ON auth_user USING gin ((UPPER("{column}"::text)) gin_trgm_ops);'
+    for column in USER_SEARCH_COLUMNS
+]
+
+DROP_INDEXES = [
+    f'DROP INDEX CONCURRENTLY IF EXISTS news_user_{column}_trgm;'
+    for column in USER_SEARCH_COLUMNS
+]
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('news', '0007_post_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunSQL(CREATE_INDEXES, DROP_INDEXES),
+    ]
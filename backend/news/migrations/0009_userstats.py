@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('news', '0008_user_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('posts_count', models.IntegerField(default=0)),
+                ('likes_received', models.IntegerField(default=0)),
+                ('comments_received', models.IntegerField(default=0)),
+                ('views_received', models.BigIntegerField(default=0)),
+                ('unread_notifications', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'User stats',
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:52
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_published_posts_count(apps, schema_editor):
+    Category = apps.get_model('news', 'Category')
+    Post = apps.get_model('news', 'Post')
+    published = Post.objects.filter(category=OuterRef('pk'), is_published=True).order_by().values(
+        'category'
+    ).annotate(total=Count('pk')).values('total')
+    Category.objects.update(published_posts_count=Coalesce(Subquery(published), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0011_resourceversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='published_posts_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_published_posts_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:55
+
+import django.contrib.postgres.fields
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Func
+
+
+def backfill_recent_actors(apps, schema_editor):
+    Notification = apps.get_model('news', 'Notification')
+    Notification.objects.update(recent_actor_ids=Func(F('sender_id'), template='ARRAY[%(expressions)s]'))
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0012_category_published_posts_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='actor_count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='group_key',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='recent_actor_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), blank=True, default=list, size=None),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='window_start',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_recent_actors, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_read', False), models.Q(('group_key', ''), _negated=True)), fields=('recipient', 'group_key', 'window_start'), name='notif_unread_group_uniq'),
+        ),
+    ]
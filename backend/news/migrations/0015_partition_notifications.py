@@ -0,0 +1,89 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:06
+
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Rebuilds news_notification as a table range-partitioned by month on
+# created_at. Every row is copied, so expect this to take a while on a
+# large table; the table is locked for the duration.
+
+TABLE = 'news_notification'
+LEGACY = 'news_notification_legacy'
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_notifications(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE "{TABLE}" RENAME TO "{LEGACY}"')
+        cursor.execute(
+            f'CREATE TABLE "{TABLE}" (LIKE "{LEGACY}" INCLUDING DEFAULTS INCLUDING IDENTITY) '
+            f'PARTITION BY RANGE (created_at)'
+        )
+        cursor.execute(f'CREATE TABLE "{TABLE}_default" PARTITION OF "{TABLE}" DEFAULT')
+
+        # One partition per month from the oldest notification to two months out
+        cursor.execute(f'SELECT MIN(created_at) FROM "{LEGACY}"')
+        oldest = cursor.fetchone()[0] or datetime.now(timezone.utc)
+        month = datetime(oldest.year, oldest.month, 1, tzinfo=timezone.utc)
+        last = add_months(datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0), 2)
+        while month <= last:
+            cursor.execute(
+                f'CREATE TABLE "{TABLE}_p{month:%Y_%m}" PARTITION OF "{TABLE}" FOR VALUES FROM (%s) TO (%s)',
+                [month, add_months(month, 1)],
+            )
+            month = add_months(month, 1)
+
+        cursor.execute(f'INSERT INTO "{TABLE}" SELECT * FROM "{LEGACY}"')
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), COALESCE(MAX(id), 0) + 1, false) "
+            f'FROM "{TABLE}"'
+        )
+        cursor.execute(f'DROP TABLE "{LEGACY}"')
+
+        # The partition key has to be part of the primary key
+        cursor.execute(f'ALTER TABLE "{TABLE}" ADD PRIMARY KEY (id, created_at)')
+        for column, target in [
+            ('recipient_id', 'auth_user'),
+            ('sender_id', 'auth_user'),
+            ('post_id', 'news_post'),
+            ('comment_id', 'news_comment'),
+        ]:
+            cursor.execute(
+                f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "{TABLE}_{column}_fk" FOREIGN KEY ("{column}") '
+                f'REFERENCES "{target}" ("id") DEFERRABLE INITIALLY DEFERRED'
+            )
+            if column != 'recipient_id':
+                cursor.execute(f'CREATE INDEX "{TABLE}_{column}_idx" ON "{TABLE}" ("{column}")')
+        cursor.execute(
+            f'CREATE INDEX "notif_recipient_created_idx" ON "{TABLE}" (recipient_id, created_at DESC, id DESC)'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0014_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='notification',
+            name='notif_unread_group_uniq',
+        ),
+        migrations.RunPython(partition_notifications),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['recipient', '-created_at'], name='notif_unread_recipient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_read', False), models.Q(('group_key', ''), _negated=True)), fields=['recipient', 'group_key', 'window_start'], name='notif_unread_group_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:15
+
+import django.utils.timezone
+import news.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0016_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=news.storage.get_content_storage, upload_to='posts/'),
+        ),
+        migrations.AlterField(
+            model_name='postimage',
+            name='image',
+            field=models.ImageField(storage=news.storage.get_content_storage, upload_to='posts/gallery/'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, storage=news.storage.get_content_storage, upload_to='avatars/'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='cover_photo',
+            field=models.ImageField(blank=True, null=True, storage=news.storage.get_content_storage, upload_to='covers/'),
+        ),
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('size', models.BigIntegerField(default=0)),
+                ('ref_count', models.IntegerField(default=0)),
+                ('variants', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('ref_count__lte', 0)), fields=['last_used_at'], name='mediablob_orphan_idx')],
+            },
+        ),
+    ]
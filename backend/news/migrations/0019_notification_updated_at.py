@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 09:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+# Merges used to move created_at, so until now it held the time of a
+# notification's latest event; it becomes updated_at for existing rows.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0018_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunSQL(
+            'UPDATE "news_notification" SET updated_at = created_at',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AlterModelOptions(
+            name='notification',
+            options={'ordering': ['-updated_at']},
+        ),
+        migrations.RemoveIndex(
+            model_name='notification',
+            name='notif_recipient_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', '-updated_at', '-id'], name='notif_recipient_updated_idx'),
+        ),
+    ]
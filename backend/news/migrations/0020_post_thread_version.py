@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0019_notification_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='thread_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
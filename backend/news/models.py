@@ -1,16 +1,50 @@
+import uuid
+
 from django.db import models
+from django.db.models import Q
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth.models import User
 from django.utils import timezone
-from PIL import Image
-import os
 
-class UserProfile(models.Model):
+from .storage import get_content_storage
+
+class TracksImageChanges:
+    """
+    Remembers the stored name of each image field as loaded, so news.images
+    can tell on save whether an image was replaced
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_images()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self._remember_images(fields)
+
+    def _remember_images(self, field_names=None):
+        loaded = self.__dict__.setdefault('_loaded_images', {})
+        for field in self._meta.concrete_fields:
+            if not isinstance(field, models.ImageField) or field.attname not in self.__dict__:
+                continue
+            if field_names is None or field.attname in field_names:
+                value = self.__dict__[field.attname]
+                loaded[field.attname] = getattr(value, 'name', value) or ''
+
+class UserProfile(TracksImageChanges, models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     bio = models.TextField(max_length=500, blank=True)
     location = models.CharField(max_length=100, blank=True)
     birth_date = models.DateField(null=True, blank=True)
-    avatar = models.ImageField(upload_to='avatars/', null=True, blank=True)
-    cover_photo = models.ImageField(upload_to='covers/', null=True, blank=True)
+    avatar = models.ImageField(upload_to='avatars/', null=True, blank=True, storage=get_content_storage)
+    cover_photo = models.ImageField(upload_to='covers/', null=True, blank=True, storage=get_content_storage)
+    # Resized copies of the images, written by news.images
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)
+    cover_photo_variants = models.JSONField(default=dict, blank=True, editable=False)
     website = models.URLField(blank=True)
     phone = models.CharField(max_length=15, blank=True)
     is_verified = models.BooleanField(default=False)
@@ -23,21 +57,12 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"{self.user.username}'s Profile"
 
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        
-        # Resize avatar image
-        if self.avatar:
-            img = Image.open(self.avatar.path)
-            if img.height > 300 or img.width > 300:
-                output_size = (300, 300)
-                img.thumbnail(output_size)
-                img.save(self.avatar.path)
-
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
     color = models.CharField(max_length=7, default='#3B82F6')  # Hex color code
+    # Published posts in this category, maintained by news.catalog
+    published_posts_count = models.IntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -46,7 +71,7 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
-class Post(models.Model):
+class Post(TracksImageChanges, models.Model):
     VISIBILITY_CHOICES = [
         ('public', 'Public'),
         ('private', 'Private'),
@@ -57,7 +82,8 @@ class Post(models.Model):
     title = models.CharField(max_length=200)
     content = models.TextField()
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
-    image = models.ImageField(upload_to='posts/', null=True, blank=True)
+    image = models.ImageField(upload_to='posts/', null=True, blank=True, storage=get_content_storage)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     visibility = models.CharField(max_length=10, choices=VISIBILITY_CHOICES, default='public')
     is_featured = models.BooleanField(default=False)
     is_published = models.BooleanField(default=True)
@@ -65,29 +91,42 @@ class Post(models.Model):
     comments_count = models.IntegerField(default=0)
     shares_count = models.IntegerField(default=0)
     views_count = models.IntegerField(default=0)
+    # Bumped by every change to the comment thread, so the post's ETag is a
+    # lookup of this row rather than an aggregate over its comments
+    thread_version = models.PositiveIntegerField(default=0, editable=False)
+    # Weighted title/content tsvector, kept up to date by a database trigger
+    search_vector = SearchVectorField(null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['is_published', '-created_at', '-id'], name='post_published_created_idx'),
+            models.Index(fields=['author', '-created_at', '-id'], name='post_author_created_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='post_category_created_idx'),
+            GinIndex(fields=['search_vector'], name='post_search_vector_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title} by {self.author.username}"
 
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        
-        # Resize post image
-        if self.image:
-            img = Image.open(self.image.path)
-            if img.height > 800 or img.width > 800:
-                output_size = (800, 800)
-                img.thumbnail(output_size)
-                img.save(self.image.path)
-
-class PostImage(models.Model):
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember which category count this row contributes to, so a save
+        # can tell whether it was published, unpublished or moved
+        if 'category_id' in field_names and 'is_published' in field_names:
+            instance._counted_category_id = instance.category_id if instance.is_published else None
+        # And whether followers' timelines have it, so publishing a draft fans it out
+        if 'is_published' in field_names and 'visibility' in field_names:
+            instance._in_timelines = instance.is_published and instance.visibility != 'private'
+        return instance
+
+class PostImage(TracksImageChanges, models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='additional_images')
-    image = models.ImageField(upload_to='posts/gallery/')
+    image = models.ImageField(upload_to='posts/gallery/', storage=get_content_storage)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     caption = models.CharField(max_length=200, blank=True)
     order = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -113,6 +152,10 @@ class Comment(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
+    # Materialized path of zero-padded ancestor ids ending with this comment's
+    # own id, e.g. "0000000012/0000000345", so a whole thread sorts in one query
+    path = models.TextField(blank=True, default='', editable=False)
+    depth = models.PositiveIntegerField(default=0, editable=False)
     content = models.TextField()
     likes_count = models.IntegerField(default=0)
     is_edited = models.BooleanField(default=False)
@@ -121,10 +164,26 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['post', 'path'], name='comment_post_path_idx'),
+            models.Index(fields=['path'], name='comment_path_idx', opclasses=['text_pattern_ops']),
+        ]
 
     def __str__(self):
         return f"Comment by {self.author.username} on {self.post.title}"
 
+    def save(self, *args, **kwargs):
+        is_new = self._state.adding
+        if is_new and self.parent_id:
+            self.depth = self.parent.depth + 1
+        super().save(*args, **kwargs)
+
+        # The path ends with our own id, so it can only be set after the insert
+        if is_new and not self.path:
+            segment = f'{self.pk:010d}'
+            self.path = f'{self.parent.path}/{segment}' if self.parent_id else segment
+            Comment.objects.filter(pk=self.pk).update(path=self.path)
+
 class CommentLike(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     comment = models.ForeignKey(Comment, on_delete=models.CASCADE, related_name='comment_likes')
@@ -178,10 +237,256 @@ class Notification(models.Model):
     comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True, blank=True)
     message = models.CharField(max_length=255)
     is_read = models.BooleanField(default=False)
+    # Unread events with the same group key in the same window are merged
+    # into one row; sender/message describe the latest of them and
+    # updated_at moves to its time, while created_at (the partition key)
+    # stays that of the first (see news.notifications)
+    group_key = models.CharField(max_length=64, blank=True, default='')
+    window_start = models.DateTimeField(null=True, blank=True)
+    actor_count = models.PositiveIntegerField(default=1)
+    recent_actor_ids = ArrayField(models.IntegerField(), default=list, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
-        ordering = ['-created_at']
+        # The table is range-partitioned by month on created_at, with
+        # primary key (id, created_at); see news.notification_partitions
+        ordering = ['-updated_at']
+        indexes = [
+            models.Index(fields=['recipient', '-updated_at', '-id'], name='notif_recipient_updated_idx'),
+            models.Index(
+                fields=['recipient', '-created_at'], name='notif_unread_recipient_idx', condition=Q(is_read=False)
+            ),
+            models.Index(
+                fields=['recipient', 'group_key', 'window_start'],
+                name='notif_unread_group_idx',
+                condition=Q(is_read=False) & ~Q(group_key=''),
+            ),
+        ]
 
     def __str__(self):
         return f"Notification for {self.recipient.username}: {self.message}"
+
+
+class TimelineEntry(models.Model):
+    """
+    A post in a user's home timeline, written when a followed author posts.
+
+    created_at mirrors the post's creation time so the feed is read as a
+    range scan over the (user, created_at) index.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    created_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-created_at']
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='timeline_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.post.title} in {self.user.username}'s timeline"
+
+
+class CounterShard(models.Model):
+    """
+    One slice of a hot denormalized counter.
+
+    Writers bump a random shard instead of the post/comment row, so a burst
+    of likes does not queue on one row lock. fold_counters periodically moves
+    the shard totals into the counter column on the target row.
+    """
+    TARGET_CHOICES = [
+        ('post', 'Post'),
+        ('comment', 'Comment'),
+    ]
+    METRIC_CHOICES = [
+        ('likes_count', 'Likes'),
+        ('comments_count', 'Comments'),
+        ('shares_count', 'Shares'),
+    ]
+
+    target = models.CharField(max_length=10, choices=TARGET_CHOICES)
+    object_id = models.BigIntegerField()
+    metric = models.CharField(max_length=20, choices=METRIC_CHOICES)
+    shard = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('target', 'object_id', 'metric', 'shard')
+        indexes = [
+            models.Index(fields=['id'], condition=~Q(count=0), name='countershard_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.target} {self.object_id} {self.metric}[{self.shard}] = {self.count}"
+
+
+class Watermark(models.Model):
+    """
+    Progress marker for incremental maintenance commands: everything
+    created before `value` has already been processed by `name`.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    value = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.value}"
+
+
+class UserStats(models.Model):
+    """
+    Dashboard totals for one user, kept current by the code paths that
+    change the underlying counters (see news.user_stats) so dashboards read
+    a single row instead of aggregating the user's posts.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    posts_count = models.IntegerField(default=0)
+    likes_received = models.IntegerField(default=0)
+    comments_received = models.IntegerField(default=0)
+    views_received = models.BigIntegerField(default=0)
+    unread_notifications = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "User stats"
+
+    def __str__(self):
+        return f"Stats for {self.user.username}"
+
+
+class PostDailyStats(models.Model):
+    """
+    Per-post, per-day activity for author trend charts. Likes, comments and
+    shares are rolled up from the event tables by `rollup_post_stats`; views
+    are added when buffered view counts are flushed.
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='daily_stats')
+    # Denormalized so an author's series is one index range scan
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='post_daily_stats')
+    day = models.DateField()
+    views = models.IntegerField(default=0)
+    likes = models.IntegerField(default=0)
+    comments = models.IntegerField(default=0)
+    shares = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('post', 'day')
+        indexes = [
+            models.Index(fields=['author', 'day'], name='postdailystats_author_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id} on {self.day}"
+
+
+class ResourceVersion(models.Model):
+    """
+    Version counter for a cacheable resource (e.g. the category catalog),
+    bumped whenever it changes so readers can validate caches with one
+    primary-key lookup.
+    """
+    key = models.CharField(max_length=100, primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.key} v{self.version}"
+
+
+class Job(models.Model):
+    """
+    A unit of deferred work, claimed by `manage.py run_workers` with
+    SELECT ... FOR UPDATE SKIP LOCKED (see news.jobs).
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    # Enqueueing again with the same key is a no-op while this row exists
+    idempotency_key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['run_at', 'id'], name='job_pending_idx', condition=Q(status='pending')),
+            models.Index(fields=['locked_at'], name='job_running_idx', condition=Q(status='running')),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status})"
+
+
+class MediaBlob(models.Model):
+    """
+    One stored file in news.storage's content-addressed storage, with the
+    number of image fields that reference it and the variants rendered
+    from it (see news.images), keyed by kind of image.
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    size = models.BigIntegerField(default=0)
+    ref_count = models.IntegerField(default=0)
+    variants = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Last upload or reference change; collection waits for a grace period after it
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['last_used_at'], name='mediablob_orphan_idx', condition=Q(ref_count__lte=0)),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
+
+class UploadSession(models.Model):
+    """
+    A resumable chunked upload (see news.chunked_uploads). Bytes are appended
+    to a part file until `offset` reaches `size`; finishing moves the file
+    into content-addressed storage as `name`, which posts and profiles can
+    then reference.
+    """
+    PENDING = 'pending'
+    COMPLETE = 'complete'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (COMPLETE, 'Complete'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    # Bytes received so far; the next chunk must start here
+    offset = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    name = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], name='upload_session_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
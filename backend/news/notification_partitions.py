@@ -0,0 +1,112 @@
+"""
+Monthly range partitions of the notifications table, keyed on created_at.
+
+Only the hot months (the current one and NOTIFICATION_HOT_MONTHS - 1
+before it) may hold unread notifications: `manage.py maintain_notifications`
+marks anything older read. Unread lookups and mark-all-read therefore
+filter on created_at >= hot_start(), and Postgres prunes every colder
+partition. Partitions past NOTIFICATION_RETENTION_MONTHS are detached
+into standalone archive tables, or dropped.
+"""
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+TABLE = 'news_notification'
+DEFAULT_PARTITION = f'{TABLE}_default'
+PARTITION_NAME = re.compile(rf'^{TABLE}_p(\d{{4}})_(\d{{2}})$')
+
+
+def month_start(when=None, offset=0):
+    """Midnight UTC on the first of the month `offset` months from `when`"""
+    when = when or timezone.now()
+    month_index = when.year * 12 + when.month - 1 + offset
+    return datetime(month_index // 12, month_index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def hot_start(when=None):
+    """Oldest created_at that can still be unread"""
+    return month_start(when, -(settings.NOTIFICATION_HOT_MONTHS - 1))
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month:%Y_%m}'
+
+
+def attached_partitions():
+    """{month: table name} for the monthly partitions currently attached"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent '
+            'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'WHERE parent.relname = %s',
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = {}
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions[datetime(int(match[1]), int(match[2]), 1, tzinfo=dt_timezone.utc)] = name
+    return partitions
+
+
+def create_partition(month):
+    """
+    Attach the partition for `month`, moving in any of its rows that were
+    written to the default partition because it did not exist yet.
+    """
+    name = partition_name(month)
+    bounds = [month, month_start(month, 1)]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE "{name}" (LIKE "{TABLE}" INCLUDING DEFAULTS)')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM "{DEFAULT_PARTITION}" WHERE created_at >= %s AND created_at < %s '
+            f'RETURNING *) INSERT INTO "{name}" SELECT * FROM moved',
+            bounds,
+        )
+        cursor.execute(
+            f'ALTER TABLE "{TABLE}" ATTACH PARTITION "{name}" FOR VALUES FROM (%s) TO (%s)',
+            bounds,
+        )
+    return name
+
+
+def ensure_partitions(ahead=2):
+    """Create any missing partitions from this month to `ahead` months out"""
+    existing = attached_partitions()
+    created = []
+    for offset in range(ahead + 1):
+        month = month_start(offset=offset)
+        if month not in existing:
+            created.append(create_partition(month))
+    return created
+
+
+def expire_partitions(drop=False):
+    """
+    Detach partitions older than the retention period. Detached tables are
+    kept under their own name as an archive unless `drop` is set.
+    """
+    cutoff = month_start(offset=-(settings.NOTIFICATION_RETENTION_MONTHS - 1))
+    expired = [name for month, name in sorted(attached_partitions().items()) if month < cutoff]
+    with connection.cursor() as cursor:
+        for name in expired:
+            with transaction.atomic():
+                cursor.execute(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{name}"')
+                if drop:
+                    cursor.execute(f'DROP TABLE "{name}"')
+                    continue
+                # Archived rows must not stop users, posts or comments being deleted
+                cursor.execute(
+                    "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+                    [f'"{name}"'],
+                )
+                for (constraint,) in cursor.fetchall():
+                    cursor.execute(f'ALTER TABLE "{name}" DROP CONSTRAINT "{constraint}"')
+    return expired
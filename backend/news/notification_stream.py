@@ -0,0 +1,298 @@
+"""
+Live notifications over Server-Sent Events.
+
+Writers call publish() after a notification is created or merged, which
+issues a Postgres NOTIFY carrying only the recipient's id. Each worker
+process runs one NotificationHub: a single LISTEN connection whose
+messages wake the streams of the matching users.
+
+A wake-up is just a flag, never a queued message: the stream then reads
+everything newer than its cursor from the database. A slow client
+therefore holds no backlog in memory, bursts collapse into one read, and
+resuming from Last-Event-ID is the same query as a wake-up.
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.db import close_old_connections, connection, connections
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from .models import Notification, UserStats
+
+logger = logging.getLogger(__name__)
+
+# Signing namespace of stream tickets, so no other signed value passes as one
+TICKET_SALT = 'news.notification_stream.ticket'
+
+CHANNEL = 'news_notifications'
+
+# Notifications sent per database read; a long resume is read in batches
+BATCH_SIZE = 50
+
+# Seconds before reopening a LISTEN connection that failed
+RECONNECT_DELAY = 5
+
+# How long browsers wait before reconnecting a dropped stream, in ms
+CLIENT_RETRY_MS = 3000
+
+
+def publish(recipient_id):
+    """Wake the recipient's open streams once the current transaction commits"""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, str(recipient_id)])
+
+
+class NotificationHub:
+    """
+    Fans NOTIFY messages out to the streams subscribed in this event loop.
+    The LISTEN connection is opened for the first subscriber and closed
+    after the last one leaves.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.subscribers = {}
+        self.connection = None
+        self._connecting = None
+
+    @property
+    def client_count(self):
+        return sum(len(events) for events in self.subscribers.values())
+
+    async def subscribe(self, user_id):
+        event = asyncio.Event()
+        self.subscribers.setdefault(user_id, set()).add(event)
+        if self.connection is None:
+            await self._ensure_connected()
+        return event
+
+    def unsubscribe(self, user_id, event):
+        events = self.subscribers.get(user_id)
+        if events is not None:
+            events.discard(event)
+            if not events:
+                del self.subscribers[user_id]
+        if not self.subscribers:
+            self._close()
+
+    async def _ensure_connected(self):
+        # Concurrent first subscribers share one connection attempt
+        if self._connecting is None:
+            self._connecting = asyncio.ensure_future(self._connect())
+        try:
+            await asyncio.shield(self._connecting)
+        finally:
+            self._connecting = None
+
+    async def _connect(self):
+        try:
+            raw = await self.loop.run_in_executor(None, self._open)
+        except Exception:
+            logger.exception('Could not LISTEN for notifications; retrying in %ss', RECONNECT_DELAY)
+            self.loop.call_later(RECONNECT_DELAY, self._reconnect)
+            return
+        if not self.subscribers:
+            raw.close()
+            return
+        self.connection = raw
+        self.loop.add_reader(raw.fileno(), self._on_readable)
+        # Anything published while we were not listening is picked up by a re-read
+        self._wake_all()
+
+    def _open(self):
+        wrapper = connections['default']
+        raw = wrapper.get_new_connection(wrapper.get_connection_params())
+        raw.autocommit = True
+        with raw.cursor() as cursor:
+            cursor.execute(f'LISTEN {CHANNEL}')
+        return raw
+
+    def _close(self):
+        if self.connection is None:
+            return
+        self.loop.remove_reader(self.connection.fileno())
+        try:
+            self.connection.close()
+        except Exception:
+            pass
+        self.connection = None
+
+    def _reconnect(self):
+        if self.subscribers and self.connection is None:
+            asyncio.ensure_future(self._ensure_connected())
+
+    def _on_readable(self):
+        try:
+            self.connection.poll()
+        except Exception:
+            logger.exception('Lost the notification LISTEN connection')
+            self._close()
+            self.loop.call_later(RECONNECT_DELAY, self._reconnect)
+            return
+
+        while self.connection.notifies:
+            message = self.connection.notifies.pop(0)
+            try:
+                user_id = int(message.payload)
+            except ValueError:
+                continue
+            for event in self.subscribers.get(user_id, ()):
+                event.set()
+
+    def _wake_all(self):
+        for events in self.subscribers.values():
+            for event in events:
+                event.set()
+
+
+_hubs = {}
+
+
+def get_hub():
+    """The hub for the running event loop (one per worker process under uvicorn)"""
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        for stale in [other for other in _hubs if other.is_closed()]:
+            del _hubs[stale]
+        hub = _hubs[loop] = NotificationHub(loop)
+    return hub
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def format_cursor(notification):
+    micros = (notification.updated_at - EPOCH) // timedelta(microseconds=1)
+    return f'{micros}-{notification.pk}'
+
+
+def parse_cursor(value):
+    """(updated_at, id) from a Last-Event-ID, or None if it is not one of ours"""
+    try:
+        micros, pk = value.split('-')
+        updated_at = EPOCH + timedelta(microseconds=int(micros))
+        return updated_at, int(pk)
+    except (AttributeError, ValueError, OverflowError, OSError):
+        return None
+
+
+def sse(data, event=None, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event is not None:
+        lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def _start_cursor(user):
+    """Streams without Last-Event-ID begin after the newest notification"""
+    latest = Notification.objects.filter(recipient=user).order_by('-updated_at', '-id').first()
+    return (latest.updated_at, latest.pk) if latest else (timezone.now(), 0)
+
+
+def _read_since(user, cursor):
+    """The next batch of notifications after cursor, serialized, plus the unread count"""
+    from .notifications import resolve_actors
+    from .serializers import NotificationSerializer
+
+    close_old_connections()
+    updated_at, pk = cursor
+    page = list(
+        Notification.objects.filter(recipient=user)
+        .filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=pk))
+        .select_related('sender__profile', 'post')
+        .order_by('updated_at', 'id')[:BATCH_SIZE]
+    )
+    data = NotificationSerializer(page, many=True, context={'actors': resolve_actors(page)}).data
+    unread = UserStats.objects.filter(pk=user.pk).values_list('unread_notifications', flat=True).first()
+    return list(zip(page, data)), unread or 0
+
+
+# Reads run on the shared executor rather than a thread per stream, so
+# database connections are bounded by the pool size, not by open streams
+read_since = sync_to_async(_read_since, thread_sensitive=False)
+
+
+def issue_ticket(user):
+    """
+    A signed ticket that opens only this user's stream, for EventSource,
+    which cannot send headers. It expires after
+    NOTIFICATION_STREAM_TICKET_TTL seconds, so unlike an access token it is
+    of no use to anyone reading it from a URL in a log later.
+    """
+    return signing.dumps({'user': user.pk}, salt=TICKET_SALT)
+
+
+def authenticate(request):
+    """The user from a JWT in the Authorization header or a `ticket` query parameter"""
+    ticket = request.GET.get('ticket')
+    if ticket:
+        try:
+            user_id = signing.loads(ticket, salt=TICKET_SALT, max_age=settings.NOTIFICATION_STREAM_TICKET_TTL)['user']
+        except (signing.BadSignature, KeyError, TypeError):
+            return None
+        return User.objects.filter(pk=user_id, is_active=True).first()
+
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    raw_token = auth.get_raw_token(header) if header else None
+    if not raw_token:
+        return None
+    try:
+        return auth.get_user(auth.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+async def stream(user, last_event_id=None):
+    """
+    Yield SSE frames for the user's notifications until the client leaves.
+
+    Merged notifications are sent again with their new contents; clients
+    should replace any notification they already have with the same id.
+    """
+    hub = get_hub()
+    event = await hub.subscribe(user.pk)
+    try:
+        yield f'retry: {CLIENT_RETRY_MS}\n\n'
+        cursor = parse_cursor(last_event_id) if last_event_id else None
+        if cursor is None:
+            cursor = await sync_to_async(_start_cursor)(user)
+        event.set()
+
+        while True:
+            try:
+                await asyncio.wait_for(event.wait(), timeout=settings.NOTIFICATION_STREAM_HEARTBEAT)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing an idle connection
+                yield ': heartbeat\n\n'
+                if hub.connection is not None:
+                    continue
+                # Not listening right now; fall back to polling on the heartbeat
+
+            # Cleared before reading so a NOTIFY arriving mid-read wakes us again
+            event.clear()
+            unread = None
+            while True:
+                batch, unread = await read_since(user, cursor)
+                for notification, data in batch:
+                    cursor = (notification.updated_at, notification.pk)
+                    yield sse(data, event='notification', event_id=format_cursor(notification))
+                if len(batch) < BATCH_SIZE:
+                    break
+            yield sse({'count': unread}, event='unread')
+    finally:
+        hub.unsubscribe(user.pk, event)
@@ -0,0 +1,187 @@
+import hashlib
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, Func, IntegerField, Value, When
+from django.contrib.auth.models import User
+from django.contrib.postgres.fields import ArrayField
+from django.utils import timezone
+
+from .models import Comment, Notification, Post
+from . import jobs, notification_stream, user_stats
+from .images import avatar_url
+from .notification_partitions import hot_start
+
+# How many of the latest actors a grouped notification remembers by id
+RECENT_ACTORS = 3
+
+# What each notification type says after the actor names
+VERBS = {
+    'like': 'liked your post',
+    'comment': 'commented on your post',
+    'share': 'shared your post',
+    'follow': 'started following you',
+}
+
+
+def group_key(notification_type, post=None):
+    """Events that share a key are merged, e.g. every like on one post"""
+    if notification_type not in VERBS:
+        return ''
+    return f'{notification_type}:{post.pk}' if post is not None else notification_type
+
+
+def window_start(when):
+    window = settings.NOTIFICATION_GROUP_WINDOW
+    epoch = int(when.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % window, tz=dt_timezone.utc)
+
+
+def _with_recent_actor(actor_id):
+    """SQL: the actor first, then the other recent actors, capped"""
+    actors = Func(
+        Value(actor_id),
+        Func(F('recent_actor_ids'), Value(actor_id), function='array_remove'),
+        function='array_prepend',
+        output_field=ArrayField(IntegerField()),
+    )
+    return Func(actors, template=f'(%(expressions)s)[1:{RECENT_ACTORS}]', output_field=ArrayField(IntegerField()))
+
+
+def notify_later(event_key, recipient, sender, notification_type, message, post=None, comment=None):
+    """
+    Queue notify() for a background worker. `event_key` names the event
+    (e.g. 'like:42') so a retried request cannot notify twice.
+    """
+    jobs.enqueue(
+        'notifications.deliver',
+        {
+            'recipient_id': recipient.pk,
+            'sender_id': sender.pk,
+            'notification_type': notification_type,
+            'message': message,
+            'post_id': post.pk if post is not None else None,
+            'comment_id': comment.pk if comment is not None else None,
+        },
+        idempotency_key=f'notify:{event_key}',
+    )
+
+
+@jobs.task('notifications.deliver')
+def deliver(recipient_id, sender_id, notification_type, message, post_id=None, comment_id=None):
+    users = User.objects.in_bulk([recipient_id, sender_id])
+    post = Post.objects.filter(pk=post_id).first() if post_id else None
+    comment = Comment.objects.filter(pk=comment_id).first() if comment_id else None
+    if recipient_id not in users or sender_id not in users or (post_id and post is None):
+        # Deleted before the job ran; nothing left to notify about
+        return
+    notify(users[recipient_id], users[sender_id], notification_type, message, post=post, comment=comment)
+
+
+def notify(recipient, sender, notification_type, message, post=None, comment=None):
+    """
+    Record an event for the recipient, merging it into their unread
+    notification for the same target and window when there is one.
+
+    The merge is a single UPDATE, falling back to an INSERT under an
+    advisory lock for the group (the partitioned table cannot carry a
+    unique constraint without created_at). A merge moves updated_at, which
+    lists and the stream order on, and leaves created_at, and so the row's
+    partition, alone.
+    Returns True if a new notification was created.
+    """
+    now = timezone.now()
+    key = group_key(notification_type, post)
+    if not key:
+        _create(recipient, sender, notification_type, message, post, comment)
+        notification_stream.publish(recipient.pk)
+        return True
+
+    window = window_start(now)
+    group = Notification.objects.filter(
+        recipient=recipient, group_key=key, window_start=window, is_read=False
+    )
+    merge = {
+        'sender': sender,
+        'message': message,
+        'comment': comment,
+        'updated_at': now,
+        # Repeat actors are only recognised while among the recent ones
+        'actor_count': Case(
+            When(recent_actor_ids__contains=[sender.pk], then=F('actor_count')),
+            default=F('actor_count') + 1,
+        ),
+        'recent_actor_ids': _with_recent_actor(sender.pk),
+    }
+    created = False
+    if not group.update(**merge):
+        # Serialize writers of this group so only one inserts its row
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)', [_lock_id(recipient.pk, key, window)])
+            if not group.update(**merge):
+                _create(recipient, sender, notification_type, message, post, comment, key, window)
+                created = True
+    notification_stream.publish(recipient.pk)
+    return created
+
+
+def _lock_id(recipient_id, key, window):
+    digest = hashlib.blake2b(f'{recipient_id}:{key}:{window.isoformat()}'.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def _create(recipient, sender, notification_type, message, post, comment, key='', window=None):
+    Notification.objects.create(
+        recipient=recipient,
+        sender=sender,
+        notification_type=notification_type,
+        post=post,
+        comment=comment,
+        message=message,
+        group_key=key,
+        window_start=window,
+        recent_actor_ids=[sender.pk],
+    )
+    user_stats.bump(recipient.pk, unread_notifications=1)
+
+
+def summary(notification, sender_name):
+    """'alice and 312 others liked your post'"""
+    verb = VERBS.get(notification.notification_type)
+    others = notification.actor_count - 1
+    if not verb or others < 1:
+        return notification.message
+    return f"{sender_name} and {others} other{'s' if others > 1 else ''} {verb}"
+
+
+def actors_query(notifications):
+    actor_ids = {actor_id for notification in notifications for actor_id in notification.recent_actor_ids}
+    return User.objects.filter(id__in=actor_ids).select_related('profile')
+
+
+def actor_entry(user):
+    return {'id': user.pk, 'username': user.username, 'avatar': avatar_url(getattr(user, 'profile', None))}
+
+
+def resolve_actors(notifications):
+    """{user_id: {'id', 'username', 'avatar'}} for every recent actor, in one query"""
+    return {user.pk: actor_entry(user) for user in actors_query(notifications)}
+
+
+async def aresolve_actors(notifications):
+    return {user.pk: actor_entry(user) async for user in actors_query(notifications)}
+
+
+def mark_read(recipient, notifications):
+    """
+    Mark some of a recipient's notifications read, keeping the unread count
+    in step. Only the hot partitions can hold unread rows, so the UPDATE
+    never touches older ones.
+    """
+    updated = notifications.filter(
+        recipient=recipient, is_read=False, created_at__gte=hot_start()
+    ).update(is_read=True)
+    user_stats.bump(recipient.pk, unread_notifications=-updated)
+    return updated
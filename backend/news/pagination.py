@@ -0,0 +1,99 @@
+from rest_framework.pagination import CursorPagination
+
+
+class PageQuery:
+    """
+    Stands in for a queryset while CursorPagination.paginate_queryset()
+    runs. Ordering and filtering pass through; slicing out the page records
+    the query in `sliced` instead of running it and answers with `rows`.
+    """
+
+    def __init__(self, queryset, rows=(), sliced=None):
+        self.queryset = queryset
+        self.rows = list(rows)
+        self.sliced = [] if sliced is None else sliced
+
+    def _wrap(self, queryset):
+        return PageQuery(queryset, self.rows, self.sliced)
+
+    def order_by(self, *fields):
+        return self._wrap(self.queryset.order_by(*fields))
+
+    def filter(self, *args, **kwargs):
+        return self._wrap(self.queryset.filter(*args, **kwargs))
+
+    def __getitem__(self, key):
+        self.sliced.append(self.queryset[key])
+        return self.rows
+
+    def __getattr__(self, name):
+        return getattr(self.queryset, name)
+
+
+class AsyncCursorPagination(CursorPagination):
+    """
+    CursorPagination that can also read its page through the async ORM.
+
+    DRF's paginate_queryset() runs twice: once over a PageQuery to build
+    the page's query, which is then fetched asynchronously, and once more
+    to paginate the fetched rows. Only the fetch differs from DRF's own.
+    """
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        probe = PageQuery(queryset)
+        if self.paginate_queryset(probe, request, view) is None:
+            return None
+        rows = [row async for row in probe.sliced[-1]]
+        return self.paginate_queryset(PageQuery(queryset, rows), request, view)
+
+    def get_paginated_data(self, data):
+        """The body get_paginated_response() would render"""
+        return {'next': self.get_next_link(), 'previous': self.get_previous_link(), 'results': data}
+
+
+class PostCursorPagination(AsyncCursorPagination):
+    """
+    Keyset pagination over posts, newest first.
+
+    The cursor encodes the last seen created_at, so each page is an index
+    range scan instead of an OFFSET that grows with the page number.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+
+
+class NotificationCursorPagination(AsyncCursorPagination):
+    """
+    Keyset pagination over a user's notifications, most recently updated
+    first.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-updated_at', '-id')
+
+
+class TimelineCursorPagination(CursorPagination):
+    """
+    Keyset pagination over a user's timeline entries, newest first.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+
+
+class SearchCursorPagination(CursorPagination):
+    """
+    Keyset pagination over ranked search results, best match first.
+    Ranking always wins over any ?ordering= on the view.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+    ordering = ('-rank', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        return self.ordering
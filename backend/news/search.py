@@ -0,0 +1,75 @@
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector
+from django.contrib.auth.models import User
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Post
+
+# Text search configuration used by the trigger, the backfill and queries
+SEARCH_CONFIG = 'english'
+
+
+def post_search_vector():
+    """Same weighting as the news_post trigger: title over content"""
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('content', weight='B', config=SEARCH_CONFIG)
+    )
+
+
+def parse_query(text):
+    """Accept web-search syntax: quoted phrases, OR, -exclusions"""
+    return SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+
+
+def filter_posts(queryset, text):
+    """
+    Posts whose text matches, or whose author's username contains the text,
+    as SearchFilter's author__username did (the trigram index serves it)
+    """
+    authors = User.objects.filter(username__icontains=text).values('pk')
+    return queryset.filter(Q(search_vector=parse_query(text)) | Q(author__in=authors))
+
+
+def rank_posts(queryset, text):
+    """Matching posts annotated with `rank`, best match first"""
+    query = parse_query(text)
+    # ts_rank returns a real; casting keeps cursor positions exact
+    rank = Cast(SearchRank(F('search_vector'), query), FloatField())
+    return queryset.filter(search_vector=query).annotate(rank=rank).order_by('-rank', '-id')
+
+
+def attach_snippets(posts, text):
+    """
+    Set highlighted `title_snippet`/`snippet` on a page of posts. Runs as a
+    separate query so ts_headline only processes the rows being returned.
+    """
+    posts = list(posts)
+    query = parse_query(text)
+    options = {'start_sel': '<mark>', 'stop_sel': '</mark>', 'config': SEARCH_CONFIG}
+    snippets = {
+        pk: (title_snippet, snippet)
+        for pk, title_snippet, snippet in Post.objects.filter(pk__in=[post.pk for post in posts]).annotate(
+            title_snippet=SearchHeadline('title', query, highlight_all=True, **options),
+            snippet=SearchHeadline('content', query, max_words=35, min_words=15, max_fragments=2, **options),
+        ).values_list('pk', 'title_snippet', 'snippet')
+    }
+    for post in posts:
+        post.title_snippet, post.snippet = snippets.get(post.pk, (post.title, ''))
+    return posts
+
+
+class FullTextSearchFilter(BaseFilterBackend):
+    """
+    ?search= backed by the indexed search_vector instead of ILIKE scans,
+    plus posts by matching authors. Keeps the view's ordering; use
+    /posts/search/ for ranked results.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '').strip()
+        if not text:
+            return queryset
+        return filter_posts(queryset, text)
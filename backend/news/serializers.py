@@ -3,8 +3,46 @@ from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from .models import (
     UserProfile, Category, Post, PostImage, Like, Comment, 
-    CommentLike, Share, Follow, Notification
+    CommentLike, Share, Follow, Notification, UploadSession
 )
+from .comment_tree import load_replies, load_post_tree, tree_from_nodes
+from .images import avatar_url, variant_urls
+from .uploads import check_images, save_gallery
+from .notifications import summary as notification_summary
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    {variant: {'width', 'height', 'formats': {format: url}}} for an image;
+    empty until the resized copies have been rendered
+    """
+
+    def to_representation(self, value):
+        return variant_urls(value)
+
+
+class UploadField(serializers.PrimaryKeyRelatedField):
+    """
+    A finished chunked upload of the requesting user, by session id;
+    validates to the stored file's name
+    """
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(
+            user=self.context['request'].user, status=UploadSession.COMPLETE
+        )
+
+    def to_internal_value(self, data):
+        return super().to_internal_value(data).name
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    size = serializers.IntegerField(min_value=1)
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'size', 'offset', 'status', 'created_at', 'expires_at']
+        read_only_fields = ['offset', 'status', 'expires_at']
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -24,12 +62,15 @@ class UserProfileSerializer(serializers.ModelSerializer):
     first_name = serializers.CharField(source='user.first_name', read_only=True)
     last_name = serializers.CharField(source='user.last_name', read_only=True)
     full_name = serializers.SerializerMethodField()
+    avatar_variants = ImageVariantsField()
+    cover_photo_variants = ImageVariantsField()
     
     class Meta:
         model = UserProfile
         fields = [
             'id', 'username', 'email', 'first_name', 'last_name', 'full_name',
-            'bio', 'location', 'birth_date', 'avatar', 'cover_photo', 'website',
+            'bio', 'location', 'birth_date', 'avatar', 'avatar_variants',
+            'cover_photo', 'cover_photo_variants', 'website',
             'phone', 'is_verified', 'followers_count', 'following_count', 
             'posts_count', 'created_at', 'updated_at'
         ]
@@ -43,12 +84,16 @@ class UserUpdateSerializer(serializers.ModelSerializer):
     first_name = serializers.CharField(source='user.first_name')
     last_name = serializers.CharField(source='user.last_name')
     email = serializers.EmailField(source='user.email')
+    # Alternatives to avatar/cover_photo for files sent as chunked uploads
+    avatar_upload = UploadField(source='avatar', write_only=True, required=False)
+    cover_photo_upload = UploadField(source='cover_photo', write_only=True, required=False)
     
     class Meta:
         model = UserProfile
         fields = [
             'first_name', 'last_name', 'email', 'bio', 'location', 
-            'birth_date', 'avatar', 'cover_photo', 'website', 'phone'
+            'birth_date', 'avatar', 'avatar_upload', 'cover_photo', 'cover_photo_upload',
+            'website', 'phone'
         ]
 
     def update(self, instance, validated_data):
@@ -68,61 +113,102 @@ class UserUpdateSerializer(serializers.ModelSerializer):
 
 
 class CategorySerializer(serializers.ModelSerializer):
-    posts_count = serializers.SerializerMethodField()
+    posts_count = serializers.IntegerField(source='published_posts_count', read_only=True)
     
     class Meta:
         model = Category
         fields = ['id', 'name', 'description', 'color', 'posts_count', 'created_at']
-    
-    def get_posts_count(self, obj):
-        return obj.post_set.filter(is_published=True).count()
 
 
 class PostImageSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = PostImage
-        fields = ['id', 'image', 'caption', 'order', 'created_at']
+        fields = ['id', 'image', 'image_variants', 'caption', 'order', 'created_at']
 
 
 class CommentSerializer(serializers.ModelSerializer):
     author_username = serializers.CharField(source='author.username', read_only=True)
     author_avatar = serializers.SerializerMethodField()
     replies = serializers.SerializerMethodField()
+    more_replies = serializers.SerializerMethodField()
+    replies_cursor = serializers.SerializerMethodField()
     is_liked = serializers.SerializerMethodField()
     
     class Meta:
         model = Comment
         fields = [
             'id', 'author', 'author_username', 'author_avatar', 'post', 
-            'parent', 'content', 'likes_count', 'is_edited', 'is_liked',
-            'replies', 'created_at', 'updated_at'
+            'parent', 'depth', 'content', 'likes_count', 'is_edited', 'is_liked',
+            'replies', 'more_replies', 'replies_cursor', 'created_at', 'updated_at'
         ]
         read_only_fields = ['author', 'likes_count', 'is_edited']
 
     def get_author_avatar(self, obj):
-        if hasattr(obj.author, 'profile') and obj.author.profile.avatar:
-            return obj.author.profile.avatar.url
-        return None
+        return avatar_url(getattr(obj.author, 'profile', None))
+
+    def _ensure_tree(self, obj):
+        # Comments from a tree load already carry their replies
+        if not hasattr(obj, 'tree_replies'):
+            load_replies([obj])
 
     def get_replies(self, obj):
-        if obj.replies.exists():
-            return CommentSerializer(obj.replies.all(), many=True, context=self.context).data
-        return []
+        self._ensure_tree(obj)
+        return CommentSerializer(obj.tree_replies, many=True, context=self.context).data
+
+    def get_more_replies(self, obj):
+        self._ensure_tree(obj)
+        return obj.more_replies
+
+    def get_replies_cursor(self, obj):
+        self._ensure_tree(obj)
+        return obj.replies_cursor
 
     def get_is_liked(self, obj):
+        viewer = self.context.get('viewer')
+        if viewer is not None:
+            return viewer.has_liked_comment(obj)
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return CommentLike.objects.filter(user=request.user, comment=obj).exists()
         return False
 
 
-class PostSerializer(serializers.ModelSerializer):
+class DynamicFieldsMixin:
+    """
+    Lets a view narrow the rendered fields with `fields=` and pull in
+    fields listed in Meta.deferred_fields only when explicitly expanded.
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is None:
+            fields = self.select_fields()
+        for name in set(self.fields) - set(fields):
+            self.fields.pop(name)
+
+    @classmethod
+    def select_fields(cls, fields=None, expand=()):
+        """Resolve ?fields= and ?expand= into the set of fields to render"""
+        available = set(cls.Meta.fields)
+        if fields:
+            selected = available & set(fields)
+        else:
+            selected = available - set(getattr(cls.Meta, 'deferred_fields', ()))
+        selected |= available & set(expand)
+        selected.add('id')
+        return selected
+
+
+class PostSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     author_username = serializers.CharField(source='author.username', read_only=True)
     author_avatar = serializers.SerializerMethodField()
     category_name = serializers.CharField(source='category.name', read_only=True)
     category_color = serializers.CharField(source='category.color', read_only=True)
+    image_variants = ImageVariantsField()
     additional_images = PostImageSerializer(many=True, read_only=True)
-    comments = CommentSerializer(many=True, read_only=True)
+    comments = serializers.SerializerMethodField()
     is_liked = serializers.SerializerMethodField()
     time_since_posted = serializers.SerializerMethodField()
     
@@ -130,8 +216,8 @@ class PostSerializer(serializers.ModelSerializer):
         model = Post
         fields = [
             'id', 'author', 'author_username', 'author_avatar', 'title', 'content',
-            'category', 'category_name', 'category_color', 'image', 'additional_images',
-            'visibility', 'is_featured', 'is_published', 'likes_count', 'comments_count',
+            'category', 'category_name', 'category_color', 'image', 'image_variants',
+            'additional_images', 'visibility', 'is_featured', 'is_published', 'likes_count', 'comments_count',
             'shares_count', 'views_count', 'is_liked', 'time_since_posted',
             'comments', 'created_at', 'updated_at'
         ]
@@ -140,16 +226,23 @@ class PostSerializer(serializers.ModelSerializer):
         ]
 
     def get_author_avatar(self, obj):
-        if hasattr(obj.author, 'profile') and obj.author.profile.avatar:
-            return obj.author.profile.avatar.url
-        return None
+        return avatar_url(getattr(obj.author, 'profile', None))
 
     def get_is_liked(self, obj):
+        viewer = self.context.get('viewer')
+        if viewer is not None:
+            return viewer.has_liked_post(obj)
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return Like.objects.filter(user=request.user, post=obj).exists()
         return False
 
+    def get_comments(self, obj):
+        # Prefer the page-wide prefetch set up by PostViewSet
+        nodes = getattr(obj, 'comment_tree_nodes', None)
+        roots = tree_from_nodes(nodes) if nodes is not None else load_post_tree(obj.pk)
+        return CommentSerializer(roots, many=True, context=self.context).data
+
     def get_time_since_posted(self, obj):
         from django.utils import timezone
         from datetime import datetime, timedelta
@@ -169,30 +262,57 @@ class PostSerializer(serializers.ModelSerializer):
             return "Just now"
 
 
+class PostListSerializer(PostSerializer):
+    """
+    Feed representation of a post. The nested comment tree is only
+    rendered when requested with ?expand=comments.
+    """
+
+    class Meta(PostSerializer.Meta):
+        deferred_fields = ['comments']
+
+
+class PostSearchResultSerializer(PostListSerializer):
+    """
+    A search hit: the feed representation plus its rank and highlighted
+    title/content snippets (matches wrapped in <mark>).
+    """
+    rank = serializers.FloatField(read_only=True)
+    title_snippet = serializers.CharField(read_only=True)
+    snippet = serializers.CharField(read_only=True)
+
+    class Meta(PostListSerializer.Meta):
+        fields = PostListSerializer.Meta.fields + ['rank', 'title_snippet', 'snippet']
+
+
 class PostCreateSerializer(serializers.ModelSerializer):
+    # Checked together in check_images() rather than one at a time by ImageField
     additional_images = serializers.ListField(
-        child=serializers.ImageField(), write_only=True, required=False
+        child=serializers.FileField(), write_only=True, required=False
+    )
+    # Chunked uploads, by session id, in place of (or after) the files above
+    image_upload = UploadField(source='image', write_only=True, required=False)
+    additional_image_uploads = serializers.ListField(
+        child=UploadField(), write_only=True, required=False
     )
     
     class Meta:
         model = Post
         fields = [
-            'title', 'content', 'category', 'image', 'additional_images',
-            'visibility', 'is_published'
+            'title', 'content', 'category', 'image', 'image_upload', 'additional_images',
+            'additional_image_uploads', 'visibility', 'is_published'
         ]
 
+    def validate_additional_images(self, value):
+        check_images(value)
+        return value
+
     def create(self, validated_data):
         additional_images = validated_data.pop('additional_images', [])
+        additional_uploads = validated_data.pop('additional_image_uploads', [])
         post = Post.objects.create(**validated_data)
-        
-        # Create additional images
-        for index, image in enumerate(additional_images):
-            PostImage.objects.create(
-                post=post,
-                image=image,
-                order=index
-            )
-        
+        if additional_images or additional_uploads:
+            save_gallery(post, additional_images, stored=additional_uploads)
         return post
 
 
@@ -218,31 +338,58 @@ class ShareSerializer(serializers.ModelSerializer):
 class FollowSerializer(serializers.ModelSerializer):
     follower_username = serializers.CharField(source='follower.username', read_only=True)
     following_username = serializers.CharField(source='following.username', read_only=True)
+    following_avatar = serializers.SerializerMethodField()
+    follows_you = serializers.SerializerMethodField()
+    is_mutual = serializers.SerializerMethodField()
     
     class Meta:
         model = Follow
-        fields = ['id', 'follower', 'follower_username', 'following', 'following_username', 'created_at']
+        fields = [
+            'id', 'follower', 'follower_username', 'following', 'following_username',
+            'following_avatar', 'follows_you', 'is_mutual', 'created_at'
+        ]
         read_only_fields = ['follower']
 
+    def _user_state(self, obj):
+        # Batch-resolved by FollowViewSet; empty when serialized elsewhere
+        following_id = getattr(obj, 'following_id', None)
+        return self.context.get('user_states', {}).get(following_id, {})
+
+    def get_following_avatar(self, obj):
+        return self._user_state(obj).get('avatar')
+
+    def get_follows_you(self, obj):
+        return self._user_state(obj).get('follows_you', False)
+
+    def get_is_mutual(self, obj):
+        return self._user_state(obj).get('is_mutual', False)
+
 
 class NotificationSerializer(serializers.ModelSerializer):
     sender_username = serializers.CharField(source='sender.username', read_only=True)
     sender_avatar = serializers.SerializerMethodField()
     post_title = serializers.CharField(source='post.title', read_only=True)
+    summary = serializers.SerializerMethodField()
+    recent_actors = serializers.SerializerMethodField()
     
     class Meta:
         model = Notification
         fields = [
             'id', 'recipient', 'sender', 'sender_username', 'sender_avatar',
             'notification_type', 'post', 'post_title', 'comment', 'message',
-            'is_read', 'created_at'
+            'summary', 'actor_count', 'recent_actors', 'is_read', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['recipient', 'sender']
+        read_only_fields = ['recipient', 'sender', 'actor_count']
+
+    def get_summary(self, obj):
+        return notification_summary(obj, obj.sender.username)
+
+    def get_recent_actors(self, obj):
+        actors = self.context.get('actors', {})
+        return [actors[actor_id] for actor_id in obj.recent_actor_ids if actor_id in actors]
 
     def get_sender_avatar(self, obj):
-        if hasattr(obj.sender, 'profile') and obj.sender.profile.avatar:
-            return obj.sender.profile.avatar.url
-        return None
+        return avatar_url(getattr(obj.sender, 'profile', None))
 
 
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -1,7 +1,14 @@
-from django.db.models.signals import post_save
+from collections import Counter
+
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import UserProfile
+from .models import Category, Comment, Post, PostImage, UserProfile
+from .user_index import user_index
+from . import counters, http_cache, jobs, timeline
+from .catalog import category_catalog, post_deleted, post_saved, post_saving
+from .images import IMAGE_FIELDS, image_changes, image_fields, image_replaced, owns_variants
+from .storage import adjust_refs
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -20,3 +27,115 @@ def save_user_profile(sender, instance, **kwargs):
         instance.profile.save()
     else:
         UserProfile.objects.create(user=instance)
+
+@receiver(post_save, sender=User)
+def index_user(sender, instance, **kwargs):
+    """
+    Keep this process's autocomplete index in step with the user
+    """
+    user_index.update(instance)
+
+@receiver(post_delete, sender=User)
+def unindex_user(sender, instance, **kwargs):
+    """
+    Drop a deleted user from this process's autocomplete index
+    """
+    user_index.discard(instance.pk)
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_catalog(sender, **kwargs):
+    """
+    Make every worker rebuild its cached category catalog
+    """
+    category_catalog.invalidate()
+
+@receiver(pre_save, sender=Post)
+def note_counted_post(sender, instance, update_fields=None, **kwargs):
+    """
+    Read the stored category and is_published of a post loaded without them
+    """
+    post_saving(instance, update_fields)
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, **kwargs):
+    """
+    Keep Category.published_posts_count in step with publishing and moves
+    """
+    post_saved(instance, created)
+
+@receiver(post_save, sender=Post)
+def fan_out_published_post(sender, instance, created, **kwargs):
+    """
+    Push a draft (or private post) into followers' timelines once it is
+    published; new posts are fanned out by PostViewSet.perform_create
+    """
+    if 'is_published' not in instance.__dict__ or 'visibility' not in instance.__dict__:
+        return
+    was_in_timelines = getattr(instance, '_in_timelines', None)
+    instance._in_timelines = timeline.is_timeline_post(instance)
+    if not created and was_in_timelines is False and instance._in_timelines:
+        timeline.fan_out_post(instance)
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    """
+    Drop a deleted post from its category's published count
+    """
+    post_deleted(instance)
+
+@receiver([post_save, post_delete], sender=Comment)
+def bump_comment_thread(sender, instance, origin=None, **kwargs):
+    """
+    Change the post's ETag whenever a comment is added, edited or deleted
+    """
+    if isinstance(origin, Post):
+        # The post is going with it
+        return
+    http_cache.bump_thread_version([instance.post_id])
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, origin=None, **kwargs):
+    """
+    Take a deleted comment, and each reply deleted with it, off the post's count
+    """
+    if not isinstance(origin, Post):
+        counters.increment('post', instance.post_id, 'comments_count', -1)
+
+@receiver(pre_save, sender=Post)
+@receiver(pre_save, sender=PostImage)
+@receiver(pre_save, sender=UserProfile)
+def note_image_changes(sender, instance, **kwargs):
+    """
+    Note which images this save replaces, before the new files are stored
+    """
+    instance._changed_images = image_changes(instance)
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=PostImage)
+@receiver(post_save, sender=UserProfile)
+def update_image_variants(sender, instance, **kwargs):
+    """
+    Move blob references to the new images and reuse or queue their variants
+    """
+    loaded = instance.__dict__.setdefault('_loaded_images', {})
+    for field in instance.__dict__.pop('_changed_images', ()):
+        image_replaced(instance, field, loaded.get(field, ''))
+        loaded[field] = getattr(instance, field).name or ''
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=PostImage)
+@receiver(post_delete, sender=UserProfile)
+def release_images(sender, instance, **kwargs):
+    """
+    Drop a deleted row's references to its blobs, and delete the variants
+    of legacy uploads, which belonged to this row alone
+    """
+    released = Counter()
+    orphaned = []
+    for field in image_fields(instance):
+        name = getattr(instance, field).name
+        released[name] -= 1
+        if name and owns_variants(name):
+            orphaned.append(({'name': name, 'kind': IMAGE_FIELDS[instance._meta.label, field]}, None))
+    adjust_refs(released)
+    jobs.enqueue_many('images.delete', orphaned)
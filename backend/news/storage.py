@@ -0,0 +1,93 @@
+"""
+Content-addressed storage for uploaded images.
+
+Files are named after the SHA-256 of their bytes (blobs/ab/cd/abcd....jpg),
+so the same meme uploaded a thousand times is written once. Each blob has a
+MediaBlob row counting the image fields that reference it; signals keep the
+count as rows are saved and deleted, and `manage.py collect_media` removes
+blobs nobody has referenced for MEDIA_GC_GRACE seconds.
+
+A blob row is touched whenever the blob is uploaded again, so an upload
+that is about to be referenced is never collected under it.
+"""
+import hashlib
+import os
+from collections import Counter
+
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+PREFIX = 'blobs/'
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(PREFIX)
+
+
+def digest(content):
+    sha = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        sha.update(chunk)
+    content.seek(0)
+    return sha.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    MEDIA_ROOT storage that ignores upload_to and the uploaded name (bar its
+    extension) and stores each distinct file once
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        sha = digest(content)
+        extension = os.path.splitext(name)[1].lower()
+        name = f'{PREFIX}{sha[:2]}/{sha[2:4]}/{sha}{extension}'
+
+        MediaBlob = apps.get_model('news', 'MediaBlob')
+        with transaction.atomic():
+            # Locks the row against collect_media until this transaction ends
+            blob, created = MediaBlob.objects.select_for_update().get_or_create(
+                name=name, defaults={'size': content.size}
+            )
+            if not created:
+                MediaBlob.objects.filter(pk=name).update(last_used_at=timezone.now())
+            if not self.exists(name):
+                saved = self._save(name, content)
+                if saved != name:
+                    # Lost a race to write the same bytes; keep the first copy
+                    self.delete(saved)
+        return name
+
+
+content_storage = ContentAddressedStorage()
+
+
+def get_content_storage():
+    """Storage for uploaded images (a callable, so migrations do not pin the instance)"""
+    return content_storage
+
+
+def adjust_refs(deltas):
+    """Apply {blob name: delta} to the blobs' reference counts in one UPDATE"""
+    deltas = {name: delta for name, delta in Counter(deltas).items() if delta and is_blob(name)}
+    if not deltas:
+        return
+    MediaBlob = apps.get_model('news', 'MediaBlob')
+    MediaBlob.objects.filter(name__in=deltas).update(
+        ref_count=F('ref_count') + Case(
+            *[When(name=name, then=Value(delta)) for name, delta in deltas.items()],
+            default=Value(0),
+        ),
+        last_used_at=timezone.now(),
+    )
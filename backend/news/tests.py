@@ -1,3 +1,1459 @@
-from django.test import TestCase
+import asyncio
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, connections
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import (
+    analytics, async_views, catalog, chunked_uploads, comment_tree, counters, http_cache, jobs, notification_partitions,
+    notification_stream, notifications, timeline, uploads, user_index, user_stats, view_counter,
+)
+from .models import (
+    Category, Comment, CommentLike, CounterShard, Follow, Job, Like, MediaBlob, Notification, Post, PostDailyStats,
+    PostImage, TimelineEntry, UploadSession, UserStats,
+)
+
+
+def auth_headers(user):
+    return {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+
+
+def served_by_drf():
+    """Send requests the async views would answer to the DRF viewsets instead"""
+    return mock.patch.object(async_views, 'authenticate', mock.AsyncMock(return_value=None))
+
+
+def serving_paths():
+    """(name, context) for both ways a read is served: the async views and DRF"""
+    return [('async', contextlib.nullcontext()), ('drf', served_by_drf())]
+
+
+def use_temp_dir(test, setting):
+    """Point a directory setting at a fresh temporary directory for one test"""
+    path = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, path, ignore_errors=True)
+    settings_override = override_settings(**{setting: path})
+    settings_override.enable()
+    test.addCleanup(settings_override.disable)
+    return path
+
+
+def image_upload(name='photo.png', color='red', size=(400, 300)):
+    content = io.BytesIO()
+    Image.new('RGB', size, color).save(content, 'PNG')
+    return SimpleUploadedFile(name, content.getvalue(), content_type='image/png')
+
+
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user('reader', password='x')
+        authors = [User.objects.create_user(f'author{index}', password='x') for index in range(3)]
+        category = Category.objects.create(name='News')
+        cls.posts = [
+            Post.objects.create(author=authors[index % 3], title=f'Post {index}', content='Text', category=category)
+            for index in range(12)
+        ]
+        for index, post in enumerate(cls.posts[:6]):
+            notifications.notify(
+                cls.reader, authors[index % 3], 'comment', f'Comment {index}', post=post
+            )
+
+    def get(self, url):
+        response = self.client.get(url, headers=auth_headers(self.reader))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def walk(self, url):
+        """Ids on every page from url on, and how many pages there were"""
+        ids, pages = [], 0
+        while url:
+            page = self.get(url)
+            ids.extend(item['id'] for item in page['results'])
+            pages += 1
+            url = page['next']
+        return ids, pages
+
+    def assertConstantQueries(self, url_for_size):
+        with CaptureQueriesContext(connection) as small_page:
+            self.get(url_for_size(2))
+        with self.assertNumQueries(len(small_page)):
+            self.get(url_for_size(12))
+
+    def test_posts_newest_first_without_gaps_or_repeats(self):
+        for path, serving in serving_paths():
+            with self.subTest(path=path), serving:
+                ids, pages = self.walk('/api/posts/?page_size=5')
+                self.assertEqual(ids, [post.pk for post in reversed(self.posts)])
+                self.assertEqual(pages, 3)
+
+    def test_new_posts_do_not_shift_later_pages(self):
+        first = self.get('/api/posts/?page_size=5')
+        Post.objects.create(author=self.reader, title='Newer', content='Text')
+        rest, _ = self.walk(first['next'])
+        self.assertEqual(
+            [post['id'] for post in first['results']] + rest, [post.pk for post in reversed(self.posts)]
+        )
+
+    def test_notifications_newest_first(self):
+        ids, pages = self.walk('/api/notifications/?page_size=4')
+        self.assertEqual(ids, list(Notification.objects.order_by('-updated_at', '-id').values_list('id', flat=True)))
+        self.assertEqual((len(ids), pages), (6, 2))
+
+    def test_page_queries_do_not_grow_with_page_size(self):
+        for path, serving in serving_paths():
+            with self.subTest(path=path), serving:
+                self.assertConstantQueries(lambda size: f'/api/posts/?page_size={size}')
+                self.assertConstantQueries(lambda size: f'/api/notifications/?page_size={size}')
+
+
+class ViewerLikeStateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user('reader', password='x')
+        author = User.objects.create_user('author', password='x')
+        cls.posts = [Post.objects.create(author=author, title=f'Post {index}', content='Text') for index in range(6)]
+        cls.comments = [
+            Comment.objects.create(post=post, author=author, content=f'On {post.title}') for post in cls.posts
+        ]
+        for post in cls.posts[::2]:
+            Like.objects.create(user=cls.reader, post=post)
+        for comment in cls.comments[1::2]:
+            CommentLike.objects.create(user=cls.reader, comment=comment)
+
+    def get(self, url):
+        response = self.client.get(url, headers=auth_headers(self.reader))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_post_and_comment_like_state(self):
+        liked_posts = {post.pk for post in self.posts[::2]}
+        liked_comments = {comment.pk for comment in self.comments[1::2]}
+        for path, serving in serving_paths():
+            with self.subTest(path=path), serving:
+                page = self.get('/api/posts/?expand=comments')
+                for post in page['results']:
+                    self.assertEqual(post['is_liked'], post['id'] in liked_posts)
+                    [comment] = post['comments']
+                    self.assertEqual(comment['is_liked'], comment['id'] in liked_comments)
+
+        comments = self.get(f'/api/comments/?post={self.posts[1].pk}')
+        self.assertEqual([comment['is_liked'] for comment in comments], [True])
+
+    def test_like_state_is_one_query_per_page(self):
+        for path, serving in serving_paths():
+            with self.subTest(path=path), serving:
+                with CaptureQueriesContext(connection) as small_page:
+                    self.get('/api/posts/?expand=comments&page_size=1')
+                with self.assertNumQueries(len(small_page)):
+                    self.get('/api/posts/?expand=comments&page_size=6')
+
+
+class SparseFieldsetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user('reader', password='x')
+        cls.post = Post.objects.create(author=cls.reader, title='Post', content='Text')
+        Comment.objects.create(post=cls.post, author=cls.reader, content='First')
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, headers=auth_headers(self.reader))
+        self.assertEqual(response.status_code, 200)
+        return response.json(), ' '.join(query['sql'] for query in queries)
+
+    def test_list_defers_comments_until_expanded(self):
+        for path, serving in serving_paths():
+            with self.subTest(path=path), serving:
+                page, _ = self.get('/api/posts/')
+                self.assertNotIn('comments', page['results'][0])
+                page, _ = self.get('/api/posts/?expand=comments')
+                self.assertEqual([comment['content'] for comment in page['results'][0]['comments']], ['First'])
+                post, _ = self.get(f'/api/posts/{self.post.pk}/')
+                self.assertIn('comments', post)
+
+    def test_fields_narrow_the_response_and_the_query(self):
+        for path, serving in serving_paths():
+            with self.subTest(path=path), serving:
+                page, sql = self.get('/api/posts/?fields=title,no_such_field')
+                self.assertEqual(set(page['results'][0]), {'id', 'title'})
+                self.assertNotIn('"news_post"."content"', sql)
+                self.assertNotIn('news_userprofile', sql)
+                self.assertNotIn('news_like', sql)
+
+
+class TimelineFanOutTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='x')
+        self.follower = User.objects.create_user('follower', password='x')
+        self.stranger = User.objects.create_user('stranger', password='x')
+
+    def follow(self, user, author, action='follows/'):
+        response = self.client.post(f'/api/{action}', {'following': author.pk}, headers=auth_headers(user))
+        self.assertIn(response.status_code, (200, 201))
+
+    def publish(self, title, **fields):
+        # A boolean left out of form data reads as False
+        fields = {'title': title, 'content': 'Text', 'is_published': True, **fields}
+        response = self.client.post('/api/posts/', fields, headers=auth_headers(self.author))
+        self.assertEqual(response.status_code, 201)
+        return Post.objects.get(title=title)
+
+    def timeline(self, user):
+        response = self.client.get('/api/timeline/', headers=auth_headers(user))
+        return [post['id'] for post in response.json()['results']]
+
+    def test_new_posts_reach_followers_only(self):
+        self.follow(self.follower, self.author)
+        first = self.publish('First')
+        second = self.publish('Second')
+        self.assertEqual(self.timeline(self.follower), [second.pk, first.pk])
+        self.assertEqual(self.timeline(self.stranger), [])
+
+    def test_follow_backfills_and_unfollow_removes(self):
+        posts = [self.publish(f'Post {index}') for index in range(3)]
+        self.follow(self.follower, self.author)
+        self.assertEqual(self.timeline(self.follower), [post.pk for post in reversed(posts)])
+        self.follow(self.follower, self.author, action='follows/unfollow/')
+        self.assertEqual(self.timeline(self.follower), [])
+
+    def test_private_posts_and_drafts_wait_until_they_are_public(self):
+        self.follow(self.follower, self.author)
+        private = self.publish('Private', visibility='private')
+        draft = self.publish('Draft', is_published=False)
+        self.assertEqual(self.timeline(self.follower), [])
+
+        draft.is_published = True
+        draft.save()
+        draft.save()
+        private.visibility = 'public'
+        private.save()
+        self.assertEqual(self.timeline(self.follower), [draft.pk, private.pk])
+        self.assertEqual(TimelineEntry.objects.filter(user=self.follower).count(), 2)
+
+
+@override_settings(TIMELINE_FAN_OUT_THRESHOLD=2)
+class HybridTimelineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user('reader', password='x')
+        self.author = User.objects.create_user('author', password='x')
+        self.celebrity = User.objects.create_user('celebrity', password='x')
+        for followed in (self.author, self.celebrity):
+            self.client.post('/api/follows/', {'following': followed.pk}, headers=auth_headers(self.reader))
+        fan = User.objects.create_user('fan', password='x')
+        self.client.post('/api/follows/', {'following': self.celebrity.pk}, headers=auth_headers(fan))
+
+        self.posts = []
+        for index in range(8):
+            author = self.celebrity if index % 3 == 0 else self.author
+            post = Post.objects.create(author=author, title=f'Post {index}', content='Text')
+            timeline.fan_out_post(post)
+            self.posts.append(post)
+
+    def test_high_fan_out_posts_are_not_written_to_timelines(self):
+        self.assertFalse(TimelineEntry.objects.filter(post__author=self.celebrity).exists())
+        self.assertEqual(TimelineEntry.objects.filter(user=self.reader).count(), 5)
+
+    def test_pages_merge_them_in_at_read_time(self):
+        url, ids = '/api/timeline/?page_size=3', []
+        while url:
+            page = self.client.get(url, headers=auth_headers(self.reader)).json()
+            ids.extend(post['id'] for post in page['results'])
+            url = page['next']
+        self.assertEqual(ids, [post.pk for post in reversed(self.posts)])
+
+    def test_new_posts_by_the_author_show_up_at_once(self):
+        self.client.get('/api/timeline/', headers=auth_headers(self.reader))
+        self.client.post(
+            '/api/posts/', {'title': 'Newest', 'content': 'Text', 'is_published': True},
+            headers=auth_headers(self.celebrity),
+        )
+        page = self.client.get('/api/timeline/', headers=auth_headers(self.reader)).json()
+        self.assertEqual(page['results'][0]['title'], 'Newest')
+
+
+class ViewCounterTests(TestCase):
+    def setUp(self):
+        # No background flusher; the tests flush by hand
+        for name, value in (('_pending', Counter()), ('_ensure_flusher', lambda: None)):
+            patcher = mock.patch.object(view_counter, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.author = User.objects.create_user('author', password='x')
+        self.posts = [
+            Post.objects.create(author=self.author, title=f'Post {index}', content='Text') for index in range(2)
+        ]
+        user_stats.rebuild([self.author.pk])
+
+    def views(self):
+        return [post.views_count for post in Post.objects.order_by('pk')]
+
+    def test_views_are_buffered_until_flushed(self):
+        for post in (self.posts[0], self.posts[0], self.posts[1]):
+            view_counter.record_view(post.pk)
+        self.assertEqual(self.views(), [0, 0])
+
+        # One batch for any number of posts: the posts, their authors' stats
+        # (authors, rows, update) and the daily rollups (authors, insert, update)
+        with self.assertNumQueries(7):
+            self.assertEqual(view_counter.flush(), 2)
+        self.assertEqual(self.views(), [2, 1])
+        self.assertEqual(UserStats.objects.get(pk=self.author.pk).views_received, 3)
+        self.assertEqual(
+            sorted(PostDailyStats.objects.values_list('post_id', 'views')),
+            [(self.posts[0].pk, 2), (self.posts[1].pk, 1)],
+        )
+        self.assertEqual(view_counter.flush(), 0)
+
+    def test_failed_flush_keeps_the_views(self):
+        view_counter.record_view(self.posts[0].pk)
+        with mock.patch.object(view_counter.Post.objects, 'filter', side_effect=DatabaseError):
+            self.assertEqual(view_counter.flush(), 0)
+        self.assertEqual(view_counter.flush(), 1)
+        self.assertEqual(self.views(), [1, 0])
+
+    def test_detail_reads_count_a_view(self):
+        url = f'/api/posts/{self.posts[0].pk}/'
+        for path, serving in serving_paths():
+            with self.subTest(path=path), serving:
+                response = self.client.get(url, headers=auth_headers(self.author))
+                revalidated = self.client.get(
+                    url, headers={**auth_headers(self.author), 'If-None-Match': response['ETag']}
+                )
+                self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(view_counter._pending, Counter({self.posts[0].pk: 4}))
+
+
+class CounterShardTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='x')
+        self.readers = [User.objects.create_user(f'reader{index}', password='x') for index in range(5)]
+        self.post = Post.objects.create(author=self.author, title='Post', content='Text')
+        user_stats.rebuild([self.author.pk])
+
+    def like(self, reader):
+        response = self.client.post(f'/api/posts/{self.post.pk}/like/', headers=auth_headers(reader))
+        return response.json()['likes_count']
+
+    def test_likes_go_to_shards_and_read_exactly(self):
+        self.assertEqual([self.like(reader) for reader in self.readers], [1, 2, 3, 4, 5])
+        self.assertEqual(self.like(self.readers[0]), 4)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+        self.assertLessEqual(CounterShard.objects.count(), settings.COUNTER_SHARDS)
+        self.assertEqual(counters.get_count(self.post, 'likes_count'), 4)
+
+    def test_fold_moves_shards_into_the_columns_and_author_stats(self):
+        for reader in self.readers:
+            self.like(reader)
+        self.like(self.readers[0])
+        call_command('fold_counters', stdout=io.StringIO())
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 4)
+        self.assertFalse(CounterShard.objects.exclude(count=0).exists())
+        self.assertEqual(UserStats.objects.get(pk=self.author.pk).likes_received, 4)
+        self.assertEqual(counters.get_count(self.post, 'likes_count'), 4)
+
+        # Later increments land on the emptied shards
+        self.like(self.readers[0])
+        self.assertEqual(counters.fold(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 5)
+
+
+class ReconcileCountersTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='x')
+        self.readers = [User.objects.create_user(f'reader{index}', password='x') for index in range(3)]
+        self.posts = [
+            Post.objects.create(author=self.author, title=f'Post {index}', content='Text') for index in range(2)
+        ]
+        for reader in self.readers:
+            Like.objects.create(user=reader, post=self.posts[0])
+        Like.objects.create(user=self.readers[0], post=self.posts[1])
+        Post.objects.update(likes_count=10)
+
+    def reconcile(self, *args):
+        call_command('reconcile_counters', *args, stdout=io.StringIO())
+
+    def likes_counts(self):
+        return [post.likes_count for post in Post.objects.order_by('pk')]
+
+    def test_full_pass_fixes_drift(self):
+        self.reconcile('--dry-run')
+        self.assertEqual(self.likes_counts(), [10, 10])
+
+        self.reconcile()
+        self.assertEqual(self.likes_counts(), [3, 1])
+
+    def test_pending_shards_are_left_out_of_the_column(self):
+        counters.increment('post', self.posts[0].pk, 'likes_count', 1)
+        self.reconcile()
+        self.assertEqual(self.likes_counts(), [2, 1])
+        self.assertEqual(counters.get_count(Post.objects.get(pk=self.posts[0].pk), 'likes_count'), 3)
+
+    def test_incremental_pass_only_revisits_touched_objects(self):
+        self.reconcile('--incremental')
+        self.assertEqual(self.likes_counts(), [3, 1])
+
+        Post.objects.update(likes_count=10)
+        Like.objects.create(user=self.readers[1], post=self.posts[1])
+        self.reconcile('--incremental')
+        self.assertEqual(self.likes_counts(), [10, 2])
+
+    def test_since_and_incremental_are_exclusive(self):
+        with self.assertRaises(CommandError):
+            self.reconcile('--incremental', '--since', '2026-01-01T00:00:00')
+
+
+class UserAutocompleteTests(TestCase):
+    def setUp(self):
+        # A fresh index per test, shared by the view and the User signals
+        self.index = user_index.UserPrefixIndex()
+        for target in ('news.views.user_index', 'news.signals.user_index'):
+            patcher = mock.patch(target, self.index)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.viewer = User.objects.create_user('viewer', password='x')
+        self.alice = User.objects.create_user('alice', password='x')
+        self.alan = User.objects.create_user('zed', password='x', first_name='Alan', last_name='Smith')
+        User.objects.create_user('bob', password='x', last_name='Allen')
+
+    def autocomplete(self, query):
+        response = self.client.get(
+            '/api/search/users/autocomplete/', {'q': query}, headers=auth_headers(self.viewer)
+        )
+        self.assertEqual(response.status_code, 200)
+        return [user['username'] for user in response.json()['results']]
+
+    def test_prefix_matches_username_full_name_and_last_name(self):
+        self.assertEqual(self.autocomplete('AL'), ['zed', 'alice', 'bob'])
+        self.assertEqual(self.autocomplete('alan s'), ['zed'])
+        self.assertEqual(self.autocomplete('smi'), ['zed'])
+        self.assertEqual(self.autocomplete('vie'), [])
+        self.assertEqual(self.autocomplete(' '), [])
+
+    def test_local_changes_apply_immediately(self):
+        self.assertEqual(self.autocomplete('ali'), ['alice'])
+        self.alice.username = 'carol'
+        self.alice.save()
+        self.assertEqual(self.autocomplete('ali'), [])
+        self.assertEqual(self.autocomplete('car'), ['carol'])
+        self.alan.is_active = False
+        self.alan.save()
+        self.assertEqual(self.autocomplete('smi'), [])
+        self.alice.delete()
+        self.assertEqual(self.autocomplete('car'), [])
+
+    @override_settings(USER_INDEX_REFRESH_INTERVAL=0)
+    def test_refresh_picks_up_users_created_elsewhere(self):
+        self.assertEqual(self.autocomplete('dan'), [])
+        # bulk_create skips the signals, like a user created by another worker
+        User.objects.bulk_create([User(username='dana')])
+        self.assertEqual(self.autocomplete('dan'), ['dana'])
+
+
+class UserFollowStateTests(TestCase):
+    def setUp(self):
+        index = user_index.UserPrefixIndex()
+        for target in ('news.views.user_index', 'news.signals.user_index'):
+            patcher = mock.patch(target, index)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.viewer = User.objects.create_user('viewer', password='x')
+        self.members = []
+        self.add_members(2)
+
+    def add_members(self, count):
+        for _ in range(count):
+            member = User.objects.create_user(f'member{len(self.members)}', password='x')
+            Follow.objects.create(follower=self.viewer, following=member)
+            if len(self.members) % 2 == 0:
+                Follow.objects.create(follower=member, following=self.viewer)
+            self.members.append(member)
+
+    def get(self, url):
+        response = self.client.get(url, headers=auth_headers(self.viewer))
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        return body['results'] if isinstance(body, dict) else body
+
+    def test_follow_state_is_resolved_per_user(self):
+        results = self.get('/api/search/users/?q=member')
+        self.assertEqual(
+            {user['username']: (user['is_following'], user['follows_you'], user['is_mutual']) for user in results},
+            {'member0': (True, True, True), 'member1': (True, False, False)},
+        )
+        follows = self.get('/api/follows/')
+        self.assertEqual(
+            {follow['following_username']: (follow['follows_you'], follow['is_mutual']) for follow in follows},
+            {'member0': (True, True), 'member1': (False, False)},
+        )
+
+    def test_user_lists_cost_a_constant_number_of_queries(self):
+        urls = ['/api/search/users/?q=member', '/api/search/users/autocomplete/?q=member', '/api/follows/']
+        small = {}
+        for url in urls:
+            # The first autocomplete builds the index
+            self.get(url)
+            with CaptureQueriesContext(connection) as queries:
+                self.get(url)
+            small[url] = len(queries)
+
+        self.add_members(4)
+        for url in urls:
+            with self.subTest(url=url), self.assertNumQueries(small[url]):
+                self.assertEqual(len(self.get(url)), 6)
+
+
+class UserStatsTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='x')
+        self.reader = User.objects.create_user('reader', password='x')
+
+    def stats(self):
+        response = self.client.get('/api/dashboard/stats/', headers=auth_headers(self.author))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_stats_follow_posts_likes_comments_and_notifications(self):
+        response = self.client.post(
+            '/api/posts/', {'title': 'Post', 'content': 'Text', 'is_published': True}, headers=auth_headers(self.author)
+        )
+        self.assertEqual(response.status_code, 201)
+        post = Post.objects.get()
+        self.client.post(f'/api/posts/{post.pk}/like/', headers=auth_headers(self.reader))
+        self.client.post(
+            '/api/comments/', {'post': post.pk, 'content': 'Nice'}, headers=auth_headers(self.reader)
+        )
+        counters.fold()
+        jobs.run_pending()
+
+        stats = self.stats()
+        self.assertEqual([stats[field] for field in user_stats.STAT_FIELDS], [1, 1, 1, 0, 2])
+
+        self.client.post('/api/notifications/mark_all_read/', headers=auth_headers(self.author))
+        self.assertEqual(self.stats()['unread_notifications'], 0)
+
+    def test_dashboard_reads_one_stats_row(self):
+        Post.objects.create(author=self.author, title='Post', content='Text', likes_count=3, comments_count=2)
+        self.stats()
+        # The token's user, then the stats row with the profile joined
+        with self.assertNumQueries(2):
+            stats = self.stats()
+        self.assertEqual((stats['posts_count'], stats['likes_received'], stats['comments_received']), (1, 3, 2))
+
+    def test_rebuild_command_recovers_drift(self):
+        Post.objects.create(author=self.author, title='Post', content='Text', views_count=7)
+        user_stats.rebuild([self.author.pk])
+        UserStats.objects.update(posts_count=40, views_received=0)
+        call_command('rebuild_user_stats', '--user', str(self.author.pk), stdout=io.StringIO())
+        stats = UserStats.objects.get(pk=self.author.pk)
+        self.assertEqual((stats.posts_count, stats.views_received), (1, 7))
+
+
+class StreamTicketTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reader', password='x')
+
+    def authenticate(self, **query):
+        return notification_stream.authenticate(RequestFactory().get('/api/notifications/stream/', query))
+
+    def issue_ticket(self):
+        response = self.client.post('/api/notifications/stream/ticket/', headers=auth_headers(self.user))
+        self.assertEqual(response.json()['expires_in'], settings.NOTIFICATION_STREAM_TICKET_TTL)
+        return response.json()['ticket']
+
+    def test_ticket_opens_only_its_users_stream(self):
+        ticket = self.issue_ticket()
+        self.assertEqual(self.authenticate(ticket=ticket), self.user)
+        self.assertIsNone(self.authenticate(ticket=ticket[:-2] + 'xx'))
+        # Signed for another purpose, e.g. by another feature's signing.dumps()
+        self.assertIsNone(self.authenticate(ticket=signing.dumps({'user': self.user.pk})))
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(self.authenticate(ticket=ticket))
+
+    def test_ticket_expires(self):
+        ticket = self.issue_ticket()
+        later = time.time() + settings.NOTIFICATION_STREAM_TICKET_TTL + 1
+        with mock.patch('django.core.signing.time.time', return_value=later):
+            self.assertIsNone(self.authenticate(ticket=ticket))
+
+    def test_access_tokens_are_not_accepted_in_the_url(self):
+        token = str(AccessToken.for_user(self.user))
+        self.assertIsNone(self.authenticate(token=token))
+        response = self.client.get('/api/notifications/stream/', {'token': token})
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(NOTIFICATION_STREAM_HEARTBEAT=0.5)
+class NotificationStreamTests(TransactionTestCase):
+    def setUp(self):
+        self.recipient = User.objects.create_user('recipient', password='x')
+        self.sender = User.objects.create_user('sender', password='x')
+
+    def notify(self, message):
+        # Ungrouped, so every call creates a notification
+        notifications.notify(self.recipient, self.sender, 'mention', message)
+        return Notification.objects.filter(recipient=self.recipient).latest('updated_at', 'id')
+
+    def read_stream(self, last_event_id, after_first_batch):
+        """Frames up to the second unread count, calling after_first_batch after the first"""
+        async def run():
+            frames = []
+            stream = notification_stream.stream(self.recipient, last_event_id)
+            try:
+                while len([frame for frame in frames if 'event: unread' in frame]) < 2:
+                    frames.append(await asyncio.wait_for(anext(stream), timeout=5))
+                    if frames[-1].startswith('event: unread') and len(frames) < 4:
+                        await sync_to_async(after_first_batch)()
+            finally:
+                await stream.aclose()
+                await sync_to_async(connections.close_all)()
+            return frames
+
+        # Reads on the one sync_to_async thread, whose connection run() closes
+        with mock.patch.object(
+            notification_stream, 'read_since', sync_to_async(notification_stream._read_since)
+        ):
+            return asyncio.run(run())
+
+    def test_stream_resumes_after_last_event_id_and_wakes_on_notify(self):
+        first = self.notify('first')
+        second = self.notify('second')
+        frames = self.read_stream(notification_stream.format_cursor(first), lambda: self.notify('third'))
+
+        self.assertEqual(frames[0], f'retry: {notification_stream.CLIENT_RETRY_MS}\n\n')
+        self.assertTrue(frames[1].startswith(f'id: {notification_stream.format_cursor(second)}\n'))
+        self.assertEqual(frames[2], 'event: unread\ndata: {"count": 2}\n\n')
+        self.assertIn('"message": "third"', frames[3])
+        self.assertEqual(frames[4], 'event: unread\ndata: {"count": 3}\n\n')
+        self.assertNotIn('"message": "first"', ''.join(frames))
+
+
+class NotificationPartitionTests(TestCase):
+    def setUp(self):
+        self.recipient = User.objects.create_user('recipient', password='x')
+        self.sender = User.objects.create_user('sender', password='x')
+
+    def notify(self, months_ago):
+        notification = Notification.objects.create(
+            recipient=self.recipient, sender=self.sender, notification_type='mention', message='Hi'
+        )
+        created_at = notification_partitions.month_start(offset=-months_ago)
+        Notification.objects.filter(pk=notification.pk).update(created_at=created_at, updated_at=created_at)
+        return notification
+
+    def stored_in(self, notification):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT tableoid::regclass::text FROM "{notification_partitions.TABLE}" WHERE id = %s',
+                [notification.pk],
+            )
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    def test_rows_are_routed_to_their_month(self):
+        current = self.notify(0)
+        self.assertEqual(
+            self.stored_in(current), notification_partitions.partition_name(notification_partitions.month_start())
+        )
+        self.assertEqual(notification_partitions.ensure_partitions(), [])
+
+        # Without a partition for its month a row waits in the default one
+        month = notification_partitions.month_start(offset=-30)
+        old = self.notify(30)
+        self.assertEqual(self.stored_in(old), notification_partitions.DEFAULT_PARTITION)
+        name = notification_partitions.create_partition(month)
+        self.assertEqual(self.stored_in(old), name)
+        self.assertEqual(notification_partitions.attached_partitions()[month], name)
+
+    def test_maintenance_cools_and_expires_old_months(self):
+        for months_ago in (30, 5):
+            notification_partitions.create_partition(notification_partitions.month_start(offset=-months_ago))
+        expired, cold, hot = self.notify(30), self.notify(5), self.notify(0)
+        user_stats.rebuild([self.recipient.pk])
+        # Check the rows' deferred foreign keys now, as the commit would, so the partitions can be detached
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+        call_command('maintain_notifications', stdout=io.StringIO())
+        self.assertEqual(
+            list(Notification.objects.order_by('pk').values_list('pk', 'is_read')),
+            [(cold.pk, True), (hot.pk, False)],
+        )
+        self.assertEqual(UserStats.objects.get(pk=self.recipient.pk).unread_notifications, 1)
+        # The expired month is kept as a standalone archive table
+        self.assertEqual(self.stored_in(expired), None)
+        archive = notification_partitions.partition_name(notification_partitions.month_start(offset=-30))
+        self.assertIn(archive, connection.introspection.table_names())
+
+        call_command('maintain_notifications', '--drop', stdout=io.StringIO())
+        self.assertIn(archive, connection.introspection.table_names())
+        notification_partitions.create_partition(notification_partitions.month_start(offset=-40))
+        call_command('maintain_notifications', '--drop', stdout=io.StringIO())
+        self.assertNotIn(
+            notification_partitions.partition_name(notification_partitions.month_start(offset=-40)),
+            connection.introspection.table_names(),
+        )
+
+
+class ParseContentRangeTests(TestCase):
+    def test_valid_range_is_end_exclusive(self):
+        self.assertEqual(chunked_uploads.parse_content_range('bytes 0-99/1000'), (0, 100, 1000))
+        self.assertEqual(chunked_uploads.parse_content_range('bytes 900-999/1000'), (900, 1000, 1000))
+
+    def test_malformed_ranges(self):
+        for header in (None, '', 'bytes 0-99', 'bytes */1000', 'items 0-99/1000', 'bytes 10-9/1000'):
+            with self.subTest(header=header):
+                self.assertIsNone(chunked_uploads.parse_content_range(header))
+
+
+class ChunkedUploadTests(TestCase):
+    def setUp(self):
+        use_temp_dir(self, 'CHUNKED_UPLOAD_DIR')
+        self.user = User.objects.create_user('uploader', password='x')
+        self.session = chunked_uploads.start(self.user, 'photo.jpg', 10)
+
+    def append(self, first, end, body):
+        return chunked_uploads.append(self.session, first, end, self.session.size, io.BytesIO(body))
+
+    def read_part(self):
+        with open(chunked_uploads.part_path(self.session), 'rb') as part:
+            return part.read()
+
+    def test_chunks_append_in_order(self):
+        self.assertEqual(self.append(0, 4, b'0123'), 4)
+        self.assertEqual(self.append(4, 10, b'456789'), 10)
+        self.assertEqual(self.read_part(), b'0123456789')
+
+    def test_offset_mismatch_reports_the_resume_offset(self):
+        self.append(0, 4, b'0123')
+        for first in (0, 6):
+            with self.subTest(first=first), self.assertRaises(chunked_uploads.OffsetMismatch) as raised:
+                self.append(first, first + 4, b'xxxx')
+            self.assertEqual(raised.exception.offset, 4)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.offset, 4)
+
+    def test_truncated_chunk_is_retried_from_the_recorded_offset(self):
+        self.append(0, 4, b'0123')
+        # The connection drops after two of six bytes
+        with self.assertRaises(serializers.ValidationError):
+            self.append(4, 10, b'45')
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.offset, 4)
+        self.assertEqual(self.read_part(), b'012345')
+
+        self.assertEqual(self.append(4, 10, b'456789'), 10)
+        self.assertEqual(self.read_part(), b'0123456789')
+
+    def test_range_too_large_is_rejected(self):
+        with self.assertRaises(serializers.ValidationError):
+            self.append(0, 11, b'0' * 11)
+        with mock.patch.object(chunked_uploads, 'MAX_CHUNK_SIZE', 4):
+            with self.assertRaises(serializers.ValidationError):
+                self.append(0, 5, b'01234')
+        with self.assertRaises(serializers.ValidationError):
+            chunked_uploads.append(self.session, 0, 4, 20, io.BytesIO(b'0123'))
+        self.assertFalse(os.path.exists(chunked_uploads.part_path(self.session)))
+
+    def test_finish_rejects_a_non_image(self):
+        self.append(0, 10, b'not a jpeg')
+        with self.assertRaises(serializers.ValidationError):
+            chunked_uploads.finish(self.session)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.status, UploadSession.PENDING)
+        self.assertEqual(self.session.name, '')
+
+    def test_finish_before_the_last_chunk(self):
+        self.append(0, 4, b'0123')
+        with self.assertRaises(chunked_uploads.OffsetMismatch) as raised:
+            chunked_uploads.finish(self.session)
+        self.assertEqual(raised.exception.offset, 4)
+
+
+class ReplyPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author', password='x')
+        post = Post.objects.create(author=author, title='Post', content='Some text')
+        cls.comment = Comment.objects.create(post=post, author=author, content='Top')
+        cls.replies = []
+        for index in range(3):
+            reply = Comment.objects.create(post=post, author=author, content=f'Reply {index}', parent=cls.comment)
+            Comment.objects.create(post=post, author=author, content=f'Answer {index}', parent=reply)
+            cls.replies.append(reply)
+
+    def test_pages_carry_only_their_own_subtrees(self):
+        with self.assertNumQueries(2) as queries:
+            page, cursor = comment_tree.load_reply_page(self.comment, limit=2)
+        self.assertEqual(page, self.replies[:0:-1])
+        self.assertEqual(cursor, str(self.replies[1].pk))
+        self.assertEqual([len(reply.tree_replies) for reply in page], [1, 1])
+        self.assertNotIn(self.replies[0].path, queries.captured_queries[1]['sql'])
+
+        page, cursor = comment_tree.load_reply_page(self.comment, before=int(cursor), limit=2)
+        self.assertEqual(page, self.replies[:1])
+        self.assertIsNone(cursor)
+        self.assertEqual(page[0].tree_replies[0].content, 'Answer 0')
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.calls = []
+        jobs.task('tests.record')(lambda **payload: self.calls.append(payload))
+        self.addCleanup(jobs._tasks.pop, 'tests.record')
+
+    def test_idempotency_key_dedupes_queued_and_done_jobs(self):
+        jobs.enqueue('tests.record', {'n': 1}, idempotency_key='once')
+        jobs.enqueue('tests.record', {'n': 2}, idempotency_key='once')
+        self.assertEqual(jobs.run_pending(), 1)
+        jobs.enqueue('tests.record', {'n': 3}, idempotency_key='once')
+        self.assertEqual(jobs.run_pending(), 0)
+        self.assertEqual(self.calls, [{'n': 1}])
+
+    def test_failed_job_is_requeued_under_its_key(self):
+        jobs.enqueue('tests.missing', idempotency_key='broken', max_attempts=1)
+        jobs.run_pending()
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 1))
+
+        jobs.enqueue('tests.missing', idempotency_key='broken')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.PENDING, 0))
+
+    def test_claim_stamps_updated_at(self):
+        jobs.enqueue('tests.record')
+        queued = Job.objects.get().updated_at
+        [job] = jobs.claim()
+        job.refresh_from_db()
+        self.assertEqual(job.updated_at, job.locked_at)
+        self.assertGreater(job.updated_at, queued)
+
+
+@override_settings(JOB_LOCK_TIMEOUT=0.3)
+class JobLockTests(TransactionTestCase):
+    def run_job(self, handler):
+        jobs.task('tests.slow')(handler)
+        self.addCleanup(jobs._tasks.pop, 'tests.slow')
+        jobs.enqueue('tests.slow')
+        [job] = jobs.claim()
+        return job, jobs.run(job)
+
+    def test_running_job_is_not_reclaimed(self):
+        reclaimed = []
+
+        def handler():
+            time.sleep(0.6)
+            reclaimed.extend(jobs.claim())
+
+        job, succeeded = self.run_job(handler)
+        self.assertTrue(succeeded)
+        self.assertEqual(reclaimed, [])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DONE, 1))
+
+    def test_outcome_of_a_reclaimed_run_is_dropped(self):
+        def handler():
+            # Another worker took the job over, as if this one had hung
+            Job.objects.update(attempts=2, locked_at=None)
+
+        job, _ = self.run_job(handler)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.RUNNING, 2))
+
+
+class NotificationMergeTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='x')
+        self.likers = [User.objects.create_user(f'liker{index}', password='x') for index in range(2)]
+        self.post = Post.objects.create(author=self.author, title='Post', content='Some text')
+
+    def like(self, liker):
+        return notifications.notify(self.author, liker, 'like', f'{liker.username} liked your post', post=self.post)
+
+    def test_merge_keeps_created_at_and_moves_updated_at(self):
+        self.assertTrue(self.like(self.likers[0]))
+        liked = Notification.objects.get()
+        notifications.notify(self.author, self.likers[1], 'follow', 'liker1 started following you')
+
+        self.assertFalse(self.like(self.likers[1]))
+        merged = Notification.objects.get(pk=liked.pk)
+        self.assertEqual(merged.actor_count, 2)
+        self.assertEqual(merged.created_at, liked.created_at)
+        self.assertGreater(merged.updated_at, liked.updated_at)
+
+        listed = self.client.get('/api/notifications/', headers=auth_headers(self.author)).json()['results']
+        self.assertEqual([notification['id'] for notification in listed][0], liked.pk)
+        self.assertEqual(len(listed), 2)
+
+
+class DashboardTimeseriesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('author', password='x')
+
+    def get(self, query):
+        return self.client.get(f'/api/dashboard/timeseries/{query}', headers=auth_headers(self.user))
+
+    def test_invalid_dates_are_rejected(self):
+        for query in ('?start=yesterday', '?end=2026-13-01', '?start=2026-02-30', '?end=2026-02-30'):
+            with self.subTest(query=query):
+                response = self.get(query)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(list(response.json()), [query[1:query.index('=')]])
+
+    def test_range_checks(self):
+        self.assertEqual(self.get('?start=2026-03-02&end=2026-03-01').status_code, 400)
+        self.assertEqual(self.get('?start=2025-01-01&end=2026-03-01').status_code, 400)
+        # Empty parameters fall back to the last 30 days
+        self.assertEqual(len(self.get('?start=&end=').json()['days']), 30)
+
+    def test_rollup_counts_each_event_once(self):
+        readers = [User.objects.create_user(f'reader{index}', password='x') for index in range(3)]
+        post = Post.objects.create(author=self.user, title='Post', content='Text')
+        other = Post.objects.create(author=self.user, title='Other', content='Text')
+        for reader in readers:
+            Like.objects.create(user=reader, post=post)
+        Comment.objects.create(post=other, author=readers[0], content='Nice')
+        today = timezone.localdate()
+        Like.objects.filter(user=readers[0]).update(created_at=timezone.now() - timedelta(days=1))
+        analytics.record_views({post.pk: 5})
+
+        def rollup():
+            call_command('rollup_post_stats', '--lag', '0', stdout=io.StringIO())
+
+        rollup()
+        rollup()
+        query = f'?start={today - timedelta(days=2)}&end={today}'
+        series = self.get(query).json()
+        self.assertEqual(series['days'], [str(today - timedelta(days=offset)) for offset in (2, 1, 0)])
+        self.assertEqual(
+            [series[metric] for metric in analytics.METRICS], [[0, 0, 5], [0, 1, 2], [0, 0, 1], [0, 0, 0]]
+        )
+        self.assertEqual(self.get(f'{query}&post={other.pk}').json()['likes'], [0, 0, 0])
+
+        Like.objects.create(user=readers[0], post=other)
+        rollup()
+        self.assertEqual(self.get(query).json()['likes'], [0, 1, 3])
+
+
+class PostSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user('reader', password='x')
+        cls.alice = User.objects.create_user('alice', password='x')
+        cls.bob = User.objects.create_user('bob', password='x')
+        cls.gardening = Post.objects.create(author=cls.alice, title='Gardening', content='Tomatoes need sun')
+        cls.cycling = Post.objects.create(author=cls.bob, title='Cycling', content='Climbing with tomatoes')
+
+    def search(self, url):
+        response = self.client.get(url, headers=auth_headers(self.reader))
+        self.assertEqual(response.status_code, 200)
+        return [post['id'] for post in response.json()['results']]
+
+    def test_search_matches_text_and_author(self):
+        self.assertEqual(self.search('/api/posts/?search=tomato'), [self.cycling.pk, self.gardening.pk])
+        self.assertEqual(self.search('/api/posts/?search=sun'), [self.gardening.pk])
+        self.assertEqual(self.search('/api/posts/?search=ALI'), [self.gardening.pk])
+        self.assertEqual(self.search('/api/posts/?search=bicycles'), [])
+
+    def test_ranked_search_weights_titles_and_highlights(self):
+        recipe = Post.objects.create(author=self.bob, title='Tomatoes', content='A recipe')
+        response = self.client.get('/api/posts/search/?q=tomatoes', headers=auth_headers(self.reader))
+        results = response.json()['results']
+        self.assertEqual(results[0]['id'], recipe.pk)
+        self.assertEqual({post['id'] for post in results}, {recipe.pk, self.gardening.pk, self.cycling.pk})
+        self.assertEqual(results[0]['title_snippet'], '<mark>Tomatoes</mark>')
+        snippets = {post['id']: post['snippet'] for post in results}
+        self.assertEqual(snippets[self.cycling.pk], 'Climbing with <mark>tomatoes</mark>')
+
+    def test_ranked_search_accepts_web_search_syntax(self):
+        self.assertEqual(self.search('/api/posts/search/?q=tomatoes -sun'), [self.cycling.pk])
+        self.assertEqual(self.search('/api/posts/search/?q="need sun"'), [self.gardening.pk])
+        self.assertEqual(len(self.search('/api/posts/search/?q=sun OR climbing')), 2)
+        self.assertEqual(self.search('/api/posts/search/?q='), [])
+
+
+class CategoryCountTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='x')
+        self.news, self.sport, self.other = [Category.objects.create(name=name) for name in ('News', 'Sport', 'Other')]
+        self.post = Post.objects.create(author=self.author, title='Post', content='Some text', category=self.news)
+
+    def counts(self):
+        return list(Category.objects.order_by('pk').values_list('published_posts_count', flat=True))
+
+    def test_publishing_unpublishing_and_moving(self):
+        self.assertEqual(self.counts(), [1, 0, 0])
+        self.post.is_published = False
+        self.post.save()
+        self.assertEqual(self.counts(), [0, 0, 0])
+        self.post.is_published = True
+        self.post.category = self.sport
+        self.post.save()
+        self.assertEqual(self.counts(), [0, 1, 0])
+        self.post.delete()
+        self.assertEqual(self.counts(), [0, 0, 0])
+
+    def test_post_loaded_without_tracked_fields_is_moved_by_delta(self):
+        # A drifted count a full recount would correct
+        Category.objects.filter(pk=self.other.pk).update(published_posts_count=5)
+        post = Post.objects.only('id', 'title').get(pk=self.post.pk)
+        post.category = self.sport
+        post.save()
+        self.assertEqual(self.counts(), [0, 1, 5])
+
+        post = Post.objects.only('id', 'title').get(pk=self.post.pk)
+        post.title = 'Renamed'
+        with self.assertNumQueries(1):
+            post.save(update_fields=['title'])
+        self.assertEqual(self.counts(), [0, 1, 5])
+
+
+@override_settings(CATEGORY_CATALOG_CHECK_INTERVAL=60)
+class CategoryCatalogTests(TestCase):
+    def setUp(self):
+        # A fresh catalog per test: rolled-back versions could match a stale copy
+        self.catalog = catalog.CategoryCatalog()
+        for target in ('news.catalog', 'news.views', 'news.async_views', 'news.signals'):
+            patcher = mock.patch(f'{target}.category_catalog', self.catalog)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user('reader', password='x')
+        self.news = Category.objects.create(name='News')
+
+    def get(self, url, etag=None):
+        headers = auth_headers(self.user)
+        if etag:
+            headers['If-None-Match'] = etag
+        return self.client.get(url, headers=headers)
+
+    def test_steady_state_listing_only_authenticates(self):
+        for path, serving in serving_paths():
+            with self.subTest(path=path), serving:
+                self.get('/api/categories/')
+                with self.assertNumQueries(1):
+                    response = self.get('/api/categories/')
+                self.assertEqual([category['name'] for category in response.json()], ['News'])
+                with self.assertNumQueries(1):
+                    self.assertEqual(self.get('/api/categories/', response['ETag']).status_code, 304)
+
+    def test_changes_invalidate_the_catalog(self):
+        for path, serving in serving_paths():
+            with self.subTest(path=path), serving:
+                etag = self.get('/api/categories/')['ETag']
+                post = Post.objects.create(author=self.user, title='Post', content='Text', category=self.news)
+                response = self.get('/api/categories/', etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()[0]['posts_count'], 1)
+
+                etag = self.get(f'/api/categories/{self.news.pk}/')['ETag']
+                category = Category.objects.get(pk=self.news.pk)
+                category.name = f'News ({path})'
+                category.save()
+                response = self.get(f'/api/categories/{self.news.pk}/', etag)
+                self.assertEqual(response.json()['name'], f'News ({path})')
+
+                post.delete()
+                self.assertEqual(self.get('/api/categories/').json()[0]['posts_count'], 0)
+
+    @override_settings(CATEGORY_CATALOG_CHECK_INTERVAL=0)
+    def test_other_workers_changes_are_picked_up(self):
+        self.get('/api/categories/')
+        # Another worker's invalidate() only reaches this one through the version row
+        http_cache.bump_version(catalog.VERSION_KEY)
+        Category.objects.filter(pk=self.news.pk).update(name='World')
+        self.assertEqual(self.get('/api/categories/').json()[0]['name'], 'World')
+
+
+class PostEtagTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='x')
+        self.viewer = User.objects.create_user('viewer', password='x')
+        self.post = Post.objects.create(author=self.author, title='Post', content='Some text')
+        self.comments = [
+            Comment.objects.create(post=self.post, author=self.author, content=f'Comment {index}')
+            for index in range(3)
+        ]
+
+    def etag(self):
+        return http_cache.post_etag_query(self.viewer, self.post.pk).first()
+
+    def test_deleting_an_older_comment_changes_the_etag(self):
+        before = self.etag()
+        self.comments[0].delete()
+        self.assertNotEqual(self.etag(), before)
+
+    def test_deleted_comments_and_their_replies_leave_the_count(self):
+        for comment in self.comments:
+            counters.increment('post', self.post.pk, 'comments_count')
+        Comment.objects.create(post=self.post, author=self.author, content='Reply', parent=self.comments[0])
+        counters.increment('post', self.post.pk, 'comments_count')
+        self.comments[0].delete()
+        counters.fold()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 2)
+
+    def test_folded_comment_likes_change_the_etag(self):
+        CommentLike.objects.create(user=self.author, comment=self.comments[1])
+        counters.increment('comment', self.comments[1].pk, 'likes_count')
+        before = self.etag()
+        counters.fold()
+        self.assertNotEqual(self.etag(), before)
+
+    def test_viewer_likes_change_the_etag(self):
+        before = self.etag()
+        CommentLike.objects.create(user=self.viewer, comment=self.comments[1])
+        self.assertNotEqual(self.etag(), before)
+
+    def get(self, url, user, etag=None):
+        headers = auth_headers(user)
+        if etag:
+            headers['If-None-Match'] = etag
+        return self.client.get(url, headers=headers)
+
+    def test_unchanged_post_is_not_modified(self):
+        url = f'/api/posts/{self.post.pk}/'
+        for path, serving in serving_paths():
+            with self.subTest(path=path), serving:
+                response = self.get(url, self.viewer)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('Authorization', response['Vary'])
+                self.assertEqual(set(response['Cache-Control'].split(', ')), {'private', 'no-cache'})
+                etag = response['ETag']
+
+                # The token's user and the ETag row; nothing is serialized
+                with self.assertNumQueries(2):
+                    response = self.get(url, self.viewer, etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+                self.assertNotEqual(self.get(url, self.author)['ETag'], etag)
+
+                Like.objects.create(user=self.viewer, post=self.post)
+                self.assertEqual(self.get(url, self.viewer, etag).status_code, 200)
+                Like.objects.all().delete()
+
+    def test_notification_list_is_revalidated(self):
+        for path, serving in serving_paths():
+            with self.subTest(path=path), serving:
+                etag = self.get('/api/notifications/', self.author)['ETag']
+                self.assertEqual(self.get('/api/notifications/', self.author, etag).status_code, 304)
+
+                notifications.notify(self.author, self.viewer, 'follow', 'viewer followed you')
+                response = self.get('/api/notifications/', self.author, etag)
+                self.assertEqual(response.status_code, 200)
+                etag = response['ETag']
+                self.client.post('/api/notifications/mark_all_read/', headers=auth_headers(self.author))
+                self.assertEqual(self.get('/api/notifications/', self.author, etag).status_code, 200)
+                Notification.objects.all().delete()
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        use_temp_dir(self, 'MEDIA_ROOT')
+        self.author = User.objects.create_user('author', password='x')
+        self.viewer = User.objects.create_user('viewer', password='x')
+
+    def post_etag(self, post):
+        return http_cache.post_etag_query(self.viewer, post.pk).first()
+
+    def test_rendered_variants_change_the_post_etag(self):
+        post = Post.objects.create(author=self.author, title='Post', content='Some text', image=image_upload())
+        self.assertEqual(post.image_variants, {})
+        before = self.post_etag(post)
+
+        jobs.run_pending()
+        post.refresh_from_db()
+        self.assertEqual(set(post.image_variants), {'thumb', 'feed', 'full'})
+        self.assertNotEqual(self.post_etag(post), before)
+
+        gallery_image = post.additional_images.create(image=image_upload('gallery.png', color='blue'))
+        before = self.post_etag(post)
+        jobs.run_pending()
+        gallery_image.refresh_from_db()
+        self.assertTrue(gallery_image.image_variants)
+        self.assertNotEqual(self.post_etag(post), before)
+
+    def test_author_avatar_changes_the_post_etag(self):
+        post = Post.objects.create(author=self.author, title='Post', content='Some text')
+        before = self.post_etag(post)
+        profile = self.author.profile
+        profile.avatar = image_upload('avatar.png')
+        profile.save()
+        after = self.post_etag(post)
+        self.assertNotEqual(after, before)
+
+        jobs.run_pending()
+        self.assertNotEqual(self.post_etag(post), after)
+
+    def test_variants_are_sized_and_served(self):
+        post = Post.objects.create(
+            author=self.author, title='Post', content='Some text', image=image_upload(size=(2000, 1000))
+        )
+        jobs.run_pending()
+        post.refresh_from_db()
+        self.assertEqual(
+            {variant: (entry['width'], entry['height']) for variant, entry in post.image_variants.items()},
+            {'thumb': (160, 80), 'feed': (320, 160), 'full': (1280, 640)},
+        )
+        self.assertIn('png', post.image_variants['full']['formats'])
+        for path in post.image_variants['thumb']['formats'].values():
+            self.assertTrue(default_storage.exists(path))
+
+        response = self.client.get(f'/api/posts/{post.pk}/', headers=auth_headers(self.viewer))
+        formats = response.json()['image_variants']['thumb']['formats']
+        self.assertEqual(formats['png'], default_storage.url(post.image_variants['thumb']['formats']['png']))
+
+    def test_same_bytes_reuse_rendered_variants(self):
+        first = Post.objects.create(author=self.author, title='First', content='Text', image=image_upload())
+        jobs.run_pending()
+        first.refresh_from_db()
+
+        second = Post.objects.create(author=self.author, title='Second', content='Text', image=image_upload('copy.png'))
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertEqual(second.image_variants, first.image_variants)
+        self.assertFalse(Job.objects.filter(status=Job.PENDING).exists())
+
+
+class GalleryUploadTests(TransactionTestCase):
+    def setUp(self):
+        use_temp_dir(self, 'MEDIA_ROOT')
+        self.author = User.objects.create_user('author', password='x')
+        # One pool thread, so its database connection can be closed afterwards
+        pool = ThreadPoolExecutor(1)
+        patcher = mock.patch.object(uploads, 'executor', return_value=pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(pool.shutdown)
+        self.addCleanup(lambda: pool.submit(connections.close_all).result())
+
+    def create_post(self, gallery):
+        return self.client.post(
+            '/api/posts/',
+            {'title': 'Gallery', 'content': 'Text', 'is_published': True, 'additional_images': gallery},
+            headers=auth_headers(self.author),
+        )
+
+    def test_gallery_is_stored_in_order_with_one_insert(self):
+        photo = io.BytesIO()
+        Image.new('RGB', (640, 480), 'green').save(photo, 'JPEG')
+        gallery = [
+            image_upload('first.png', color='red'),
+            SimpleUploadedFile('second.jpg', photo.getvalue(), content_type='application/octet-stream'),
+            image_upload('third.png', color='blue'),
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.create_post(gallery)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(sum('INSERT INTO "news_postimage"' in query['sql'] for query in queries), 1)
+
+        post = Post.objects.get()
+        names = list(post.additional_images.order_by('order').values_list('order', 'image'))
+        self.assertEqual([order for order, _ in names], [0, 1, 2])
+        self.assertEqual([os.path.splitext(name)[1] for _, name in names], ['.png', '.jpg', '.png'])
+        self.assertEqual(Job.objects.filter(task='images.render').count(), 3)
+
+    def test_invalid_images_are_rejected_by_index(self):
+        gallery = [image_upload(), SimpleUploadedFile('notes.png', b'not an image', content_type='image/png')]
+        response = self.create_post(gallery)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()['additional_images']), ['1'])
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(PostImage.objects.exists())
+
+
+class MediaBlobTests(TestCase):
+    def setUp(self):
+        use_temp_dir(self, 'MEDIA_ROOT')
+        self.author = User.objects.create_user('author', password='x')
+
+    def create_post(self, **fields):
+        return Post.objects.create(author=self.author, title='Post', content='Text', **fields)
+
+    def ref_counts(self):
+        return dict(MediaBlob.objects.values_list('name', 'ref_count'))
+
+    def collect(self, *args):
+        call_command('collect_media', *args, stdout=io.StringIO())
+
+    def test_identical_uploads_share_one_counted_blob(self):
+        first = self.create_post(image=image_upload('a.png'))
+        second = self.create_post(image=image_upload('b.png'))
+        gallery_image = second.additional_images.create(image=image_upload('c.png'))
+        red = first.image.name
+        self.assertEqual({second.image.name, gallery_image.image.name}, {red})
+        self.assertEqual(self.ref_counts(), {red: 3})
+
+        second.image = image_upload('d.png', color='blue')
+        second.save()
+        blue = second.image.name
+        self.assertEqual(self.ref_counts(), {red: 2, blue: 1})
+
+        first.delete()
+        second.delete()
+        self.assertEqual(self.ref_counts(), {red: 0, blue: 0})
+
+    def test_collect_media_waits_for_the_grace_period(self):
+        kept = self.create_post(image=image_upload())
+        orphan = self.create_post(image=image_upload('orphan.png', color='blue'))
+        jobs.run_pending()
+        orphan.refresh_from_db()
+        name, variants = orphan.image.name, orphan.image_variants
+        orphan.delete()
+
+        self.collect()
+        self.assertIn(name, self.ref_counts())
+
+        with override_settings(MEDIA_GC_GRACE=0):
+            self.collect('--dry-run')
+            self.assertTrue(default_storage.exists(name))
+            self.collect()
+        self.assertEqual(self.ref_counts(), {kept.image.name: 1})
+        self.assertFalse(default_storage.exists(name))
+        for entry in variants.values():
+            for path in entry['formats'].values():
+                self.assertFalse(default_storage.exists(path))
+        self.assertTrue(default_storage.exists(kept.image.name))
+
+    def test_recount_repairs_drifted_counts(self):
+        post = self.create_post(image=image_upload())
+        MediaBlob.objects.update(ref_count=0)
+        with override_settings(MEDIA_GC_GRACE=0):
+            self.collect('--recount')
+        self.assertEqual(self.ref_counts(), {post.image.name: 1})
+        self.assertTrue(default_storage.exists(post.image.name))
+
+
+class AsyncReadTests(TestCase):
+    """The async read views answer exactly as the DRF viewsets they front"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user('reader', password='x')
+        author = User.objects.create_user('author', password='x')
+        category = Category.objects.create(name='News')
+        cls.posts = [
+            Post.objects.create(author=author, title=f'Post {index}', content='Some text', category=category)
+            for index in range(7)
+        ]
+        Like.objects.create(user=cls.reader, post=cls.posts[0])
+        Notification.objects.create(
+            recipient=cls.reader, sender=author, notification_type='like', post=cls.posts[0],
+            message='author liked your post'
+        )
+        user_stats.rebuild([cls.reader.pk])
+
+    def setUp(self):
+        self.token = str(AccessToken.for_user(self.reader))
+
+    async def get(self, url, **headers):
+        return await self.async_client.get(url, headers={'Authorization': f'Bearer {self.token}', **headers})
+
+    async def get_both(self, url, **headers):
+        """(async view response, DRF viewset response) for the same request"""
+        with self.spy_on_drf() as dispatched:
+            async_response = await self.get(url, **headers)
+        self.assertFalse(dispatched.called, f'{url} was not served by the async view')
+        with served_by_drf():
+            drf_response = await self.get(url, **headers)
+        return async_response, drf_response
+
+    def spy_on_drf(self):
+        """Records every request a DRF view handles"""
+        return mock.patch.object(APIView, 'initial', autospec=True, side_effect=APIView.initial)
+
+    def assertSameResponse(self, async_response, drf_response):
+        self.assertEqual(async_response.status_code, drf_response.status_code)
+        self.assertEqual(async_response.content, drf_response.content)
+        for header in ('ETag', 'Vary', 'Cache-Control'):
+            values = [response.get(header) for response in (async_response, drf_response)]
+            if header == 'Vary':
+                values = [sorted(value.split(', ')) if value else value for value in values]
+            self.assertEqual(*values, header)
+
+    async def test_post_list_and_cursor(self):
+        url = '/api/posts/?page_size=3'
+        seen = []
+        while url:
+            async_response, drf_response = await self.get_both(url)
+            self.assertSameResponse(async_response, drf_response)
+            page = async_response.json()
+            seen.extend(post['id'] for post in page['results'])
+            url = page['next']
+        self.assertEqual(seen, [post.pk for post in reversed(self.posts)])
+
+        # Back from the last page
+        async_response, drf_response = await self.get_both(page['previous'])
+        self.assertSameResponse(async_response, drf_response)
+        self.assertEqual([post['id'] for post in async_response.json()['results']], seen[3:6])
+
+    async def test_post_list_filters_and_fields(self):
+        for query in ('?category=%d' % self.posts[0].category_id, '?fields=id,title&expand=comments'):
+            with self.subTest(query=query):
+                self.assertSameResponse(*await self.get_both(f'/api/posts/{query}'))
+
+    async def test_post_detail_and_304(self):
+        url = f'/api/posts/{self.posts[0].pk}/?expand=comments'
+        async_response, drf_response = await self.get_both(url)
+        self.assertSameResponse(async_response, drf_response)
+        self.assertTrue(async_response.json()['is_liked'])
+
+        revalidated = await self.get_both(url, **{'If-None-Match': async_response['ETag']})
+        self.assertEqual([response.status_code for response in revalidated], [304, 304])
+        self.assertSameResponse(*revalidated)
+
+    async def test_notifications_and_categories(self):
+        for url in ('/api/notifications/', '/api/notifications/unread_count/', '/api/categories/'):
+            with self.subTest(url=url):
+                async_response, drf_response = await self.get_both(url)
+                self.assertEqual(async_response.status_code, 200)
+                self.assertSameResponse(async_response, drf_response)
+        self.assertEqual((await self.get('/api/notifications/unread_count/')).json(), {'count': 1})
+
+    async def test_invalid_cursor(self):
+        for url in ('/api/posts/?cursor=garbage', '/api/notifications/?cursor=garbage'):
+            with self.subTest(url=url):
+                async_response = await self.get(url)
+                with served_by_drf():
+                    drf_response = await self.get(url)
+                self.assertEqual(async_response.status_code, 404)
+                self.assertSameResponse(async_response, drf_response)
+
+    async def test_unsupported_requests_fall_back_to_drf(self):
+        with self.spy_on_drf() as dispatched:
+            searched = await self.get('/api/posts/?search=text')
+            ordered = await self.get('/api/posts/?ordering=likes_count')
+            anonymous = await self.async_client.get('/api/posts/')
+            bad_filter = await self.get('/api/posts/?category=999')
+        self.assertEqual(dispatched.call_count, 4)
+        self.assertEqual(searched.status_code, 200)
+        self.assertEqual(ordered.status_code, 200)
+        self.assertEqual(anonymous.status_code, 401)
+        self.assertEqual(bad_filter.status_code, 400)
@@ -0,0 +1,104 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Follow, Post, TimelineEntry, UserProfile
+
+# How many of an author's latest posts are copied in when someone follows them
+BACKFILL_POSTS = 50
+
+# Rows per INSERT when fanning a post out to followers
+FAN_OUT_BATCH_SIZE = 1000
+
+# How many recent posts are kept per high-follower author for read-time merging
+AUTHOR_CACHE_POSTS = 20
+
+
+def is_timeline_post(post):
+    return post.is_published and post.visibility != 'private'
+
+
+def is_high_fan_out(author_id):
+    """Authors with too many followers to fan out to on every post"""
+    return UserProfile.objects.filter(
+        user_id=author_id, followers_count__gte=settings.TIMELINE_FAN_OUT_THRESHOLD
+    ).exists()
+
+
+def author_cache_key(author_id):
+    return f'timeline:author:{author_id}'
+
+
+def fan_out_post(post):
+    """Write a new post into the timeline of every follower of its author"""
+    if not is_timeline_post(post):
+        return
+
+    if is_high_fan_out(post.author_id):
+        # Readers merge this author's posts in at read time instead
+        cache.delete(author_cache_key(post.author_id))
+        return
+
+    follower_ids = Follow.objects.filter(following_id=post.author_id).values_list('follower_id', flat=True)
+    batch = []
+    for follower_id in follower_ids.iterator(chunk_size=FAN_OUT_BATCH_SIZE):
+        batch.append(TimelineEntry(user_id=follower_id, post=post, created_at=post.created_at))
+        if len(batch) >= FAN_OUT_BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def backfill_author(user, author, limit=BACKFILL_POSTS):
+    """Copy an author's recent posts into the timeline of a new follower"""
+    if is_high_fan_out(author.pk):
+        return
+
+    posts = Post.objects.filter(
+        author=author, is_published=True
+    ).exclude(visibility='private').only('id', 'created_at').order_by('-created_at')[:limit]
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user=user, post=post, created_at=post.created_at) for post in posts],
+        ignore_conflicts=True,
+    )
+
+
+def remove_author(user, author):
+    """Drop an author's posts from the timeline of someone who unfollowed them"""
+    TimelineEntry.objects.filter(user=user, post__author=author).delete()
+
+
+def recent_author_posts(author_id):
+    """(created_at, post_id) pairs of an author's latest posts, cached per worker"""
+    key = author_cache_key(author_id)
+    posts = cache.get(key)
+    if posts is None:
+        posts = list(
+            Post.objects.filter(author_id=author_id, is_published=True)
+            .exclude(visibility='private')
+            .order_by('-created_at')
+            .values_list('created_at', 'id')[:AUTHOR_CACHE_POSTS]
+        )
+        cache.set(key, posts, settings.TIMELINE_AUTHOR_CACHE_TIMEOUT)
+    return posts
+
+
+def merged_post_ids(user, newer_than=None, older_than=None):
+    """
+    IDs of posts by followed high-follower authors that fall inside a
+    timeline page's window (both bounds exclusive).
+    """
+    author_ids = Follow.objects.filter(
+        follower=user,
+        following__profile__followers_count__gte=settings.TIMELINE_FAN_OUT_THRESHOLD,
+    ).values_list('following_id', flat=True)
+
+    post_ids = []
+    for author_id in author_ids:
+        for created_at, post_id in recent_author_posts(author_id):
+            if older_than is not None and created_at >= older_than:
+                continue
+            if newer_than is not None and created_at <= newer_than:
+                continue
+            post_ids.append(post_id)
+    return post_ids
@@ -0,0 +1,96 @@
+"""
+Parallel handling of multi-image uploads.
+
+Uploads reach us as temporary files (FILE_UPLOAD_HANDLERS), so a gallery
+is never held in worker memory. Checking that each file decodes and
+copying it into storage both release the GIL, so the images of one
+request are handled side by side on a small per-process thread pool, and
+the PostImage rows are then written with one INSERT.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from PIL import Image
+from rest_framework import serializers
+
+from .models import PostImage
+from . import images
+
+# JPEGs are decoded at (at least) this fraction of their size when checked
+DRAFT_SCALE = 8
+
+_executor = None
+_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(settings.UPLOAD_WORKERS, thread_name_prefix='upload')
+    return _executor
+
+
+def check_image(upload):
+    """
+    Raise ValidationError unless the upload is an image Pillow can decode.
+    JPEGs are decoded in draft mode, which reads every scan but keeps only
+    a scaled-down bitmap; other formats are verified without decoding.
+    """
+    upload.seek(0)
+    try:
+        with Image.open(upload) as image:
+            if image.format == 'JPEG':
+                image.draft('RGB', (image.width // DRAFT_SCALE or 1, image.height // DRAFT_SCALE or 1))
+                image.load()
+            else:
+                image.verify()
+            upload.content_type = Image.MIME.get(image.format, getattr(upload, 'content_type', None))
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        raise serializers.ValidationError(serializers.ImageField.default_error_messages['invalid_image'])
+    finally:
+        upload.seek(0)
+
+
+def check_images(uploads):
+    """
+    check_image() every upload in parallel; raises one ValidationError
+    keyed by list index, as a ListField would
+    """
+    def error(upload):
+        try:
+            check_image(upload)
+        except serializers.ValidationError as exc:
+            return exc.detail
+
+    errors = {index: detail for index, detail in enumerate(executor().map(error, uploads)) if detail}
+    if errors:
+        raise serializers.ValidationError(errors)
+
+
+def store(instance, field, upload):
+    """Save an upload where the instance's FileField would, returning the stored name"""
+    # Pool threads keep their own database connection for blob bookkeeping
+    close_old_connections()
+    file_field = instance._meta.get_field(field)
+    name = file_field.generate_filename(instance, upload.name)
+    return file_field.storage.save(name, upload, max_length=file_field.max_length)
+
+
+def save_gallery(post, uploads, stored=()):
+    """
+    Store uploads as the post's additional images, in order, followed by
+    the already `stored` file names, and queue their variants
+    """
+    gallery = [PostImage(post=post, order=index) for index in range(len(uploads) + len(stored))]
+    names = executor().map(lambda pair: store(pair[0], 'image', pair[1]), zip(gallery, uploads))
+    for image, name in zip(gallery, [*names, *stored]):
+        image.image = name
+    images.fill_shared_variants(gallery, 'image')
+    # bulk_create sends no post_save, so references and variants are handled here
+    PostImage.objects.bulk_create(gallery)
+    images.images_created(gallery, 'image')
+    return gallery
@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from . import views
+from . import async_views, views
 
 # Create router for ViewSets
 router = DefaultRouter()
@@ -10,6 +10,7 @@ router.register(r'comments', views.CommentViewSet)
 router.register(r'categories', views.CategoryViewSet)
 router.register(r'follows', views.FollowViewSet)
 router.register(r'notifications', views.NotificationViewSet, basename='notification')
+router.register(r'uploads', views.UploadViewSet, basename='upload')
 
 urlpatterns = [
     # Authentication
@@ -21,10 +22,23 @@ urlpatterns = [
     path('profile/', views.UserProfileView.as_view(), name='user-profile'),
     path('dashboard/', views.UserDashboardView.as_view(), name='user-dashboard'),
     path('search/users/', views.UserSearchView.as_view(), name='user-search'),
+    path('search/users/autocomplete/', views.user_autocomplete, name='user-autocomplete'),
+    path('timeline/', views.TimelineView.as_view(), name='timeline'),
+    # Must precede the router's notifications/<pk>/ route
+    path('notifications/stream/', views.notification_stream, name='notification-stream'),
+    path('notifications/stream/ticket/', views.notification_stream_ticket, name='notification-stream-ticket'),
     
     # Dashboard & Stats
     path('dashboard/stats/', views.dashboard_stats, name='dashboard-stats'),
+    path('dashboard/timeseries/', views.dashboard_timeseries, name='dashboard-timeseries'),
     
+    # Async reads; other methods and queries fall through to the same viewsets
+    path('posts/', async_views.post_list, name='post-list'),
+    path('posts/<int:pk>/', async_views.post_detail, name='post-detail'),
+    path('notifications/', async_views.notification_list, name='notification-list'),
+    path('notifications/unread_count/', async_views.unread_count, name='notification-unread-count'),
+    path('categories/', async_views.category_list, name='category-list'),
+
     # Include router URLs
     path('', include(router.urls)),
 ]
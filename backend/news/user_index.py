@@ -0,0 +1,196 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+def search_terms(user):
+    """Lowercased strings a user can be found by when typing a prefix"""
+    full_name = f'{user.first_name} {user.last_name}'.strip().lower()
+    terms = {user.username.lower(), full_name, user.last_name.strip().lower()}
+    terms.discard('')
+    return terms
+
+
+class UserPrefixIndex:
+    """
+    In-memory sorted list of (term, user_id) for typeahead.
+
+    A prefix lookup is a binary search plus a short forward scan. Changes
+    made in this process are applied immediately by the User signals; users
+    created by other workers are picked up every USER_INDEX_REFRESH_INTERVAL
+    seconds and the whole index is rebuilt every USER_INDEX_REBUILD_INTERVAL.
+
+    Only the first search in a process waits for a build. Later rebuilds run
+    on a background thread while the current index keeps serving, and only
+    one build or refresh runs at a time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Held by whichever thread is building or refreshing the index
+        self._build_lock = threading.Lock()
+        # Users saved or deleted here while a rebuild is reading the table
+        self._changed_during_build = None
+        self._terms = []
+        self._ids = []
+        self._user_terms = {}
+        self._last_user_id = 0
+        self._loaded_at = None
+        self._refreshed_at = None
+
+    @property
+    def is_loaded(self):
+        return self._loaded_at is not None
+
+    def _add(self, user_id, terms):
+        for term in sorted(terms):
+            position = bisect_left(self._terms, term)
+            # Keep equal terms ordered by user id
+            while position < len(self._terms) and self._terms[position] == term and self._ids[position] < user_id:
+                position += 1
+            self._terms.insert(position, term)
+            self._ids.insert(position, user_id)
+        self._user_terms[user_id] = terms
+
+    def _remove(self, user_id):
+        for term in self._user_terms.pop(user_id, ()):
+            position = bisect_left(self._terms, term)
+            while position < len(self._terms) and self._terms[position] == term:
+                if self._ids[position] == user_id:
+                    del self._terms[position]
+                    del self._ids[position]
+                    break
+                position += 1
+
+    def _load_users(self, users):
+        for user in users:
+            self._remove(user.pk)
+            self._add(user.pk, search_terms(user))
+            self._last_user_id = max(self._last_user_id, user.pk)
+
+    def rebuild(self):
+        """Load every active user, sorting once instead of inserting one by one"""
+        with self._lock:
+            self._changed_during_build = {}
+        pairs = []
+        user_terms = {}
+        last_user_id = 0
+        users = User.objects.filter(is_active=True).only('id', 'username', 'first_name', 'last_name')
+        try:
+            for user in users.iterator(chunk_size=5000):
+                terms = search_terms(user)
+                user_terms[user.pk] = terms
+                pairs.extend((term, user.pk) for term in terms)
+                last_user_id = max(last_user_id, user.pk)
+        except Exception:
+            with self._lock:
+                self._changed_during_build = None
+            raise
+        pairs.sort()
+
+        with self._lock:
+            self._terms = [term for term, _ in pairs]
+            self._ids = [user_id for _, user_id in pairs]
+            self._user_terms = user_terms
+            self._last_user_id = last_user_id
+            self._loaded_at = self._refreshed_at = time.monotonic()
+            # Replay changes the scan may have read too early
+            changed, self._changed_during_build = self._changed_during_build, None
+            for user_id, terms in changed.items():
+                self._remove(user_id)
+                if terms:
+                    self._add(user_id, terms)
+
+    def _rebuild_in_background(self):
+        def run():
+            try:
+                self.rebuild()
+            except Exception:
+                logger.exception('Failed to rebuild the user index')
+            finally:
+                self._build_lock.release()
+                connection.close()
+
+        threading.Thread(target=run, name='user-index-rebuild', daemon=True).start()
+
+    def ensure_fresh(self):
+        now = time.monotonic()
+        if self._loaded_at is None:
+            # Nothing to serve yet: one request builds, concurrent ones wait for it
+            with self._build_lock:
+                if self._loaded_at is None:
+                    self.rebuild()
+            return
+        rebuild_due = now - self._loaded_at > settings.USER_INDEX_REBUILD_INTERVAL
+        refresh_due = now - self._refreshed_at > settings.USER_INDEX_REFRESH_INTERVAL
+        # Skip if a build or refresh is already under way
+        if not (rebuild_due or refresh_due) or not self._build_lock.acquire(blocking=False):
+            return
+        if rebuild_due:
+            # Releases the build lock when done
+            self._rebuild_in_background()
+            return
+        try:
+            # Users other workers created since the last scan
+            users = list(
+                User.objects.filter(is_active=True, id__gt=self._last_user_id)
+                .only('id', 'username', 'first_name', 'last_name').order_by('id')
+            )
+            with self._lock:
+                self._load_users(users)
+                self._refreshed_at = now
+        finally:
+            self._build_lock.release()
+
+    def _apply(self, user_id, terms):
+        if self._changed_during_build is not None:
+            self._changed_during_build[user_id] = terms
+        self._remove(user_id)
+        if terms:
+            self._add(user_id, terms)
+
+    def update(self, user):
+        """
+        Re-index one user after it was saved in this process. The high-water
+        mark is left alone: it only moves with database scans, so users with
+        lower ids created by other workers are still picked up.
+        """
+        if not self.is_loaded and self._changed_during_build is None:
+            return
+        with self._lock:
+            self._apply(user.pk, search_terms(user) if user.is_active else None)
+
+    def discard(self, user_id):
+        if not self.is_loaded and self._changed_during_build is None:
+            return
+        with self._lock:
+            self._apply(user_id, None)
+
+    def search(self, prefix, limit=10, exclude=()):
+        """IDs of up to `limit` users with a term starting with prefix"""
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        self.ensure_fresh()
+
+        results = []
+        with self._lock:
+            position = bisect_left(self._terms, prefix)
+            while position < len(self._terms) and len(results) < limit:
+                if not self._terms[position].startswith(prefix):
+                    break
+                user_id = self._ids[position]
+                if user_id not in exclude and user_id not in results:
+                    results.append(user_id)
+                position += 1
+        return results
+
+
+user_index = UserPrefixIndex()
@@ -0,0 +1,73 @@
+from django.db.models import Case, Count, F, Sum, Value, When
+
+from .models import Notification, Post, UserStats
+
+STAT_FIELDS = ['posts_count', 'likes_received', 'comments_received', 'views_received', 'unread_notifications']
+
+
+def bump(user_id, **deltas):
+    """Add deltas to one user's stats, e.g. bump(user.id, posts_count=1)"""
+    updates = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if not updates:
+        return
+    if not UserStats.objects.filter(user_id=user_id).update(**updates):
+        # No row yet: compute it from scratch, which includes this change
+        rebuild([user_id])
+
+
+def bump_many(field, deltas):
+    """Apply {user_id: delta} to one stat with a single UPDATE"""
+    deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    existing = set(UserStats.objects.filter(user_id__in=deltas).values_list('user_id', flat=True))
+    if existing:
+        UserStats.objects.filter(user_id__in=existing).update(**{
+            field: F(field) + Case(
+                *[When(user_id=user_id, then=Value(deltas[user_id])) for user_id in existing],
+                default=Value(0),
+            )
+        })
+    missing = set(deltas) - existing
+    if missing:
+        rebuild(missing)
+
+
+def rebuild(user_ids):
+    """Recompute stats for the given users from their posts and notifications"""
+    user_ids = list(user_ids)
+    stats = {user_id: UserStats(user_id=user_id) for user_id in user_ids}
+
+    post_totals = Post.objects.filter(author_id__in=user_ids).order_by().values('author_id').annotate(
+        posts=Count('id'),
+        likes=Sum('likes_count'),
+        comments=Sum('comments_count'),
+        views=Sum('views_count'),
+    )
+    for row in post_totals:
+        row_stats = stats[row['author_id']]
+        row_stats.posts_count = row['posts']
+        row_stats.likes_received = row['likes'] or 0
+        row_stats.comments_received = row['comments'] or 0
+        row_stats.views_received = row['views'] or 0
+
+    unread = Notification.objects.filter(recipient_id__in=user_ids, is_read=False).order_by().values(
+        'recipient_id'
+    ).annotate(total=Count('id'))
+    for row in unread:
+        stats[row['recipient_id']].unread_notifications = row['total']
+
+    UserStats.objects.bulk_create(
+        stats.values(), update_conflicts=True, unique_fields=['user'], update_fields=STAT_FIELDS + ['updated_at']
+    )
+
+
+def get_stats(user):
+    """The user's stats row (with user and profile joined), built on first use"""
+    queryset = UserStats.objects.select_related('user__profile')
+    stats = queryset.filter(pk=user.pk).first()
+    if stats is None:
+        rebuild([user.pk])
+        stats = queryset.get(pk=user.pk)
+    return stats
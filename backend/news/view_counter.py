@@ -0,0 +1,90 @@
+"""
+Write-behind buffer for Post.views_count.
+
+Detail views add to a per-process buffer instead of updating the post row;
+a background thread folds the buffer into the database every
+VIEW_COUNT_FLUSH_INTERVAL seconds with a single UPDATE, and whatever is left
+is flushed when the worker shuts down.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, F, When
+
+from .models import Post
+from . import analytics, user_stats
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_pending = Counter()
+_flusher = None
+
+
+def record_view(post_id):
+    """Count one view of a post; it reaches the database on the next flush"""
+    with _lock:
+        _pending[post_id] += 1
+    _ensure_flusher()
+
+
+def flush():
+    """Apply all buffered views in one batched UPDATE"""
+    global _pending
+    with _lock:
+        if not _pending:
+            return 0
+        batch, _pending = _pending, Counter()
+
+    try:
+        Post.objects.filter(id__in=batch.keys()).update(
+            views_count=F('views_count') + Case(
+                *[When(id=post_id, then=count) for post_id, count in batch.items()],
+                default=0,
+            )
+        )
+    except Exception:
+        # Put the counts back so the next flush retries them
+        with _lock:
+            _pending.update(batch)
+        logger.exception('Failed to flush %d buffered post views', len(batch))
+        return 0
+
+    by_author = Counter()
+    for post_id, author_id in Post.objects.filter(id__in=batch.keys()).values_list('id', 'author_id'):
+        by_author[author_id] += batch[post_id]
+    user_stats.bump_many('views_received', by_author)
+    analytics.record_views(batch)
+    return len(batch)
+
+
+def _run_flusher(stop):
+    while not stop.wait(settings.VIEW_COUNT_FLUSH_INTERVAL):
+        try:
+            flush()
+        finally:
+            connection.close()
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is not None:
+        return
+    with _lock:
+        if _flusher is not None:
+            return
+        stop = threading.Event()
+        thread = threading.Thread(target=_run_flusher, args=(stop,), name='view-count-flusher', daemon=True)
+        thread.start()
+        _flusher = (thread, stop)
+
+
+@atexit.register
+def _flush_on_exit():
+    if _flusher is not None:
+        _flusher[1].set()
+    flush()
@@ -0,0 +1,103 @@
+from django.db.models import Q
+
+from .images import avatar_url
+from .models import Like, CommentLike, Follow, UserProfile
+
+
+class ViewerContext:
+    """
+    Per-request state about the viewing user, resolved in bulk.
+
+    Serializers look up is_liked here instead of issuing one EXISTS query
+    per object, so a page costs the same number of queries at any size.
+    """
+
+    def __init__(self, liked_post_ids=(), liked_comment_ids=()):
+        self.liked_post_ids = set(liked_post_ids)
+        self.liked_comment_ids = set(liked_comment_ids)
+
+    @classmethod
+    def for_posts(cls, user, posts, include_posts=True, include_comments=True):
+        """Load like state for a page of posts and, optionally, every comment on them"""
+        return cls(**cls.post_queries(user, posts, include_posts, include_comments))
+
+    @classmethod
+    async def afor_posts(cls, user, posts, include_posts=True, include_comments=True):
+        """for_posts() through the async ORM"""
+        results = {}
+        for name, query in cls.post_queries(user, posts, include_posts, include_comments).items():
+            results[name] = [pk async for pk in query]
+        return cls(**results)
+
+    @staticmethod
+    def post_queries(user, posts, include_posts, include_comments):
+        """
+        The liked post ids and liked comment ids queries, as requested and
+        keyed by constructor argument; none if there is nothing to look up
+        """
+        post_ids = [post.pk for post in posts]
+        if not user.is_authenticated or not post_ids:
+            return {}
+
+        queries = {}
+        if include_posts:
+            queries['liked_post_ids'] = Like.objects.filter(
+                user=user, post_id__in=post_ids
+            ).values_list('post_id', flat=True)
+        if include_comments:
+            queries['liked_comment_ids'] = CommentLike.objects.filter(
+                user=user, comment__post_id__in=post_ids
+            ).values_list('comment_id', flat=True)
+        return queries
+
+    @classmethod
+    def for_comments(cls, user, comments):
+        """Load like state for a page of comments, including their replies"""
+        post_ids = {comment.post_id for comment in comments}
+        if not user.is_authenticated or not post_ids:
+            return cls()
+
+        liked_comments = CommentLike.objects.filter(
+            user=user, comment__post_id__in=post_ids
+        ).values_list('comment_id', flat=True)
+        return cls(liked_comment_ids=liked_comments)
+
+    def has_liked_post(self, post):
+        return post.pk in self.liked_post_ids
+
+    def has_liked_comment(self, comment):
+        return comment.pk in self.liked_comment_ids
+
+
+def resolve_user_states(viewer, user_ids):
+    """
+    How the viewer relates to each listed user, plus the user's avatar URL.
+
+    Returns {user_id: {'is_following', 'follows_you', 'is_mutual', 'avatar'}}
+    using one Follow query and one UserProfile query for the whole list.
+    """
+    user_ids = set(user_ids)
+    states = {
+        user_id: {'is_following': False, 'follows_you': False, 'is_mutual': False, 'avatar': None}
+        for user_id in user_ids
+    }
+    if not user_ids:
+        return states
+
+    follows = Follow.objects.filter(
+        Q(follower=viewer, following_id__in=user_ids) |
+        Q(following=viewer, follower_id__in=user_ids)
+    ).values_list('follower_id', 'following_id')
+    for follower_id, following_id in follows:
+        if follower_id == viewer.pk:
+            states[following_id]['is_following'] = True
+        else:
+            states[follower_id]['follows_you'] = True
+
+    profiles = UserProfile.objects.filter(user_id__in=user_ids).only('user_id', 'avatar', 'avatar_variants')
+    for profile in profiles:
+        states[profile.user_id]['avatar'] = avatar_url(profile)
+
+    for state in states.values():
+        state['is_mutual'] = state['is_following'] and state['follows_you']
+    return states
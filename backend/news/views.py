@@ -1,17 +1,37 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.models import User
-from django.db.models import Q, F
-from rest_framework import generics, status, viewsets, permissions, filters
+from django.db.models import Q, F, Prefetch
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import timedelta
+from rest_framework import generics, mixins, status, viewsets, permissions, filters
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.parsers import MultiPartParser, FormParser
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import UserProfile, Post, Like, Comment, Notification, Category, Follow, Share
+from . import analytics, comment_tree, counters, http_cache, notifications, timeline, user_stats, view_counter
+from . import chunked_uploads
+from . import search as post_search
+from . import notification_stream as live_notifications
+from .catalog import category_catalog, category_etag
+from .user_index import user_index
+from .viewer import ViewerContext, resolve_user_states
+from .pagination import (
+    PostCursorPagination, NotificationCursorPagination, TimelineCursorPagination, SearchCursorPagination
+)
+from .models import (
+    UserProfile, Post, Like, Comment, CommentLike, Notification, Category, Follow, Share, TimelineEntry,
+    UploadSession, UserStats
+)
 from .serializers import (
     UserSerializer, UserProfileSerializer, UserUpdateSerializer, PostSerializer, PostCreateSerializer,
-    LikeSerializer, CommentSerializer, NotificationSerializer,
-    CategorySerializer, FollowSerializer, ShareSerializer
+    PostListSerializer, PostSearchResultSerializer, LikeSerializer, CommentSerializer, NotificationSerializer,
+    CategorySerializer, FollowSerializer, ShareSerializer, UploadSessionSerializer
 )
 
 
@@ -50,15 +70,19 @@ class UserDashboardView(generics.RetrieveAPIView):
         return profile
 
     def get(self, request, *args, **kwargs):
-        profile = self.get_object()
+        totals = user_stats.get_stats(request.user)
+        profile = getattr(totals.user, 'profile', None) or self.get_object()
         serializer = self.get_serializer(profile)
         
         # Get additional dashboard data
-        user_posts = request.user.posts.all()[:5]  # Latest 5 posts
+        user_posts = request.user.posts.only(
+            'id', 'author', 'title', 'created_at', 'likes_count', 'comments_count', 'views_count'
+        )[:5]  # Latest 5 posts
         recent_activity = {
-            'total_posts': request.user.posts.count(),
-            'total_likes_received': sum(post.likes_count for post in request.user.posts.all()),
-            'total_comments_received': sum(post.comments_count for post in request.user.posts.all()),
+            'total_posts': totals.posts_count,
+            'total_likes_received': totals.likes_received,
+            'total_comments_received': totals.comments_received,
+            'total_views_received': totals.views_received,
             'recent_posts': [
                 {
                     'id': post.id,
@@ -77,28 +101,132 @@ class UserDashboardView(generics.RetrieveAPIView):
         return Response(data)
 
 
+def counted_post_etag(request, pk=None, **kwargs):
+    """
+    post_etag() that also counts the view, since a revalidated read is
+    answered with 304 before retrieve() runs
+    """
+    etag = http_cache.post_etag(request, pk, **kwargs)
+    if etag is not None:
+        # Buffer the view; it is written to the post row on the next flush
+        view_counter.record_view(int(pk))
+    return etag
+
+
 class PostViewSet(viewsets.ModelViewSet):
     queryset = Post.objects.filter(is_published=True)
     permission_classes = [IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = PostCursorPagination
+    filter_backends = [DjangoFilterBackend, post_search.FullTextSearchFilter, filters.OrderingFilter]
     filterset_fields = ['category', 'author', 'visibility']
-    search_fields = ['title', 'content', 'author__username']
     ordering_fields = ['created_at', 'likes_count', 'views_count']
-    ordering = ['-created_at']
+    ordering = ['-created_at', '-id']
+
+    # Actions that render posts and can narrow the query to the requested fields
+    read_actions = ('list', 'retrieve', 'my_posts', 'featured', 'search')
+
+    # Columns, select_related paths and prefetches each serialized field needs
+    field_columns = {
+        'author_username': ['author', 'author__username'],
+        'author_avatar': ['author', 'author__profile__avatar', 'author__profile__avatar_variants'],
+        'category_name': ['category', 'category__name'],
+        'category_color': ['category', 'category__color'],
+        'time_since_posted': ['created_at'],
+        'is_liked': [],
+        'additional_images': [],
+        'comments': [],
+        'rank': [],
+        'title_snippet': [],
+        'snippet': [],
+    }
+    field_relations = {
+        'author_username': 'author',
+        'author_avatar': 'author__profile',
+        'category_name': 'category',
+        'category_color': 'category',
+    }
+    field_prefetches = {
+        'additional_images': 'additional_images',
+        'comments': Prefetch(
+            'comments',
+            queryset=comment_tree.tree_queryset().filter(depth__lte=comment_tree.MAX_DEPTH + 1),
+            to_attr='comment_tree_nodes',
+        ),
+    }
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in self.read_actions:
+            queryset = self.optimize_queryset(queryset, self.get_field_names())
+        return queryset
+
+    def optimize_queryset(self, queryset, field_names):
+        """Load only the columns and relations the rendered fields use"""
+        columns = {'id', 'created_at', 'is_published'}
+        relations = set()
+        prefetches = []
+        for name in field_names:
+            columns.update(self.field_columns.get(name, [name]))
+            if name in self.field_relations:
+                relations.add(self.field_relations[name])
+            if name in self.field_prefetches:
+                prefetches.append(self.field_prefetches[name])
+        if relations:
+            queryset = queryset.select_related(*relations)
+        if prefetches:
+            queryset = queryset.prefetch_related(*prefetches)
+        return queryset.only(*columns)
+
+    def get_field_names(self):
+        """Fields to render, from ?fields= and ?expand= (comma-separated)"""
+        def param_list(name):
+            value = self.request.query_params.get(name, '')
+            return [item.strip() for item in value.split(',') if item.strip()]
+
+        return self.get_serializer_class().select_fields(
+            fields=param_list('fields'), expand=param_list('expand')
+        )
 
     def get_serializer_class(self):
         if self.action == 'create':
             return PostCreateSerializer
+        if self.action in ('list', 'my_posts', 'featured'):
+            return PostListSerializer
+        if self.action == 'search':
+            return PostSearchResultSerializer
         return PostSerializer
 
-    def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+    def get_serializer(self, *args, **kwargs):
+        if self.action in self.read_actions and args and 'data' not in kwargs:
+            field_names = self.get_field_names()
+            kwargs.setdefault('fields', field_names)
+            # Resolve is_liked for the whole page up front, if it is rendered
+            posts = args[0] if kwargs.get('many') else [args[0]]
+            kwargs['context'] = {
+                **self.get_serializer_context(),
+                'viewer': ViewerContext.for_posts(
+                    self.request.user, posts,
+                    include_posts='is_liked' in field_names, include_comments='comments' in field_names,
+                ),
+            }
+        return super().get_serializer(*args, **kwargs)
 
+    def perform_create(self, serializer):
+        post = serializer.save(author=self.request.user)
+        user_stats.bump(post.author_id, posts_count=1)
+        # Push the post into followers' home timelines
+        timeline.fan_out_post(post)
+
+    def perform_destroy(self, instance):
+        author_id = instance.author_id
+        instance.delete()
+        # The post's counters and notifications are gone too; recount
+        user_stats.rebuild([author_id])
+
+    @http_cache.conditional(counted_post_etag)
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
-        # Increment view count
-        Post.objects.filter(id=instance.id).update(views_count=F('views_count') + 1)
         serializer = self.get_serializer(instance)
         return Response(serializer.data)
 
@@ -109,11 +237,12 @@ class PostViewSet(viewsets.ModelViewSet):
         
         if created:
             # Increment like count
-            Post.objects.filter(id=post.id).update(likes_count=F('likes_count') + 1)
+            counters.increment('post', post.id, 'likes_count')
             
             # Create notification
             if post.author != request.user:
-                Notification.objects.create(
+                notifications.notify_later(
+                    f'like:{like.pk}',
                     recipient=post.author,
                     sender=request.user,
                     notification_type='like',
@@ -121,12 +250,18 @@ class PostViewSet(viewsets.ModelViewSet):
                     message=f"{request.user.username} liked your post"
                 )
             
-            return Response({'status': 'liked'}, status=status.HTTP_201_CREATED)
+            return Response(
+                {'status': 'liked', 'likes_count': counters.get_count(post, 'likes_count')},
+                status=status.HTTP_201_CREATED
+            )
         else:
             like.delete()
             # Decrement like count
-            Post.objects.filter(id=post.id).update(likes_count=F('likes_count') - 1)
-            return Response({'status': 'unliked'}, status=status.HTTP_200_OK)
+            counters.increment('post', post.id, 'likes_count', -1)
+            return Response(
+                {'status': 'unliked', 'likes_count': counters.get_count(post, 'likes_count')},
+                status=status.HTTP_200_OK
+            )
 
     @action(detail=True, methods=['post'])
     def share(self, request, pk=None):
@@ -140,11 +275,12 @@ class PostViewSet(viewsets.ModelViewSet):
         )
         
         # Increment share count
-        Post.objects.filter(id=post.id).update(shares_count=F('shares_count') + 1)
+        counters.increment('post', post.id, 'shares_count')
         
         # Create notification
         if post.author != request.user:
-            Notification.objects.create(
+            notifications.notify_later(
+                f'share:{share.pk}',
                 recipient=post.author,
                 sender=request.user,
                 notification_type='share',
@@ -155,9 +291,22 @@ class PostViewSet(viewsets.ModelViewSet):
         serializer = ShareSerializer(share)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Ranked full-text search over titles and content: ?q=..."""
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response({'next': None, 'previous': None, 'results': []})
+
+        posts = post_search.rank_posts(self.filter_queryset(self.get_queryset()), text)
+        paginator = SearchCursorPagination()
+        page = post_search.attach_snippets(paginator.paginate_queryset(posts, request, view=self), text)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
     @action(detail=False, methods=['get'])
     def my_posts(self, request):
-        posts = self.queryset.filter(author=request.user)
+        posts = self.get_queryset().filter(author=request.user)
         page = self.paginate_queryset(posts)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -167,27 +316,97 @@ class PostViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def featured(self, request):
-        posts = self.queryset.filter(is_featured=True)
+        posts = self.get_queryset().filter(is_featured=True)
+        page = self.paginate_queryset(posts)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
         serializer = self.get_serializer(posts, many=True)
         return Response(serializer.data)
 
 
+class TimelineView(generics.ListAPIView):
+    """
+    Home timeline: posts from the authors the user follows, newest first.
+    """
+    serializer_class = PostListSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = TimelineCursorPagination
+
+    def get_queryset(self):
+        return TimelineEntry.objects.filter(
+            user=self.request.user, post__is_published=True
+        ).select_related('post__author__profile', 'post__category').prefetch_related('post__additional_images')
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        posts = [entry.post for entry in page]
+        posts = self.merge_high_fan_out_posts(posts)
+        serializer = self.get_serializer(posts, many=True, context={
+            **self.get_serializer_context(),
+            'viewer': ViewerContext.for_posts(request.user, posts, include_comments=False),
+        })
+        return self.get_paginated_response(serializer.data)
+
+    def merge_high_fan_out_posts(self, posts):
+        """Mix in posts from followed authors that are skipped at write time"""
+        paginator = self.paginator
+        cursor = paginator.cursor
+        position = parse_datetime(cursor.position) if cursor and cursor.position else None
+        newer_than = older_than = None
+        if cursor is not None and cursor.reverse:
+            newer_than = position
+            if paginator.has_previous and posts:
+                older_than = posts[0].created_at
+        else:
+            older_than = position
+            if paginator.has_next and posts:
+                newer_than = posts[-1].created_at
+
+        seen = {post.pk for post in posts}
+        post_ids = [
+            post_id for post_id in timeline.merged_post_ids(self.request.user, newer_than, older_than)
+            if post_id not in seen
+        ]
+        if not post_ids:
+            return posts
+
+        extra = Post.objects.filter(pk__in=post_ids).select_related(
+            'author__profile', 'category'
+        ).prefetch_related('additional_images')
+        return sorted([*posts, *extra], key=lambda post: (post.created_at, post.pk), reverse=True)
+
+
 class CommentViewSet(viewsets.ModelViewSet):
-    queryset = Comment.objects.all()
+    queryset = Comment.objects.select_related('author__profile')
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['post', 'parent']
 
+    def get_serializer(self, *args, **kwargs):
+        # Resolve is_liked and reply trees for the whole page up front
+        if args and 'data' not in kwargs:
+            comments = args[0] if kwargs.get('many') else [args[0]]
+            comments = comment_tree.load_replies(comments)
+            if kwargs.get('many'):
+                args = (comments,) + args[1:]
+            kwargs['context'] = {
+                **self.get_serializer_context(),
+                'viewer': ViewerContext.for_comments(self.request.user, comments),
+            }
+        return super().get_serializer(*args, **kwargs)
+
     def perform_create(self, serializer):
         comment = serializer.save(author=self.request.user)
         
         # Increment comment count on post
-        Post.objects.filter(id=comment.post.id).update(comments_count=F('comments_count') + 1)
+        counters.increment('post', comment.post_id, 'comments_count')
         
         # Create notification
         if comment.post.author != self.request.user:
-            Notification.objects.create(
+            notifications.notify_later(
+                f'comment:{comment.pk}',
                 recipient=comment.post.author,
                 sender=self.request.user,
                 notification_type='comment',
@@ -196,6 +415,20 @@ class CommentViewSet(viewsets.ModelViewSet):
                 message=f"{self.request.user.username} commented on your post"
             )
 
+    @action(detail=True, methods=['get'])
+    def replies(self, request, pk=None):
+        """Next page of replies to a comment, from the cursor in the tree"""
+        comment = self.get_object()
+        before = request.query_params.get('cursor')
+        try:
+            before = int(before) if before else None
+        except ValueError:
+            return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+
+        replies, next_cursor = comment_tree.load_reply_page(comment, before=before)
+        serializer = self.get_serializer(replies, many=True)
+        return Response({'results': serializer.data, 'next_cursor': next_cursor})
+
     @action(detail=True, methods=['post'])
     def like(self, request, pk=None):
         comment = self.get_object()
@@ -206,13 +439,19 @@ class CommentViewSet(viewsets.ModelViewSet):
         
         if created:
             # Increment like count
-            Comment.objects.filter(id=comment.id).update(likes_count=F('likes_count') + 1)
-            return Response({'status': 'liked'}, status=status.HTTP_201_CREATED)
+            counters.increment('comment', comment.id, 'likes_count')
+            return Response(
+                {'status': 'liked', 'likes_count': counters.get_count(comment, 'likes_count')},
+                status=status.HTTP_201_CREATED
+            )
         else:
             like.delete()
             # Decrement like count
-            Comment.objects.filter(id=comment.id).update(likes_count=F('likes_count') - 1)
-            return Response({'status': 'unliked'}, status=status.HTTP_200_OK)
+            counters.increment('comment', comment.id, 'likes_count', -1)
+            return Response(
+                {'status': 'unliked', 'likes_count': counters.get_count(comment, 'likes_count')},
+                status=status.HTTP_200_OK
+            )
 
 
 class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
@@ -220,9 +459,24 @@ class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = CategorySerializer
     permission_classes = [IsAuthenticated]
 
+    # Reads are served from the per-worker catalog cache
+    @http_cache.conditional(category_etag)
+    def list(self, request, *args, **kwargs):
+        return Response(category_catalog.all())
+
+    @http_cache.conditional(category_etag)
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            category = category_catalog.get(int(kwargs['pk']))
+        except ValueError:
+            category = None
+        if category is None:
+            raise Http404
+        return Response(category)
+
 
 class FollowViewSet(viewsets.ModelViewSet):
-    queryset = Follow.objects.all()
+    queryset = Follow.objects.select_related('follower', 'following')
     serializer_class = FollowSerializer
     permission_classes = [IsAuthenticated]
     http_method_names = ['get', 'post', 'delete']
@@ -230,6 +484,18 @@ class FollowViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return self.queryset.filter(follower=self.request.user)
 
+    def get_serializer(self, *args, **kwargs):
+        # Resolve follow state and avatars for the whole list up front
+        if args and 'data' not in kwargs:
+            follows = args[0] if kwargs.get('many') else [args[0]]
+            kwargs['context'] = {
+                **self.get_serializer_context(),
+                'user_states': resolve_user_states(
+                    self.request.user, [follow.following_id for follow in follows]
+                ),
+            }
+        return super().get_serializer(*args, **kwargs)
+
     def perform_create(self, serializer):
         following_user_id = self.request.data.get('following')
         following_user = get_object_or_404(User, id=following_user_id)
@@ -253,9 +519,13 @@ class FollowViewSet(viewsets.ModelViewSet):
             UserProfile.objects.filter(user=following_user).update(
                 followers_count=F('followers_count') + 1
             )
+
+            # Seed the follower's timeline with the author's recent posts
+            timeline.backfill_author(self.request.user, following_user)
             
             # Create notification
-            Notification.objects.create(
+            notifications.notify_later(
+                f'follow:{follow.pk}',
                 recipient=following_user,
                 sender=self.request.user,
                 notification_type='follow',
@@ -281,6 +551,9 @@ class FollowViewSet(viewsets.ModelViewSet):
             UserProfile.objects.filter(user=following_user).update(
                 followers_count=F('followers_count') - 1
             )
+
+            # Take the author's posts out of the follower's timeline
+            timeline.remove_author(request.user, following_user)
             
             return Response({'status': 'unfollowed'}, status=status.HTTP_200_OK)
         except Follow.DoesNotExist:
@@ -293,42 +566,134 @@ class FollowViewSet(viewsets.ModelViewSet):
 class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = NotificationCursorPagination
 
     def get_queryset(self):
-        return Notification.objects.filter(recipient=self.request.user)
+        return Notification.objects.filter(recipient=self.request.user).select_related('sender__profile', 'post')
+
+    def get_serializer(self, *args, **kwargs):
+        if args and self.action in ('list', 'retrieve'):
+            page = args[0] if kwargs.get('many') else [args[0]]
+            kwargs.setdefault('context', self.get_serializer_context())['actors'] = notifications.resolve_actors(page)
+        return super().get_serializer(*args, **kwargs)
+
+    @http_cache.conditional(http_cache.notification_etag)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 
     @action(detail=True, methods=['post'])
     def mark_read(self, request, pk=None):
         notification = self.get_object()
-        notification.is_read = True
-        notification.save()
+        notifications.mark_read(request.user, self.get_queryset().filter(pk=notification.pk))
         return Response({'status': 'marked as read'})
 
+    @action(detail=False, methods=['get'])
+    def unread_count(self, request):
+        unread = UserStats.objects.filter(pk=request.user.pk).values_list('unread_notifications', flat=True)
+        return Response({'count': unread.first() or 0})
+
     @action(detail=False, methods=['post'])
     def mark_all_read(self, request):
-        self.get_queryset().update(is_read=True)
+        notifications.mark_read(request.user, self.get_queryset())
         return Response({'status': 'all notifications marked as read'})
 
 
+class UploadViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    Resumable chunked uploads: POST {filename, size} to start, PUT byte
+    ranges with Content-Range, GET to find where to resume, then POST
+    finish/ and pass the id as e.g. image_upload or avatar_upload.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user, expires_at__gte=timezone.now())
+
+    def perform_create(self, serializer):
+        data = serializer.validated_data
+        serializer.instance = chunked_uploads.start(self.request.user, data['filename'], data['size'])
+
+    def update(self, request, *args, **kwargs):
+        session = self.get_object()
+        content_range = chunked_uploads.parse_content_range(request.headers.get('Content-Range'))
+        if content_range is None:
+            return Response(
+                {'error': 'A Content-Range: bytes <start>-<end>/<size> header is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        first, end, total = content_range
+        # DRF has no stream without a Content-Length (empty or chunked bodies)
+        if request.stream is None or request.META.get('CONTENT_LENGTH') != str(end - first):
+            return Response(
+                {'error': 'Content-Length must match the Content-Range'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            # Read from the raw stream so the chunk is never parsed or held in memory
+            offset = chunked_uploads.append(session, *content_range, request.stream)
+        except chunked_uploads.OffsetMismatch as exc:
+            return Response({'error': str(exc), 'offset': exc.offset}, status=status.HTTP_409_CONFLICT)
+        return Response({'offset': offset})
+
+    @action(detail=True, methods=['post'])
+    def finish(self, request, pk=None):
+        try:
+            session = chunked_uploads.finish(self.get_object())
+        except chunked_uploads.OffsetMismatch as exc:
+            return Response({'error': 'The upload is not complete', 'offset': exc.offset}, status=status.HTTP_409_CONFLICT)
+        return Response(self.get_serializer(session).data)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def dashboard_stats(request):
     """Get dashboard statistics for the current user"""
-    user = request.user
-    profile = getattr(user, 'profile', None)
+    totals = user_stats.get_stats(request.user)
+    profile = getattr(totals.user, 'profile', None)
     
     stats = {
-        'posts_count': user.posts.count(),
-        'likes_received': sum(post.likes_count for post in user.posts.all()),
-        'comments_received': sum(post.comments_count for post in user.posts.all()),
+        'posts_count': totals.posts_count,
+        'likes_received': totals.likes_received,
+        'comments_received': totals.comments_received,
+        'views_received': totals.views_received,
         'followers_count': profile.followers_count if profile else 0,
         'following_count': profile.following_count if profile else 0,
-        'unread_notifications': user.notifications.filter(is_read=False).count(),
+        'unread_notifications': totals.unread_notifications,
     }
     
     return Response(stats)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def dashboard_timeseries(request):
+    """Daily views/likes/comments/shares across the user's posts: ?start=&end=&post="""
+    dates = {}
+    for name in ('start', 'end'):
+        value = request.GET.get(name, '')
+        try:
+            # None if malformed; ValueError if well formed but impossible, e.g. 2026-02-30
+            dates[name] = parse_date(value)
+        except ValueError:
+            dates[name] = None
+        if value and dates[name] is None:
+            return Response({name: ['Enter a valid date.']}, status=status.HTTP_400_BAD_REQUEST)
+    end = dates['end'] or timezone.localdate()
+    start = dates['start'] or end - timedelta(days=29)
+    if start > end:
+        return Response({'error': 'start must not be after end'}, status=status.HTTP_400_BAD_REQUEST)
+    if (end - start).days >= 366:
+        return Response({'error': 'Date range cannot exceed 366 days'}, status=status.HTTP_400_BAD_REQUEST)
+
+    post_id = request.GET.get('post')
+    if post_id is not None and not post_id.isdigit():
+        return Response({'error': 'Invalid post id'}, status=status.HTTP_400_BAD_REQUEST)
+
+    series = analytics.author_series(request.user, start, end, post_id=int(post_id) if post_id else None)
+    return Response({'start': start, 'end': end, **series})
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def search_users(request):
@@ -337,29 +702,49 @@ def search_users(request):
     if len(query) < 2:
         return Response({'results': []})
     
-    users = User.objects.filter(
+    users = list(User.objects.filter(
         Q(username__icontains=query) |
         Q(first_name__icontains=query) |
         Q(last_name__icontains=query)
-    ).exclude(id=request.user.id)[:10]
+    ).exclude(id=request.user.id)[:10])
+    states = resolve_user_states(request.user, [user.id for user in users])
     
     results = []
     for user in users:
-        profile = getattr(user, 'profile', None)
         results.append({
             'id': user.id,
             'username': user.username,
             'full_name': f"{user.first_name} {user.last_name}".strip(),
-            'avatar': profile.avatar.url if profile and profile.avatar else None,
-            'is_following': Follow.objects.filter(
-                follower=request.user, 
-                following=user
-            ).exists()
+            **states[user.id],
         })
     
     return Response({'results': results})
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def user_autocomplete(request):
+    """Typeahead: users whose username or name starts with ?q="""
+    query = request.GET.get('q', '')
+    user_ids = user_index.search(query, limit=10, exclude={request.user.id})
+    if not user_ids:
+        return Response({'results': []})
+
+    users = User.objects.filter(id__in=user_ids).only('id', 'username', 'first_name', 'last_name')
+    users_by_id = {user.id: user for user in users}
+    states = resolve_user_states(request.user, users_by_id)
+    results = [
+        {
+            'id': user.id,
+            'username': user.username,
+            'full_name': f"{user.first_name} {user.last_name}".strip() or user.username,
+            **states[user.id],
+        }
+        for user in (users_by_id.get(user_id) for user_id in user_ids) if user is not None
+    ]
+    return Response({'results': results})
+
+
 class UserSearchView(generics.ListAPIView):
     """
     API endpoint for searching users by username, first name, or last name
@@ -372,15 +757,12 @@ class UserSearchView(generics.ListAPIView):
         if not query:
             return UserProfile.objects.none()
         
-        # Search users by username, first name, or last name
-        users = User.objects.filter(
-            Q(username__icontains=query) |
-            Q(first_name__icontains=query) |
-            Q(last_name__icontains=query)
-        ).exclude(id=self.request.user.id)  # Exclude current user
-        
-        # Get profiles for these users
-        return UserProfile.objects.filter(user__in=users)
+        # Search users by username, first name, or last name (trigram indexed)
+        return UserProfile.objects.filter(
+            Q(user__username__icontains=query) |
+            Q(user__first_name__icontains=query) |
+            Q(user__last_name__icontains=query)
+        ).exclude(user=self.request.user).select_related('user')  # Exclude current user
     
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
@@ -390,7 +772,8 @@ class UserSearchView(generics.ListAPIView):
             return Response({'results': [], 'message': 'Please provide a search query'})
         
         # Limit results to 10 for performance
-        queryset = queryset[:10]
+        queryset = list(queryset[:10])
+        states = resolve_user_states(request.user, [profile.user_id for profile in queryset])
         
         results = []
         for profile in queryset:
@@ -401,15 +784,49 @@ class UserSearchView(generics.ListAPIView):
                 'first_name': user.first_name,
                 'last_name': user.last_name,
                 'full_name': f"{user.first_name} {user.last_name}".strip() or user.username,
-                'avatar': profile.avatar.url if profile.avatar else None,
                 'bio': profile.bio,
                 'location': profile.location,
                 'is_active': user.is_active,
-                'date_joined': user.date_joined
+                'date_joined': user.date_joined,
+                **states[user.id],
             })
         
         return Response({
             'results': results,
             'count': len(results),
             'query': query
-        })
\ No newline at end of file
+        })
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def notification_stream_ticket(request):
+    """A short-lived ticket for opening the notification stream: ?ticket="""
+    return Response({
+        'ticket': live_notifications.issue_ticket(request.user),
+        'expires_in': settings.NOTIFICATION_STREAM_TICKET_TTL,
+    })
+
+
+@require_GET
+async def notification_stream(request):
+    """
+    Server-Sent Events feed of the user's new and updated notifications.
+    Reconnecting clients resume after the Last-Event-ID they send.
+    """
+    user = await sync_to_async(live_notifications.authenticate)(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    if live_notifications.get_hub().client_count >= settings.NOTIFICATION_STREAM_MAX_CLIENTS:
+        response = JsonResponse({'detail': 'Too many open streams, try again shortly.'}, status=503)
+        response['Retry-After'] = '30'
+        return response
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    response = StreamingHttpResponse(
+        live_notifications.stream(user, last_event_id), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response